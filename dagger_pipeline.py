@@ -1,8 +1,13 @@
+import asyncio
 import subprocess
 import time
 import dagger
+import hashlib
+import json
 import os
+import shutil
 import sys
+from pathlib import Path
 
 # Define constants
 PYTHON_VERSION = "3.11-slim"
@@ -10,8 +15,246 @@ MLFLOW_PORT = 5000
 # When binding a service in Dagger, the service name becomes the hostname
 MLFLOW_TRACKING_URI = f"http://mlflow_server:{MLFLOW_PORT}"
 DOCKERHUB_REPO = "house-price-predictor-service"
+# How long the smoke test polls /health before failing the pipeline
+HEALTH_CHECK_TIMEOUT_S = 60
+
+# Content-addressed stage cache on the host. Set DAGGER_STAGE_CACHE=0 to always re-run.
+CACHE_DIR = ".dagger-cache"
+STAGE_CACHE_ENABLED = os.environ.get("DAGGER_STAGE_CACHE", "1") != "0"
+# Inputs that fully determine each stage's outputs (code, data, config, pinned dependencies)
+# Feature engineering also imports the hold-out split and the serving price index lookup
+DATA_PROCESSING_INPUTS = [
+    "src/data",
+    "src/features",
+    "src/models/holdout.py",
+    "src/api/price_index.py",
+    "data/raw/house_data.csv",
+    "configs/data_schema.yaml",
+    "requirements.txt",
+]
+# Training also imports the serving bundle format and, to build the prediction cube, its
+# grid from src/api; list every src/api module the stage imports, or edits there go unnoticed
+MODEL_TRAINING_INPUTS = [
+    "src/models",
+    "src/api/bundle.py",
+    "src/api/price_index.py",
+    "src/api/prediction_cube.py",
+    "configs",
+    "requirements.txt",
+]
+
+# Per-step timing reports written by the data processing scripts, and the host-side
+# history each fresh run is appended to and compared against
+TIMING_REPORT_DIR = "reports/timing"
+TIMING_STAGES = ["data_processing", "feature_engineering"]
+TIMING_HISTORY_FILE = os.path.join(TIMING_REPORT_DIR, "pipeline_history.jsonl")
+# Flag a step whose rows/sec dropped by more than this fraction since the previous run
+TIMING_REGRESSION_THRESHOLD = float(os.environ.get("PIPELINE_TIMING_REGRESSION_PCT", "25")) / 100
+
+def hash_inputs(paths, upstream_key=""):
+    """
+    Hash the contents and relative paths of `paths` (directories recursively),
+    chained to the key of the stage that produced this stage's inputs.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"python:{PYTHON_VERSION}|upstream:{upstream_key}".encode())
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            files = sorted(f for f in path.rglob("*") if f.is_file() and "__pycache__" not in f.parts)
+        else:
+            files = [path]
+        for f in files:
+            digest.update(f.as_posix().encode() + b"\0")
+            digest.update(hashlib.sha256(f.read_bytes()).digest())
+    return digest.hexdigest()
+
+class StageCache:
+    """
+    Stores stage artifacts under CACHE_DIR/<stage>/<key>/ with a manifest
+    recording how long the stage took, so hits can report the time they saved.
+    """
 
+    def __init__(self, root=CACHE_DIR, enabled=True):
+        self.root = Path(root)
+        self.enabled = enabled
+        self.results = []
+
+    def entry(self, stage, key):
+        return self.root / stage / key
+
+    def lookup(self, stage, key):
+        """Return the entry directory on a hit, None on a miss."""
+        entry = self.entry(stage, key)
+        manifest = entry / "manifest.json"
+        if not manifest.exists():
+            return None
+        saved = json.loads(manifest.read_text())["duration_s"]
+        self.results.append({"stage": stage, "key": key[:12], "hit": True, "duration_s": 0.0, "saved_s": saved})
+        print(f"[cache] {stage}: hit {key[:12]}, reusing stored artifacts (saves ~{saved:.1f}s)")
+        return entry
+
+    def staging_dir(self, stage, key):
+        staging = self.root / stage / f".{key}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        return staging
+
+    def commit(self, stage, key, staging, duration_s):
+        """Write the manifest and atomically publish the exported artifacts."""
+        self.results.append({"stage": stage, "key": key[:12], "hit": False, "duration_s": duration_s, "saved_s": 0.0})
+        print(f"[cache] {stage}: miss {key[:12]}, ran in {duration_s:.1f}s")
+        (staging / "manifest.json").write_text(json.dumps({
+            "stage": stage,
+            "key": key,
+            "duration_s": duration_s,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }, indent=2))
+        entry = self.entry(stage, key)
+        shutil.rmtree(entry, ignore_errors=True)
+        staging.rename(entry)
+
+    def summary(self):
+        lines = [f"{'stage':<20}{'key':<14}{'result':<8}{'ran (s)':>10}{'saved (s)':>12}"]
+        for r in self.results:
+            lines.append(
+                f"{r['stage']:<20}{r['key']:<14}{'hit' if r['hit'] else 'miss':<8}"
+                f"{r['duration_s']:>10.1f}{r['saved_s']:>12.1f}"
+            )
+        total_saved = sum(r["saved_s"] for r in self.results)
+        lines.append(f"Total time saved by stage cache: {total_saved:.1f}s")
+        return "\n".join(lines)
+
+class StageGraph:
+    """
+    Runs pipeline stages as a dependency graph: each stage starts as soon as all
+    of its dependencies have finished, so independent stages run concurrently.
+    A stage is an async callable receiving its dependencies' results in order.
+    """
 
+    def __init__(self):
+        self.stages = {}
+        self.timings = {}
+
+    def add(self, name, fn, deps=()):
+        unknown = [d for d in deps if d not in self.stages]
+        if unknown:
+            raise ValueError(f"Stage {name} depends on unknown stages: {unknown}")
+        self.stages[name] = (fn, tuple(deps))
+
+    async def run(self):
+        """Run every stage and return {stage name: result}. Cancels the rest if one fails."""
+        t0 = time.perf_counter()
+        tasks = {}
+
+        async def run_stage(name):
+            fn, deps = self.stages[name]
+            results = await asyncio.gather(*(tasks[d] for d in deps))
+            start = time.perf_counter()
+            print(f"\n--- Stage started: {name} ---")
+            result = await fn(*results)
+            end = time.perf_counter()
+            self.timings[name] = (start - t0, end - t0)
+            print(f"--- Stage finished: {name} ({end - start:.1f}s) ---")
+            return result
+
+        # Stages can only depend on stages added before them, so this order is topological
+        for name in self.stages:
+            tasks[name] = asyncio.create_task(run_stage(name), name=name)
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
+
+    def critical_path(self):
+        """Walk back from the last stage to finish through the dependency that finished last."""
+        path = []
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        while name is not None:
+            path.append(name)
+            deps = self.stages[name][1]
+            name = max(deps, key=lambda d: self.timings[d][1]) if deps else None
+        return list(reversed(path))
+
+    def summary(self):
+        critical = self.critical_path()
+        lines = [f"{'stage':<22}{'start (s)':>10}{'end (s)':>10}{'duration (s)':>14}  critical"]
+        for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1][0]):
+            lines.append(f"{name:<22}{start:>10.1f}{end:>10.1f}{end - start:>14.1f}  {'*' if name in critical else ''}")
+        wall = max(end for _, end in self.timings.values())
+        serial = sum(end - start for start, end in self.timings.values())
+        lines.append(f"Critical path: {' -> '.join(critical)}")
+        lines.append(f"Wall time: {wall:.1f}s (sum of stage durations: {serial:.1f}s)")
+        return "\n".join(lines)
+
+def load_previous_timing(path=TIMING_HISTORY_FILE):
+    """The last run recorded in the timing history, or None."""
+    if not os.path.exists(path):
+        return None
+    last = None
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                last = line
+    return json.loads(last) if last else None
+
+def compare_timing(current, previous, threshold=TIMING_REGRESSION_THRESHOLD):
+    """
+    One row per step with this run's rows, time, rows/sec and peak memory next
+    to the previous run's, flagging throughput drops beyond `threshold`.
+    """
+    previous_steps = {}
+    for report in (previous or {}).get("stages", []):
+        if report.get("version") == current["stages"][0].get("version"):
+            for step in report["steps"]:
+                previous_steps[(report["stage"], step["step"])] = step
+    rows = []
+    for report in current["stages"]:
+        for step in report["steps"]:
+            prev = previous_steps.get((report["stage"], step["step"]))
+            change = None
+            if prev and prev.get("rows_per_s") and step.get("rows_per_s") is not None:
+                change = step["rows_per_s"] / prev["rows_per_s"] - 1
+            rows.append({
+                "stage": report["stage"],
+                "step": step["step"],
+                "rows": step["rows_in"] if step["rows_in"] is not None else step["rows_out"],
+                "wall_time_s": step["wall_time_s"],
+                "rows_per_s": step["rows_per_s"],
+                "peak_rss_mb": step["peak_rss_mb"],
+                "prev_rows": (prev["rows_in"] if prev["rows_in"] is not None else prev["rows_out"]) if prev else None,
+                "prev_rows_per_s": prev["rows_per_s"] if prev else None,
+                "change": change,
+                "regression": change is not None and change < -threshold,
+            })
+    return rows
+
+def timing_summary(rows):
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-"
+
+    lines = [
+        f"{'step':<48}{'rows':>10}{'time (s)':>10}{'rows/s':>12}{'peak MB':>9}"
+        f"{'prev rows':>11}{'prev rows/s':>13}{'change':>9}"
+    ]
+    for r in rows:
+        lines.append(
+            f"{r['stage'] + '.' + r['step']:<48}{fmt(r['rows'], 'd'):>10}{r['wall_time_s']:>10.2f}"
+            f"{fmt(r['rows_per_s'], ',.0f'):>12}{r['peak_rss_mb']:>9.0f}{fmt(r['prev_rows'], 'd'):>11}"
+            f"{fmt(r['prev_rows_per_s'], ',.0f'):>13}{fmt(r['change'], '+.0%'):>9}"
+            f"{'  SLOWER' if r['regression'] else ''}"
+        )
+    regressions = [r for r in rows if r["regression"]]
+    if regressions:
+        lines.append(
+            f"{len(regressions)} step(s) lost more than {TIMING_REGRESSION_THRESHOLD:.0%} throughput "
+            f"since the previous run: {', '.join(r['step'] for r in regressions)}"
+        )
+    return "\n".join(lines)
 
 async def main():
     """
@@ -20,111 +263,260 @@ async def main():
     async with dagger.Connection(dagger.Config(log_output=sys.stderr)) as client:
         # Get the current project directory as a Dagger Directory object
         # This mounts your local project into the Dagger engine
-        src = client.host().directory(".")
-
-        # --- Stage 1: Data Processing ---
-        print("\n--- Stage 1: Data Processing (Cleaning & Feature Engineering) ---")
-        data_processing_output = await data_processing_stage(client, src)
-        processed_data_file = data_processing_output["processed_data"]
-        preprocessor_file = data_processing_output["preprocessor"]
-        print("Data Processing completed. Artifacts ready.")
-
-        # --- Stage 2: Model Training ---
-        print("\n--- Stage 2: Model Training ---")
-        trained_model_dir = await model_training_stage(client, src, processed_data_file, preprocessor_file)
-        print("Model Training completed. Trained model ready.")
-
-        # --- Stage 3: Build and Publish Docker Image ---
-        print("\n--- Stage 3: Build and Publish Docker Image ---")
-        published_image_ref = await build_and_publish_stage(client, src, trained_model_dir)
-        print(f"Docker Image published: {published_image_ref}")
-
-        # --- Stage 4: Image Vulnerability Scan ---
-        print("\n--- Stage 4: Image Vulnerability Scan ---")
-        await image_vulnerability_scan_stage(client, published_image_ref)
-        print("Image Vulnerability Scan completed.")
+        src = client.host().directory(".", exclude=[CACHE_DIR, TIMING_REPORT_DIR])
+        cache = StageCache(enabled=STAGE_CACHE_ENABLED)
+
+        # Fail before any stage runs rather than after training
+        dockerhub_username, dockerhub_token = get_dockerhub_credentials()
+
+        data_key = hash_inputs(DATA_PROCESSING_INPUTS)
+        training_key = hash_inputs(MODEL_TRAINING_INPUTS, upstream_key=data_key)
+
+        #   git_sha ---------------------------------------------------+
+        #   data_processing -+-> model_training -> build_image -+-> smoke_test -+-> publish
+        #                    +-> model_benchmark                +-> vulnerability_scan
+        #                    +-> data_timing
+        graph = StageGraph()
+        graph.add("git_sha", get_full_sha)
+        graph.add(
+            "data_processing",
+            lambda: cached_data_processing_stage(client, src, cache, data_key),
+        )
+        graph.add(
+            "model_training",
+            lambda data: cached_model_training_stage(
+                client, src, cache, training_key,
+                data["processed_data"], data["preprocessor"], data["drift_reference"], data["price_index"]
+            ),
+            deps=["data_processing"],
+        )
+        graph.add(
+            "data_timing",
+            lambda data: data_timing_stage(data["timing_reports"], data["cached"]),
+            deps=["data_processing"],
+        )
+        graph.add(
+            "model_benchmark",
+            lambda data: model_benchmark_stage(client, src, data["processed_data"]),
+            deps=["data_processing"],
+        )
+        graph.add(
+            "build_image",
+            lambda trained_model_dir: build_image_stage(client, src, trained_model_dir),
+            deps=["model_training"],
+        )
+        graph.add(
+            "smoke_test",
+            lambda image: smoke_test_stage(client, image),
+            deps=["build_image"],
+        )
+        graph.add(
+            "vulnerability_scan",
+            lambda image: image_vulnerability_scan_stage(client, image),
+            deps=["build_image"],
+        )
+        graph.add(
+            "publish",
+            lambda image, _, full_sha: publish_stage(client, image, full_sha, dockerhub_username, dockerhub_token),
+            deps=["build_image", "smoke_test", "git_sha"],
+        )
+
+        results = await graph.run()
+        print(f"\nDocker Image published: {results['publish']}")
+
+        if cache.enabled:
+            print("\n--- Stage Cache Summary ---")
+            print(cache.summary())
+
+        print("\n--- Pipeline Timing ---")
+        print(graph.summary())
 
         print("\n--- MLOps Pipeline Completed Successfully ---")
 
-async def data_processing_stage(client: dagger.Client, src: dagger.Directory) -> dict[str, dagger.File]:
+def python_base_container(client: dagger.Client, src: dagger.Directory) -> dagger.Container:
     """
-    Performs data cleaning and feature engineering.
-    Returns a dictionary containing the processed data file and preprocessor file.
+    Base Python container with the project mounted and dependencies installed.
+    Identical pipelines are deduplicated by Dagger, so concurrent stages share it.
     """
-    # Base Python container with project mounted and dependencies installed
-    python_base = (
+    return (
         client.container()
         .from_(f"python:{PYTHON_VERSION}")
+        # mount your code under its real project name so any root‑checks pass
         .with_mounted_directory("/house-price-predictor", src)
-        # .with_mounted_cache("/root/.cache/pip", client.cache_volume("pip_cache"))
+        # cache pip downloads between runs
+        .with_mounted_cache("/root/.cache/pip", client.cache_volume("pip_cache"))
         .with_workdir("/house-price-predictor")
+        # always drive pip via Python to guarantee the right interpreter
         .with_exec(["python", "-m", "pip", "install", "--upgrade", "pip"])
         .with_exec(["python", "-m", "pip", "install", "-r", "requirements.txt"])
     )
-    
+
+async def cached_data_processing_stage(
+    client: dagger.Client,
+    src: dagger.Directory,
+    cache: StageCache,
+    key: str
+) -> dict[str, dagger.File]:
+    """
+    Runs data_processing_stage unless its inputs are unchanged since a cached run,
+    in which case the stored sparse feature matrix, preprocessor, drift reference, price
+    index and timing reports are reused.
+    """
+    if not cache.enabled:
+        return await data_processing_stage(client, src)
+    entry = cache.lookup("data_processing", key)
+    cached = entry is not None
+    if entry is None:
+        start = time.perf_counter()
+        output = await data_processing_stage(client, src)
+        staging = cache.staging_dir("data_processing", key)
+        # Exporting forces the stage to run, so the timing covers the real work
+        await output["processed_data"].export(str(staging / "featured_house_data.npz"))
+        await output["preprocessor"].export(str(staging / "preprocessor.pkl"))
+        await output["drift_reference"].export(str(staging / "drift_reference.json"))
+        await output["price_index"].export(str(staging / "price_index.json"))
+        await output["timing_reports"].export(str(staging / "timing"))
+        cache.commit("data_processing", key, staging, time.perf_counter() - start)
+        entry = cache.entry("data_processing", key)
+    return {
+        "processed_data": client.host().file(str(entry / "featured_house_data.npz")),
+        "preprocessor": client.host().file(str(entry / "preprocessor.pkl")),
+        "drift_reference": client.host().file(str(entry / "drift_reference.json")),
+        "price_index": client.host().file(str(entry / "price_index.json")),
+        "timing_reports": client.host().directory(str(entry / "timing")),
+        # A hit's timing reports describe the run that filled the cache, not this one
+        "cached": cached,
+    }
+
+async def cached_model_training_stage(
+    client: dagger.Client,
+    src: dagger.Directory,
+    cache: StageCache,
+    key: str,
+    processed_data_file: dagger.File,
+    preprocessor_file: dagger.File,
+    drift_reference_file: dagger.File,
+    price_index_file: dagger.File
+) -> dagger.Directory:
+    """
+    Runs model_training_stage unless its inputs (including the upstream data
+    processing key) are unchanged since a cached run.
+    """
+    if not cache.enabled:
+        return await model_training_stage(
+            client, src, processed_data_file, preprocessor_file, drift_reference_file, price_index_file
+        )
+    entry = cache.lookup("model_training", key)
+    if entry is None:
+        start = time.perf_counter()
+        trained_model_dir = await model_training_stage(
+            client, src, processed_data_file, preprocessor_file, drift_reference_file, price_index_file
+        )
+        staging = cache.staging_dir("model_training", key)
+        await trained_model_dir.export(str(staging / "trained"))
+        cache.commit("model_training", key, staging, time.perf_counter() - start)
+        entry = cache.entry("model_training", key)
+    return client.host().directory(str(entry / "trained"))
+
+async def data_processing_stage(client: dagger.Client, src: dagger.Directory) -> dict[str, dagger.File]:
+    """
+    Performs data cleaning and feature engineering.
+    Returns a dictionary containing the processed data file, preprocessor file,
+    the drift reference statistics and price index written next to the preprocessor,
+    and the directory of per-step timing reports.
+    """
+    python_base = python_base_container(client, src)
+
     # Run Data Cleaning script
     data_cleaning_container = python_base.with_exec([
         "python", "src/data/run_processing.py",
         "--output-file", "data/processed/cleaned_house_data.csv",
-        "--input-file", "data/raw/house_data.csv"
+        "--input-file", "data/raw/house_data.csv",
+        "--timing-report", f"{TIMING_REPORT_DIR}/data_processing.json"
     ])
 
     # Run Feature Engineering script
     feature_engineering_container = data_cleaning_container.with_exec([
         "python", "src/features/engineer.py",
         "--input", "data/processed/cleaned_house_data.csv",
-        "--output", "data/processed/featured_house_data.csv",
-        "--preprocessor", "models/preprocessor.pkl"
+        "--output", "data/processed/featured_house_data.npz",
+        "--preprocessor", "models/preprocessor.pkl",
+        "--timing-report", f"{TIMING_REPORT_DIR}/feature_engineering.json"
     ])
+    # Execute now so the stage's timing reflects its own work rather than
+    # being deferred into whichever downstream stage first reads the files
+    feature_engineering_container = await feature_engineering_container.sync()
 
     # Get the output files as Dagger File objects
-    processed_data_file = feature_engineering_container.file("data/processed/featured_house_data.csv")
+    processed_data_file = feature_engineering_container.file("data/processed/featured_house_data.npz")
     preprocessor_file = feature_engineering_container.file("models/preprocessor.pkl")
+    drift_reference_file = feature_engineering_container.file("models/drift_reference.json")
+    price_index_file = feature_engineering_container.file("models/price_index.json")
+    timing_reports_dir = feature_engineering_container.directory(TIMING_REPORT_DIR)
 
     # Optional: Export to host for local inspection (uncomment if needed)
-    # await processed_data_file.export("dagger_output/featured_house_data.csv")
+    # await processed_data_file.export("dagger_output/featured_house_data.npz")
     # await preprocessor_file.export("dagger_output/preprocessor.pkl")
 
-    return {"processed_data": processed_data_file, "preprocessor": preprocessor_file}
+    return {
+        "processed_data": processed_data_file,
+        "preprocessor": preprocessor_file,
+        "drift_reference": drift_reference_file,
+        "price_index": price_index_file,
+        "timing_reports": timing_reports_dir,
+        "cached": False,
+    }
+
+async def data_timing_stage(timing_reports_dir: dagger.Directory, cached: bool) -> dict:
+    """
+    Collects the data processing timing reports into one run record, compares
+    each step's rows/sec with the previous run and appends the run to the
+    history. Reports reused from the stage cache are shown but not recorded.
+    """
+    run = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "stages": [
+            json.loads(await timing_reports_dir.file(f"{stage}.json").contents())
+            for stage in TIMING_STAGES
+        ],
+    }
+    print("\n--- Data Pipeline Timing ---")
+    if cached:
+        print("Data processing was a cache hit; these timings are from the run that filled the cache")
+        print(timing_summary(compare_timing(run, None)))
+        return run
+
+    rows = compare_timing(run, load_previous_timing())
+    print(timing_summary(rows))
+    run["comparison"] = rows
+    os.makedirs(os.path.dirname(TIMING_HISTORY_FILE), exist_ok=True)
+    with open(TIMING_HISTORY_FILE, "a") as f:
+        f.write(json.dumps(run) + "\n")
+    print(f"Appended timing report to {TIMING_HISTORY_FILE}")
+    return run
 
 async def model_training_stage(
     client: dagger.Client,
     src: dagger.Directory,
     processed_data_file: dagger.File,
-    preprocessor_file: dagger.File
+    preprocessor_file: dagger.File,
+    drift_reference_file: dagger.File,
+    price_index_file: dagger.File
 ) -> dagger.Directory:
     """
-    Trains the machine learning model, using MLflow for tracking.
-    Returns the directory containing the trained model.
+    Trains the machine learning model, using MLflow for tracking, and builds
+    its prediction cube. Returns the directory containing the trained model.
     """
-    # Base Python container with project mounted and dependencies installed
-    # python_base = (
-    #     client.container()
-    #     .from_(f"python:{PYTHON_VERSION}")
-    #     .with_mounted_directory("/app", src)
-    #     .with_workdir("/app")
-    #     .with_exec(["python", "-m", "pip", "install", "--upgrade", "pip"])
-    #     .with_exec(["pip", "install", "-r", "requirements.txt"])
-    # )
+    python_base = python_base_container(client, src)
 
-    python_base = (
-        client.container()
-          .from_(f"python:{PYTHON_VERSION}")
-          # mount your code under its real project name so any root‑checks pass
-          .with_mounted_directory("/house-price-predictor", src)
-          .with_workdir("/house-price-predictor")
-          # cache pip downloads between runs
-        #   .with_mounted_cache("/root/.cache/pip", client.cache_volume("pip_cache"))
-          # always drive pip via Python to guarantee the right interpreter
-          .with_exec(["python", "-m", "pip", "install", "--upgrade", "pip"])
-          .with_exec(["python", "-m", "pip", "install", "-r", "requirements.txt"])
-    )
-
-    # Mount processed data and preprocessor from previous stage into the container
+    # Mount processed data, preprocessor, drift reference and price index from previous stage
+    # into the container; train_model.py ships the latter two in models/trained with the model
     training_container = (
         python_base
-        .with_file("data/processed/featured_house_data.csv", processed_data_file)
+        .with_file("data/processed/featured_house_data.npz", processed_data_file)
         .with_file("models/preprocessor.pkl", preprocessor_file)
+        .with_file("models/drift_reference.json", drift_reference_file)
+        .with_file("models/price_index.json", price_index_file)
     )
 
     # Define MLflow service container
@@ -152,13 +544,21 @@ async def model_training_stage(
         .with_exec([
             "python", "src/models/train_model.py",
             "--config", "configs/model_config.yaml",
-            "--data", "data/processed/featured_house_data.csv",
+            "--data", "data/processed/featured_house_data.npz",
             "--models-dir", "models",
+            "--preprocessor", "models/preprocessor.pkl",
             "--mlflow-tracking-uri", MLFLOW_TRACKING_URI # Pass to script as well
         ])
+        # Score the UI's input grid once here, so the image ships a cube matching its model
+        .with_exec([
+            "python", "src/models/build_prediction_cube.py",
+            "--bundle", "models/trained/house_price_model.npz",
+            "--output", "models/trained/prediction_cube.npy"
+        ])
     )
 
     # Get the directory containing the trained model
+    training_result = await training_result.sync()
     trained_model_dir = training_result.directory("models/trained")
 
     # Optional: Export to host for local inspection (uncomment if needed)
@@ -166,21 +566,32 @@ async def model_training_stage(
 
     return trained_model_dir
 
-async def build_and_publish_stage(
+async def model_benchmark_stage(
     client: dagger.Client,
     src: dagger.Directory,
-    trained_model_dir: dagger.Directory
-) -> str: # Returns the published image reference string
+    processed_data_file: dagger.File
+) -> dagger.File:
     """
-    Builds the Docker image for the prediction service, runs a health check,
-    and publishes it to Docker Hub.
+    Benchmarks every candidate model on accuracy and latency, concurrently with
+    final training. Returns the JSON benchmark report.
     """
-    # Get necessary files/directories from the source context for Docker build
-    dockerfile = src.file("Dockerfile")
-    src_api_dir = src.directory("src/api")
-    configs_dir = src.directory("configs")
-    data_raw_dir = src.directory("data/raw") # Assuming Dockerfile copies raw data
+    benchmark_result = await (
+        python_base_container(client, src)
+        .with_file("data/processed/featured_house_data.npz", processed_data_file)
+        .with_exec([
+            "python", "src/models/benchmark_models.py",
+            "--config", "configs/model_config.yaml",
+            "--data", "data/processed/featured_house_data.npz",
+            "--output", "models/benchmark/model_benchmark.json"
+        ])
+        .sync()
+    )
+    report_file = benchmark_result.file("models/benchmark/model_benchmark.json")
+    report = json.loads(await report_file.contents())
+    print(f"Benchmark selected model within {report['latency_budget_ms']} ms budget: {report['selected_model']}")
+    return report_file
 
+def get_dockerhub_credentials() -> tuple[str, str]:
     # Get Docker Hub credentials from host environment variables
     # These will be passed as Dagger Secrets for security
     dockerhub_username = os.environ.get("DOCKERHUB_USERNAME")
@@ -188,21 +599,21 @@ async def build_and_publish_stage(
 
     if not dockerhub_username or not dockerhub_token:
         raise ValueError("DOCKERHUB_USERNAME and DOCKERHUB_TOKEN environment variables must be set.")
+    return dockerhub_username, dockerhub_token
 
-    # Create Dagger Secret objects for credentials
-    dockerhub_username_secret = client.set_secret("DOCKERHUB_USERNAME", dockerhub_username)
-    dockerhub_token_secret = client.set_secret("DOCKERHUB_TOKEN", dockerhub_token)
-
-    # Get short GIT SHA for tagging
-    # RuntimeError: git failed: fatal: detected dubious ownership in repository at '/app'
-    # To add an exception for this directory, call:
-    # 	git config --global --add safe.directory /app
-
-    full_sha = await get_full_sha()
-    git_sha_short = full_sha[:7]
-
-    image_sha_tag = f"{dockerhub_username}/{DOCKERHUB_REPO}:{git_sha_short}"
-    image_latest_tag = f"{dockerhub_username}/{DOCKERHUB_REPO}:latest"
+async def build_image_stage(
+    client: dagger.Client,
+    src: dagger.Directory,
+    trained_model_dir: dagger.Directory
+) -> dagger.Container:
+    """
+    Builds the Docker image for the prediction service.
+    """
+    # Get necessary files/directories from the source context for Docker build
+    dockerfile = src.file("Dockerfile")
+    src_api_dir = src.directory("src/api")
+    configs_dir = src.directory("configs")
+    data_raw_dir = src.directory("data/raw") # Assuming Dockerfile copies raw data
 
     # Prepare the build context for the Dockerfile
     # This includes all directories/files that the Dockerfile might COPY from the context
@@ -215,8 +626,8 @@ async def build_and_publish_stage(
         .with_file("requirements.txt", src.file("requirements.txt")) 
 
     # Build the Docker image
-    print(f"Building Docker image: {image_sha_tag}")
-    built_image = await client.container().build(
+    print("Building Docker image...")
+    built_image = client.container().build(
         context=build_context,
         dockerfile="Dockerfile", # Path to Dockerfile within the build context
         # If your Dockerfile uses ARG, pass them here:
@@ -227,8 +638,13 @@ async def build_and_publish_stage(
         build_args=[
             dagger.BuildArg("CACHEBUST", str(time.time()))],
     )
+    return await built_image.sync()
 
-    # Health check: Run the service and then curl it
+async def smoke_test_stage(client: dagger.Client, built_image: dagger.Container) -> str:
+    """
+    Runs the service and polls /health until it answers, instead of sleeping
+    for a fixed time before a single request.
+    """
     print("Running health check on the built image...")
     service_container = (
         
@@ -241,27 +657,48 @@ async def build_and_publish_stage(
             insecure_root_capabilities=True)
     )
 
-    # Use a separate container to curl the service
+    # Use a separate container to poll the service: up to HEALTH_CHECK_TIMEOUT_S, every 0.5s
+    attempts = int(HEALTH_CHECK_TIMEOUT_S / 0.5)
     health_check_result = await (
         client.container()
         .from_("alpine/curl")
         .with_service_binding("app_service", service_container) # Bind the app service
-        .with_exec(["sh", "-c", "sleep 10 && curl -f http://app_service:8000/health"]) # Wait and curl
+        .with_exec(["sh", "-c", (
+            f"for i in $(seq 1 {attempts}); do "
+            "curl -fsS http://app_service:8000/health && exit 0; sleep 0.5; "
+            "done; echo 'service did not become healthy' >&2; exit 1"
+        )])
         .stdout()
     )
     print(f"Health check output: {health_check_result.strip()}")
-    password_secret = client.set_secret("dockerhub_token", os.getenv("DOCKERHUB_TOKEN"))
-    
-    built_image = built_image.with_registry_auth (
+    return health_check_result
+
+async def publish_stage(
+    client: dagger.Client,
+    built_image: dagger.Container,
+    full_sha: str,
+    dockerhub_username: str,
+    dockerhub_token: str
+) -> str: # Returns the published image reference string
+    """
+    Publishes the image to Docker Hub with the short git SHA and latest tags.
+    """
+    git_sha_short = full_sha[:7]
+    image_sha_tag = f"{dockerhub_username}/{DOCKERHUB_REPO}:{git_sha_short}"
+    image_latest_tag = f"{dockerhub_username}/{DOCKERHUB_REPO}:latest"
+
+    # Create Dagger Secret object for credentials
+    password_secret = client.set_secret("dockerhub_token", dockerhub_token)
+    built_image = built_image.with_registry_auth(
         "docker.io",
-         os.getenv("DOCKERHUB_USERNAME"),
+        dockerhub_username,
         password_secret
     )
 
     # Publish the image with both SHA and latest tags
     print(f"Publishing image {image_sha_tag} and {image_latest_tag}...")
     tags = [image_sha_tag, image_latest_tag]
-    published = [ await built_image.publish(tag) for tag in tags]
+    published = await asyncio.gather(*(built_image.publish(tag) for tag in tags))
 
     return published[0]  # Return the first tag (SHA tag) as the reference
 
@@ -281,17 +718,18 @@ async def get_full_sha():
         raise RuntimeError(f"git failed: {stderr.decode().strip()}")
     return stdout.decode().strip()
 
-async def image_vulnerability_scan_stage(client: dagger.Client, image_ref: str):
+async def image_vulnerability_scan_stage(client: dagger.Client, built_image: dagger.Container):
     """
-    Scans the published Docker image for vulnerabilities using Trivy.
+    Scans the built Docker image for vulnerabilities using Trivy.
+    The image is scanned from a tarball, so this runs alongside the smoke test
+    instead of waiting for the image to be published.
     """
-    print(f"Scanning image: {image_ref}")
+    print("Scanning built image...")
     trivy_container = (
         client.container()
         .from_("aquasec/trivy:latest")
-        # Mount Docker socket if Trivy needs to access local Docker daemon (often not needed for remote images)
-        # .with_unix_socket("/var/run/docker.sock", client.host().unix_socket("/var/run/docker.sock"))
-        .with_exec(["trivy", "image", "--severity", "HIGH,CRITICAL", image_ref])
+        .with_file("/tmp/image.tar", built_image.as_tarball())
+        .with_exec(["trivy", "image", "--severity", "HIGH,CRITICAL", "--input", "/tmp/image.tar"])
     )
     scan_output = await trivy_container.stdout()
     print(scan_output)
@@ -301,5 +739,4 @@ async def image_vulnerability_scan_stage(client: dagger.Client, image_ref: str):
     # For now, it just prints the report.
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
\ No newline at end of file
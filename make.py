@@ -8,6 +8,10 @@ import subprocess
 from datetime import datetime
 import time
 import os
+import sys
+
+# The API's Python client (src/client/price_client.py), used by the test command
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src", "client"))
 
 app = typer.Typer()
 
@@ -132,8 +136,11 @@ def run_container(port: int = PORT, tag: str = "service-latest"):
 @app.command()
 def test(port: int = PORT):
     """Test prediction endpoint"""
-    data = '{"sqft":1500,"bedrooms":3,"bathrooms":2,"location":"suburban","year_built":2005,"condition":"Good"}'
-    run(f"curl -X POST http://localhost:{port}/predict -H 'Content-Type: application/json' -d '{data}'")
+    from price_client import PriceClient
+
+    data = {"sqft": 1500, "bedrooms": 3, "bathrooms": 2, "location": "suburban", "year_built": 2005, "condition": "Good"}
+    with PriceClient(f"http://localhost:{port}") as client:
+        print(client.predict(data).model_dump_json(indent=2))
 
 @app.command()
 def stop_containers():
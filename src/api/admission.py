@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+
+# Weight of the newest observation in the per-endpoint service time average
+SERVICE_TIME_EWMA_ALPHA = 0.2
+
+class Overloaded(Exception):
+    """Raised instead of queueing a request that could not be served within its budget."""
+
+    def __init__(self, endpoint, status_code, reason, retry_after_s):
+        super().__init__(f"{endpoint}: {reason}")
+        self.endpoint = endpoint
+        self.status_code = status_code
+        self.reason = reason
+        # Retry-After is in whole seconds
+        self.retry_after = max(1, math.ceil(retry_after_s))
+
+class EndpointPolicy:
+    """Admission settings and counters for one endpoint."""
+
+    def __init__(self, name, priority, max_concurrency, max_queue, latency_budget_s, initial_service_s):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.latency_budget_s = latency_budget_s
+        self.service_s = initial_service_s
+
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed_overloaded = 0
+        self.shed_queue_full = 0
+        self.shed_timed_out = 0
+
+    def record_service_time(self, seconds):
+        self.service_s += SERVICE_TIME_EWMA_ALPHA * (seconds - self.service_s)
+
+    def stats(self):
+        return {
+            "priority": self.priority,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "latency_budget_ms": self.latency_budget_s * 1000,
+            "service_time_ms": round(self.service_s * 1000, 3),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": {
+                "overloaded": self.shed_overloaded,
+                "queue_full": self.shed_queue_full,
+                "timed_out": self.shed_timed_out,
+            },
+        }
+
+class _Waiter:
+    def __init__(self, policy, seq, future):
+        self.policy = policy
+        self.seq = seq
+        self.future = future
+        self.slot = None
+
+    @property
+    def order(self):
+        return (self.policy.priority, self.seq)
+
+class AdmissionController:
+    """
+    Bounded, priority-ordered admission for CPU-bound endpoints.
+
+    At most `max_concurrency` requests run at once across all endpoints, and
+    each endpoint has its own concurrency cap. Requests that can't start
+    immediately wait in a bounded queue, where lower `priority` values go
+    first. A request is rejected on arrival if its endpoint's queue is full
+    (429) or if the estimated wait exceeds the endpoint's latency budget (503).
+    It is also rejected (503) if it has been queued for longer than the budget.
+    The wait estimate uses each endpoint's moving-average service time to
+    predict when slots free up; work of lower priority is left out of it, as
+    every freed slot goes to the highest-priority waiter.
+
+    Like the drift monitor, all bookkeeping happens on the event loop thread,
+    so no lock is needed; only the admitted work itself runs elsewhere.
+    """
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        # Slot id -> (policy, start time) of the work holding it
+        self.slots = {}
+        self.policies = {}
+        self.waiters = []
+        self._seq = itertools.count()
+
+    def add_endpoint(self, name, priority, max_concurrency, max_queue, latency_budget_s, initial_service_s=0.01):
+        self.policies[name] = EndpointPolicy(
+            name, priority, max_concurrency, max_queue, latency_budget_s, initial_service_s
+        )
+
+    # -----------------------------
+    # Wait estimate
+    # -----------------------------
+    def _releases(self, n_slots, include):
+        """Seconds until each of `n_slots` slots is expected to free up, counting only `include`d work."""
+        now = time.perf_counter()
+        releases = [max(0.0, start + p.service_s - now) for p, start in self.slots.values() if include(p)]
+        return releases + [0.0] * (n_slots - len(releases))
+
+    @staticmethod
+    def _wait_behind(releases, queue):
+        """Wait for a slot once every queued request (its service times, in order) has had one."""
+        heapq.heapify(releases)
+        for service_s in queue:
+            heapq.heappush(releases, heapq.heappop(releases) + service_s)
+        return releases[0]
+
+    def estimate_wait(self, policy):
+        """Seconds a request arriving now at `policy`'s endpoint would wait for a slot."""
+        # Shared slots: held or queued for by work of the same or higher priority
+        ahead = [w.policy.service_s for w in sorted(self.waiters, key=lambda w: w.order)
+                 if w.policy.priority <= policy.priority]
+        shared_wait = self._wait_behind(
+            self._releases(self.max_concurrency, lambda p: p.priority <= policy.priority), ahead
+        )
+        # Its own endpoint's cap can be the tighter bottleneck
+        own_wait = self._wait_behind(
+            self._releases(policy.max_concurrency, lambda p: p is policy), [policy.service_s] * policy.queued
+        )
+        return max(shared_wait, own_wait)
+
+    # -----------------------------
+    # Admission
+    # -----------------------------
+    def _can_start(self, policy):
+        return self.running < self.max_concurrency and policy.in_flight < policy.max_concurrency
+
+    def _start(self, policy):
+        """Take a slot for `policy`; returns its id."""
+        self.running += 1
+        policy.in_flight += 1
+        policy.admitted += 1
+        slot = next(self._seq)
+        self.slots[slot] = (policy, time.perf_counter())
+        return slot
+
+    def _finish(self, policy, slot, seconds):
+        self.running -= 1
+        policy.in_flight -= 1
+        del self.slots[slot]
+        policy.record_service_time(seconds)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to the highest-priority waiters whose endpoint has room."""
+        while self.running < self.max_concurrency:
+            eligible = [w for w in self.waiters if w.policy.in_flight < w.policy.max_concurrency]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: w.order)
+            self.waiters.remove(waiter)
+            waiter.policy.queued -= 1
+            waiter.slot = self._start(waiter.policy)
+            waiter.future.set_result(None)
+
+    async def _wait_for_slot(self, policy):
+        if policy.queued >= policy.max_queue:
+            policy.shed_queue_full += 1
+            raise Overloaded(policy.name, 429, "queue full", self.estimate_wait(policy))
+        wait = self.estimate_wait(policy)
+        if wait > policy.latency_budget_s:
+            policy.shed_overloaded += 1
+            raise Overloaded(policy.name, 503, "estimated wait exceeds latency budget", wait)
+
+        waiter = _Waiter(policy, next(self._seq), asyncio.get_running_loop().create_future())
+        self.waiters.append(waiter)
+        policy.queued += 1
+        try:
+            # shield: a timeout must not cancel a slot that was granted in the same loop iteration
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=policy.latency_budget_s)
+            return waiter.slot
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done():
+                # Granted just as we gave up: hand the slot straight back
+                self._finish(policy, waiter.slot, policy.service_s)
+                policy.admitted -= 1
+            else:
+                waiter.future.cancel()
+                self.waiters.remove(waiter)
+                policy.queued -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                policy.shed_timed_out += 1
+                raise Overloaded(policy.name, 503, "queued longer than latency budget", self.estimate_wait(policy))
+            raise
+
+    @asynccontextmanager
+    async def admit(self, name):
+        """Hold a slot for `name` while the block runs, or raise Overloaded."""
+        policy = self.policies[name]
+        # Slots are handed to waiters as soon as they free up, so free capacity
+        # here means any remaining waiters are blocked on their own endpoint's cap
+        if self._can_start(policy):
+            slot = self._start(policy)
+        else:
+            slot = await self._wait_for_slot(policy)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._finish(policy, slot, time.perf_counter() - start)
+
+    def has_waiters(self):
+        """True while any request is queued for a slot."""
+        return bool(self.waiters)
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "queued": len(self.waiters),
+            "endpoints": {name: policy.stats() for name, policy in self.policies.items()},
+        }
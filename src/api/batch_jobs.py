@@ -0,0 +1,436 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from admission import Overloaded
+
+logger = logging.getLogger("batch-jobs")
+
+# Defaults, overridable through environment variables in main.py
+BATCH_JOBS_MAX_RUNNING = 2
+BATCH_JOBS_MAX_QUEUED = 16
+# Chunks are sized to take about BATCH_JOBS_CHUNK_TARGET_S at the measured scoring
+# rate, so a running chunk never holds a slot for long; main.py derives the target
+# from the /predict latency budget. The first chunk measures the rate.
+BATCH_JOBS_CHUNK_TARGET_S = 0.25
+BATCH_JOBS_CHUNK_ROWS = 10000
+BATCH_JOBS_MIN_CHUNK_ROWS = 100
+BATCH_JOBS_FIRST_CHUNK_ROWS = 500
+# Weight of the newest chunk in the rows/sec average
+CHUNK_RATE_EWMA_ALPHA = 0.3
+BATCH_JOBS_TTL_S = 24 * 3600
+BATCH_JOBS_MAX_UPLOAD_BYTES = 1024 * 1024 * 1024
+# How often expired jobs are swept from memory and disk
+BATCH_JOBS_CLEANUP_INTERVAL_S = 60
+
+INPUT_FILENAME = "input.csv"
+RESULTS_FILENAME = "results.csv"
+# Passed through to the results so clients can join them back to their rows
+ID_COLUMN = "id"
+
+class JobRejected(Exception):
+    """Raised when a job can't be submitted, looked up or downloaded."""
+
+    def __init__(self, status_code, reason):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+
+# -----------------------------
+# Row validation
+# -----------------------------
+def field_checks(schema):
+    """
+    (field, type, bounds) for each property of a pydantic request schema, so
+    whole chunks are checked against the same constraints as /predict.
+    """
+    checks = []
+    for name, prop in schema["properties"].items():
+        checks.append((name, prop.get("type"), {
+            key: prop[key] for key in ("minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum") if key in prop
+        }))
+    return checks
+
+def validate_chunk(chunk, checks):
+    """
+    Vectorized version of the request schema's validation. Returns a boolean
+    mask of valid rows and, per row, the comma-separated names of the fields
+    that failed (empty for valid rows).
+    """
+    n_rows = len(chunk)
+    failed = []
+    for name, kind, bounds in checks:
+        if kind in ("number", "integer"):
+            values = pd.to_numeric(chunk[name], errors="coerce").to_numpy(dtype=np.float64)
+            bad = ~np.isfinite(values)
+            if kind == "integer":
+                bad |= np.floor(values) != values
+            with np.errstate(invalid="ignore"):
+                if "minimum" in bounds:
+                    bad |= values < bounds["minimum"]
+                if "maximum" in bounds:
+                    bad |= values > bounds["maximum"]
+                if "exclusiveMinimum" in bounds:
+                    bad |= values <= bounds["exclusiveMinimum"]
+                if "exclusiveMaximum" in bounds:
+                    bad |= values >= bounds["exclusiveMaximum"]
+        else:
+            bad = chunk[name].isna().to_numpy()
+        failed.append(np.where(bad, name, ""))
+
+    errors = np.full(n_rows, "", dtype=object)
+    for names in failed:
+        errors = np.where(names == "", errors, np.where(errors == "", names, errors + "," + names))
+    return errors == "", errors
+
+# -----------------------------
+# Jobs
+# -----------------------------
+class BatchJob:
+    """State and progress of one scoring job; its files live in `directory`."""
+
+    def __init__(self, job_id, directory, rows_total, has_id):
+        self.id = job_id
+        self.directory = directory
+        self.rows_total = rows_total
+        self.has_id = has_id
+        self.status = "queued"
+        self.rows_done = 0
+        self.rows_failed = 0
+        self.chunks_done = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.expires_at = None
+        self.error = None
+        self.cancelled = False
+
+    @property
+    def input_path(self):
+        return os.path.join(self.directory, INPUT_FILENAME)
+
+    @property
+    def results_path(self):
+        return os.path.join(self.directory, RESULTS_FILENAME)
+
+    def to_dict(self):
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat() if ts is not None else None
+
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "rows_total": self.rows_total,
+            "rows_done": self.rows_done,
+            "rows_failed": self.rows_failed,
+            "chunks_done": self.chunks_done,
+            "progress": round(self.rows_done / self.rows_total, 4) if self.rows_total else None,
+            "created": iso(self.created),
+            "started": iso(self.started),
+            "finished": iso(self.finished),
+            "expires_at": iso(self.expires_at),
+            "error": self.error,
+        }
+
+class BatchJobManager:
+    """
+    Scores large CSV datasets in the background instead of inside an HTTP request.
+
+    `submit` streams the upload to a per-job directory under `job_dir` and
+    queues the job. `max_running` worker tasks take jobs off the queue and
+    score them a chunk at a time, each sized from the measured rows/sec to
+    take about `chunk_target_s` (at most `chunk_rows` rows), so a chunk
+    holds its admission slot only briefly. Each chunk is read from disk,
+    validated, scored with `score_frame` (the same model and preprocessor as
+    /predict) and appended to the job's results file, so memory is bounded
+    by the chunk size, not the dataset. Every chunk goes through admission
+    control as `endpoint`, whose low priority means waiting /predict and
+    /batch-predict requests get free slots first; a shed chunk is retried.
+    Finished jobs and their files are deleted `ttl_s` seconds after they end.
+
+    Like the other API helpers, job state is only touched on the event loop
+    thread, so no lock is needed; only chunk scoring runs in worker threads.
+    Jobs live in memory and don't survive a restart; leftover directories are
+    removed when the manager starts.
+    """
+
+    def __init__(
+        self,
+        job_dir,
+        score_frame,
+        required_columns,
+        checks,
+        admission,
+        endpoint,
+        max_running=BATCH_JOBS_MAX_RUNNING,
+        max_queued=BATCH_JOBS_MAX_QUEUED,
+        chunk_rows=BATCH_JOBS_CHUNK_ROWS,
+        chunk_target_s=BATCH_JOBS_CHUNK_TARGET_S,
+        ttl_s=BATCH_JOBS_TTL_S,
+        max_upload_bytes=BATCH_JOBS_MAX_UPLOAD_BYTES,
+        cleanup_interval_s=BATCH_JOBS_CLEANUP_INTERVAL_S,
+    ):
+        self.job_dir = job_dir
+        self.score_frame = score_frame
+        self.required_columns = list(required_columns)
+        self.checks = checks
+        self.admission = admission
+        self.endpoint = endpoint
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.chunk_rows = chunk_rows
+        self.chunk_target_s = chunk_target_s
+        # Scoring rate across jobs, learned from the chunks
+        self.rows_per_s = None
+        self.ttl_s = ttl_s
+        self.max_upload_bytes = max_upload_bytes
+        self.cleanup_interval_s = cleanup_interval_s
+
+        self.jobs = {}
+        self.queue = asyncio.Queue()
+        self.submitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self._tasks = []
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
+    def start(self):
+        os.makedirs(self.job_dir, exist_ok=True)
+        # Jobs from a previous process can't be resumed; only job id directories are removed
+        for name in os.listdir(self.job_dir):
+            if len(name) == 32 and all(c in "0123456789abcdef" for c in name):
+                shutil.rmtree(os.path.join(self.job_dir, name), ignore_errors=True)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"batch-job-worker-{i}") for i in range(self.max_running)]
+        self._tasks.append(asyncio.create_task(self._janitor(), name="batch-job-janitor"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # -----------------------------
+    # Submission and lookup
+    # -----------------------------
+    async def submit(self, body):
+        """Stream a CSV request body (an async iterator of bytes) to disk and queue it."""
+        queued = sum(1 for job in self.jobs.values() if job.status == "queued")
+        if queued >= self.max_queued:
+            self.rejected += 1
+            raise JobRejected(429, f"{queued} jobs already queued")
+
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.job_dir, job_id)
+        os.makedirs(directory)
+        try:
+            n_lines, header = await self._save_upload(body, os.path.join(directory, INPUT_FILENAME))
+            columns = [c.strip().strip('"') for c in header.split(",")]
+            missing = [c for c in self.required_columns if c not in columns]
+            if missing:
+                raise JobRejected(422, f"CSV is missing required columns: {missing}")
+            if n_lines < 1:
+                raise JobRejected(422, "CSV has no rows")
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            self.rejected += 1
+            raise
+
+        job = BatchJob(job_id, directory, n_lines, ID_COLUMN in columns)
+        self.jobs[job_id] = job
+        self.queue.put_nowait(job)
+        self.submitted += 1
+        logger.info(f"Queued batch job {job_id} with {n_lines} rows")
+        return job
+
+    async def _save_upload(self, body, path):
+        """Write the body to `path`; returns (data rows, header line)."""
+        size = 0
+        newlines = 0
+        last_byte = b"\n"
+        head = b""
+        with open(path, "wb") as f:
+            async for block in body:
+                if not block:
+                    continue
+                size += len(block)
+                if size > self.max_upload_bytes:
+                    raise JobRejected(413, f"upload exceeds {self.max_upload_bytes} bytes")
+                if len(head) < 65536:
+                    head += block[:65536]
+                newlines += block.count(b"\n")
+                last_byte = block[-1:]
+                await asyncio.to_thread(f.write, block)
+        if size == 0:
+            raise JobRejected(422, "empty upload")
+        lines = newlines + (last_byte != b"\n")
+        # Row count for progress reporting; quoted newlines would inflate it slightly
+        return lines - 1, head.split(b"\n", 1)[0].decode("utf-8-sig").strip()
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise JobRejected(404, f"job {job_id} not found or expired")
+        return job
+
+    def results_path(self, job_id):
+        job = self.get(job_id)
+        if job.status != "succeeded":
+            raise JobRejected(409, f"job {job_id} is {job.status}; results are available once it has succeeded")
+        return job.results_path
+
+    def delete(self, job_id):
+        """Cancel a queued or running job, or drop a finished one, and delete its files."""
+        job = self.get(job_id)
+        job.cancelled = True
+        if job.status in ("queued", "running"):
+            # The worker stops at the next chunk boundary and removes the files
+            job.status = "cancelled"
+            job.finished = time.time()
+        else:
+            self._remove(job)
+        return job
+
+    def _remove(self, job):
+        self.jobs.pop(job.id, None)
+        shutil.rmtree(job.directory, ignore_errors=True)
+
+    # -----------------------------
+    # Background work
+    # -----------------------------
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            if job.cancelled:
+                self._remove(job)
+                continue
+            await self._run(job)
+
+    async def _run(self, job):
+        job.status = "running"
+        job.started = time.time()
+        reader = None
+        try:
+            reader = pd.read_csv(job.input_path, iterator=True)
+            first = True
+            while not job.cancelled:
+                done = await self._score_next_chunk(job, reader, first)
+                if done:
+                    break
+                first = False
+        except Exception as e:
+            logger.exception(f"Batch job {job.id} failed")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            if reader is not None:
+                reader.close()
+
+        if job.cancelled:
+            self._remove(job)
+            return
+        if job.status == "running":
+            job.status = "succeeded"
+        job.finished = time.time()
+        job.expires_at = job.finished + self.ttl_s
+        logger.info(f"Batch job {job.id} {job.status}: {job.rows_done} rows, {job.rows_failed} invalid")
+
+    def next_chunk_rows(self):
+        """Rows for the next chunk to take about `chunk_target_s` at the learned rate."""
+        if self.rows_per_s is None:
+            rows = BATCH_JOBS_FIRST_CHUNK_ROWS
+        else:
+            rows = int(self.rows_per_s * self.chunk_target_s)
+        return max(BATCH_JOBS_MIN_CHUNK_ROWS, min(rows, self.chunk_rows))
+
+    def _record_rate(self, n_rows, seconds):
+        rate = n_rows / max(seconds, 1e-6)
+        if self.rows_per_s is None:
+            self.rows_per_s = rate
+        else:
+            self.rows_per_s += CHUNK_RATE_EWMA_ALPHA * (rate - self.rows_per_s)
+
+    async def _score_next_chunk(self, job, reader, first):
+        """Score one chunk under admission control; returns True when the input is exhausted."""
+        while True:
+            try:
+                async with self.admission.admit(self.endpoint):
+                    n_rows = self.next_chunk_rows()
+                    start = time.perf_counter()
+                    result = await asyncio.to_thread(self._process_chunk, job, reader, first, n_rows)
+                    elapsed = time.perf_counter() - start
+                break
+            except Overloaded as e:
+                # Interactive traffic has the slots; try again shortly
+                await asyncio.sleep(e.retry_after)
+        if result is None:
+            return True
+        n_rows, n_failed = result
+        self._record_rate(n_rows, elapsed)
+        job.rows_done += n_rows
+        job.rows_failed += n_failed
+        job.chunks_done += 1
+        # Keep the estimate honest if the upload's line count was off
+        job.rows_total = max(job.rows_total, job.rows_done)
+        return False
+
+    def _process_chunk(self, job, reader, first, n_rows):
+        """Read, validate, score and append the next `n_rows` rows (runs in a worker thread)."""
+        try:
+            chunk = reader.get_chunk(n_rows)
+        except StopIteration:
+            return None
+        start = job.rows_done
+        valid, errors = validate_chunk(chunk, self.checks)
+
+        predictions = np.full(len(chunk), np.nan)
+        if valid.any():
+            frame = chunk.loc[valid, self.required_columns].reset_index(drop=True)
+            predictions[valid] = self.score_frame(frame)
+
+        out = pd.DataFrame({"row": np.arange(start, start + len(chunk))})
+        if job.has_id:
+            out[ID_COLUMN] = chunk[ID_COLUMN].to_numpy()
+        out["predicted_price"] = np.round(predictions, 2)
+        out["error"] = np.where(valid, "", np.char.add("invalid: ", errors.astype(str)))
+        out.to_csv(job.results_path, mode="w" if first else "a", header=first, index=False)
+        return len(chunk), int((~valid).sum())
+
+    async def _janitor(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval_s)
+            self.expire()
+
+    def expire(self, now=None):
+        """Delete finished jobs whose TTL has passed."""
+        now = time.time() if now is None else now
+        for job in list(self.jobs.values()):
+            if job.expires_at is not None and job.expires_at <= now and job.status != "running":
+                self._remove(job)
+                self.expired += 1
+
+    def stats(self):
+        by_status = {}
+        for job in self.jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            "max_running": self.max_running,
+            "max_queued": self.max_queued,
+            "chunk_rows": self.next_chunk_rows(),
+            "max_chunk_rows": self.chunk_rows,
+            "chunk_target_ms": self.chunk_target_s * 1000,
+            "rows_per_sec": round(self.rows_per_s, 1) if self.rows_per_s is not None else None,
+            "ttl_s": self.ttl_s,
+            "jobs": by_status,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "expired": self.expired,
+        }
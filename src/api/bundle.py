@@ -0,0 +1,279 @@
+import hashlib
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+from price_index import PriceIndex
+
+# Bump when the array layout changes; loaders refuse bundles they don't understand
+BUNDLE_FORMAT_VERSION = 1
+# Rows of a sparse input densified at a time for tree traversal
+SPARSE_CHUNK_ROWS = 4096
+# Anytime prediction: trees evaluated per step, and the fewest trees any answer uses
+ANYTIME_BLOCK_TREES = 10
+ANYTIME_MIN_TREES = 20
+
+def bundle_checksum(arrays):
+    """SHA-256 over every array in the bundle except the checksum itself."""
+    digest = hashlib.sha256()
+    for key in sorted(arrays):
+        if key == "checksum":
+            continue
+        value = np.ascontiguousarray(arrays[key])
+        digest.update(key.encode())
+        digest.update(str(value.dtype).encode())
+        digest.update(value.tobytes())
+    return digest.hexdigest()
+
+class ServingBundle:
+    """
+    Preprocessor and model compiled to plain numpy arrays (see
+    src/models/serving_bundle.py), so serving needs neither sklearn, xgboost
+    nor version-matched pickles. Produces the same predictions as
+    `model.predict(preprocessor.transform(X))`.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.metadata = json.loads(arrays["metadata"].tobytes().decode())
+        if self.metadata["format_version"] != BUNDLE_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported bundle format {self.metadata['format_version']}, expected {BUNDLE_FORMAT_VERSION}"
+            )
+
+        self.numerical_features = self.metadata["numerical_features"]
+        self.categorical_features = self.metadata["categorical_features"]
+        self.derived_features = self.metadata["derived_features"]
+        self.n_features = self.metadata["n_features"]
+        self.model_kind = self.metadata["model_kind"]
+
+        # Aggregate indexes used by "lookup" derived features, keyed by array prefix
+        self.indexes = {
+            spec["index"]: PriceIndex.from_arrays(arrays, spec["index"])
+            for spec in self.derived_features if spec["op"] == "lookup"
+        }
+
+        self.num_fill = arrays["num_fill"]
+        offsets = arrays["cat_offsets"]
+        self.vocabularies = [arrays["cat_vocab"][offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+        if self.model_kind == "linear":
+            self.coef = arrays["coef"]
+        else:
+            self.left = arrays["left"]
+            self.right = arrays["right"]
+            self.feature = arrays["feature"]
+            self.threshold = arrays["threshold"]
+            self.value = arrays["value"]
+            self.default_left = arrays["default_left"]
+            self.roots = arrays["roots"]
+            self._prepare_traversal()
+
+    @classmethod
+    def load(cls, path):
+        """Load and checksum-verify a bundle written by export_serving_bundle."""
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {key: data[key] for key in data.files}
+        expected = arrays["checksum"].tobytes().decode()
+        if bundle_checksum(arrays) != expected:
+            raise ValueError(f"Checksum mismatch for serving bundle {path}")
+        return cls(arrays)
+
+    @property
+    def version(self):
+        return self.metadata["model_version"]
+
+    def add_derived_features(self, frame):
+        """Compute derived features the same way the serving path always has."""
+        current_year = datetime.now().year
+        for spec in self.derived_features:
+            name, op, args = spec["name"], spec["op"], spec["args"]
+            if op == "years_since":
+                frame[name] = current_year - np.asarray(frame[args[0]], dtype=np.float64)
+            elif op == "ratio":
+                ratio = np.asarray(frame[args[0]], dtype=np.float64) / np.asarray(frame[args[1]], dtype=np.float64)
+                frame[name] = np.where(np.isfinite(ratio), ratio, 0.0)
+            elif op == "constant":
+                frame[name] = spec["value"]
+            elif op == "lookup":
+                frame[name] = self.indexes[spec["index"]].lookup(frame[args[0]], frame[args[1]])
+            else:
+                raise ValueError(f"Unknown derived feature op: {op}")
+        return frame
+
+    def transform(self, frame):
+        """Equivalent of the fitted ColumnTransformer: mean-impute numerics, one-hot categoricals."""
+        n_rows = len(frame[(self.numerical_features + self.categorical_features)[0]])
+        X = np.zeros((n_rows, self.n_features), dtype=np.float64)
+        for j, name in enumerate(self.numerical_features):
+            column = np.asarray(frame[name], dtype=np.float64)
+            X[:, j] = np.where(np.isnan(column), self.num_fill[j], column)
+
+        rows = np.arange(n_rows)
+        offset = len(self.numerical_features)
+        for name, vocab in zip(self.categorical_features, self.vocabularies):
+            values = np.asarray(frame[name]).astype(str)
+            # Vocabularies are sorted; unknown categories get an all-zero block
+            idx = np.searchsorted(vocab, values).clip(0, len(vocab) - 1)
+            known = vocab[idx] == values
+            X[rows[known], offset + idx[known]] = 1.0
+            offset += len(vocab)
+        return X
+
+    def predict(self, X):
+        """Predict from a preprocessed feature matrix, dense or scipy sparse."""
+        if self.model_kind == "linear":
+            return np.asarray(X @ self.coef).ravel() + self.metadata["intercept"]
+        if hasattr(X, "toarray"):
+            # Sparse input: densify a bounded block of rows at a time
+            return np.concatenate([np.zeros(0)] + [
+                self.predict(X[i:i + SPARSE_CHUNK_ROWS].toarray())
+                for i in range(0, X.shape[0], SPARSE_CHUNK_ROWS)
+            ])
+
+        leaves = self._leaf_values(self._float32_features(X), self.roots)
+        if self.metadata["aggregation"] == "mean":
+            # Accumulate tree by tree in order, as sklearn does, then average
+            return np.cumsum(leaves, axis=1)[:, -1] / leaves.shape[1]
+        # Boosting: start from the base score and add each (pre-scaled) tree in order
+        base = np.full((X.shape[0], 1), self.metadata["base_score"], dtype=leaves.dtype)
+        return np.cumsum(np.hstack([base, leaves]), axis=1)[:, -1].astype(np.float64)
+
+    def _float32_features(self, X):
+        # Both sklearn and XGBoost compare features as float32
+        X32 = X.astype(np.float32)
+        if self.metadata.get("zero_as_missing"):
+            # XGBoost trained on a sparse matrix saw zeros as missing values
+            X32[X32 == 0] = np.nan
+        return X32
+
+    def _prepare_traversal(self):
+        """Arrays that let one level of traversal take a handful of numpy calls."""
+        n_nodes = len(self.left)
+        is_leaf = self.left < 0
+        nodes = np.arange(n_nodes, dtype=self.left.dtype)
+        # Node n's left child at 2n, right child at 2n + 1; a leaf is its own child,
+        # so rows that reach one stay there without a mask
+        self.children = np.empty(2 * n_nodes, dtype=self.left.dtype)
+        self.children[0::2] = np.where(is_leaf, nodes, self.left)
+        self.children[1::2] = np.where(is_leaf, nodes, self.right)
+        self.go_right_if_missing = ~self.default_left.astype(bool)
+
+        # Depth of each tree, so a block of trees only walks as deep as it has to
+        self.tree_depth = np.zeros(len(self.roots), dtype=np.int64)
+        frontier, tree = self.roots.astype(np.int64), np.arange(len(self.roots))
+        depth = 0
+        while frontier.size:
+            inner = ~is_leaf[frontier]
+            frontier, tree = frontier[inner], tree[inner]
+            depth += 1
+            self.tree_depth[tree] = depth
+            frontier = np.concatenate([self.left[frontier], self.right[frontier]]).astype(np.int64)
+            tree = np.concatenate([tree, tree])
+
+        # Zero-copy per-node views that index as Python numbers, for walking one row's
+        # trees in plain Python: a numpy pass costs about the same for 10 trees as for all
+        self._node_views = (memoryview(self.feature), memoryview(self.threshold),
+                            memoryview(self.children), memoryview(self.value))
+
+    def _leaf_values(self, X32, roots, depth=None, has_missing=None):
+        """Leaf value of every row in each tree starting at `roots`, shape (rows, trees)."""
+        if depth is None:
+            depth = int(self.tree_depth.max()) if len(self.tree_depth) else 0
+        if has_missing is None:
+            has_missing = bool(np.isnan(X32).any())
+        node = np.repeat(roots[None, :], X32.shape[0], axis=0)
+        rows = np.arange(X32.shape[0])[:, None]
+        strict = self.metadata["split_rule"] == "lt"
+        for _ in range(depth):
+            x = X32[rows, self.feature[node]]
+            # The complement of the split rule: `x < t` goes left, so `x >= t` goes right
+            go_right = x >= self.threshold[node] if strict else x > self.threshold[node]
+            if has_missing:
+                go_right = np.where(np.isnan(x), self.go_right_if_missing[node], go_right)
+            node = self.children[(node << 1) | go_right]
+        return self.value[node]
+
+    @property
+    def n_trees(self):
+        return 0 if self.model_kind == "linear" else len(self.roots)
+
+    @property
+    def supports_anytime(self):
+        """Averaging ensembles (random forests) can stop after any prefix of their trees."""
+        return self.model_kind == "trees" and self.metadata["aggregation"] == "mean"
+
+    def predict_anytime(self, X, max_relative_se, block_trees=ANYTIME_BLOCK_TREES, min_trees=ANYTIME_MIN_TREES,
+                        deadline=None):
+        """
+        Predict from dense features with as few trees as needed. Trees are
+        evaluated in bundle order, `block_trees` at a time, stopping once the
+        standard error of every row's running mean is at most
+        `max_relative_se` of that mean, or once `time.perf_counter()` passes
+        `deadline` (at least `min_trees` trees always run).
+        Returns (predictions, trees used).
+        """
+        if not self.supports_anytime:
+            return self.predict(X), self.n_trees
+        X32 = self._float32_features(X)
+        has_missing = bool(np.isnan(X32).any())
+        if X32.shape[0] == 1 and not has_missing and self._python_walk_matches:
+            return self._predict_anytime_row(X32[0], max_relative_se, block_trees, min_trees, deadline)
+        leaves = np.empty((X.shape[0], self.n_trees), dtype=self.value.dtype)
+        # Running sums of the leaf values and their squares give each row's variance
+        total = np.zeros(X.shape[0])
+        total_sq = np.zeros(X.shape[0])
+        used = 0
+        while used < self.n_trees:
+            step = block_trees if used else max(block_trees, min_trees, 2)
+            block = leaves[:, used:used + step]
+            block[:] = self._leaf_values(
+                X32, self.roots[used:used + step], int(self.tree_depth[used:used + step].max()), has_missing
+            )
+            used += block.shape[1]
+            total += block.sum(axis=1)
+            total_sq += np.square(block).sum(axis=1)
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            # Stop once se = sqrt(var / n) <= max_relative_se * |mean| for every row, compared squared
+            mean = total / used
+            variance = (total_sq - total * mean) / (used - 1)
+            if np.all(variance <= used * np.square(max_relative_se * mean)):
+                break
+        # Same accumulation as predict(), so running every tree gives identical results
+        return np.cumsum(leaves[:, :used], axis=1)[:, -1] / used, used
+
+    @property
+    def _python_walk_matches(self):
+        """Python floats add and compare exactly like predict() for float64 leaves and `x <= t` splits."""
+        return self.value.dtype == np.float64 and self.metadata["split_rule"] == "le"
+
+    def _predict_anytime_row(self, x, max_relative_se, block_trees, min_trees, deadline):
+        """predict_anytime() for one row without missing values, walking each tree in Python."""
+        feature, threshold, children, value = self._node_views
+        xs = x.tolist()
+        roots, depths = self.roots.tolist(), self.tree_depth.tolist()
+        total = total_sq = 0.0
+        used = 0
+        while used < self.n_trees:
+            step = block_trees if used else max(block_trees, min_trees, 2)
+            for node, depth in zip(roots[used:used + step], depths[used:used + step]):
+                for _ in range(depth):
+                    node = children[2 * node + (xs[feature[node]] > threshold[node])]
+                leaf = value[node]
+                # Adding in tree order matches predict()'s cumulative sum bit for bit
+                total += leaf
+                total_sq += leaf * leaf
+            used = min(used + step, self.n_trees)
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            mean = total / used
+            if (total_sq - total * mean) / (used - 1) <= used * (max_relative_se * mean) ** 2:
+                break
+        return np.array([total / used]), used
+
+    def predict_frame(self, frame):
+        """Derived features, preprocessing and prediction for a frame of raw request fields."""
+        return self.predict(self.transform(self.add_derived_features(frame)))
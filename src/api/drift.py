@@ -0,0 +1,140 @@
+import json
+import math
+import os
+from bisect import bisect_right
+from datetime import datetime
+
+# Distinct unseen categories tracked per feature before lumping the rest together
+MAX_UNSEEN_CATEGORIES = 50
+OTHER_CATEGORY = "__other__"
+# Population stability index thresholds (common rule of thumb)
+PSI_WARN = 0.1
+PSI_DRIFT = 0.25
+# Floor for empty bins so PSI stays finite
+PSI_EPSILON = 1e-4
+
+def population_stability_index(expected, actual):
+    """PSI between two aligned lists of proportions."""
+    psi = 0.0
+    for e, a in zip(expected, actual):
+        e, a = max(e, PSI_EPSILON), max(a, PSI_EPSILON)
+        psi += (a - e) * math.log(a / e)
+    return psi
+
+def drift_status(psi):
+    if psi is None:
+        return "no_data"
+    if psi >= PSI_DRIFT:
+        return "drift"
+    if psi >= PSI_WARN:
+        return "warn"
+    return "ok"
+
+class DriftMonitor:
+    """
+    Fixed-size streaming sketches of live request features, compared on demand
+    with the reference statistics written at feature-engineering time.
+
+    Numerical features go into fixed bins (the reference deciles plus
+    under/overflow); categorical features into counters over the training
+    vocabulary plus a capped set of unseen values. Memory is bounded by the
+    reference, not by traffic. Updates are plain increments: the endpoints that
+    call `observe` are `async def`, so they all run on the event loop thread and
+    no lock is needed.
+    """
+
+    def __init__(self, reference=None):
+        self.reference = reference or {"numerical": {}, "categorical": {}}
+        self.started = datetime.now().isoformat()
+        self.n_observed = 0
+        self.edges = {name: spec["edges"] for name, spec in self.reference["numerical"].items()}
+        self.bin_counts = {name: [0] * (len(edges) + 1) for name, edges in self.edges.items()}
+        self.category_counts = {
+            name: dict.fromkeys(spec["proportions"], 0)
+            for name, spec in self.reference["categorical"].items()
+        }
+
+    @classmethod
+    def from_file(cls, path):
+        """Monitor against the reference at `path`, or a reference-less one if it doesn't exist."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def observe(self, record):
+        """Record one request's features; `record` maps feature name to value."""
+        self.n_observed += 1
+        for name, edges in self.edges.items():
+            value = record.get(name)
+            if value is not None:
+                self.bin_counts[name][bisect_right(edges, value)] += 1
+        for name, counts in self.category_counts.items():
+            value = record.get(name)
+            if value in counts:
+                counts[value] += 1
+            elif len(counts) < len(self.reference["categorical"][name]["proportions"]) + MAX_UNSEEN_CATEGORIES:
+                counts[value] = 1
+            else:
+                counts[OTHER_CATEGORY] = counts.get(OTHER_CATEGORY, 0) + 1
+
+    def observe_request(self, request):
+        """Record the monitored features of a HousePredictionRequest."""
+        self.observe({
+            "sqft": request.sqft,
+            "bathrooms": request.bathrooms,
+            "house_age": datetime.now().year - request.year_built,
+            "location": request.location,
+            "condition": request.condition,
+        })
+
+    def reset(self):
+        self.__init__(self.reference)
+
+    def report(self):
+        """Current distributions next to the reference, with PSI and a status per feature."""
+        features = {}
+        for name, counts in self.bin_counts.items():
+            total = sum(counts)
+            current = [c / total for c in counts] if total else None
+            expected = self.reference["numerical"][name]["proportions"]
+            psi = population_stability_index(expected, current) if current else None
+            features[name] = {
+                "type": "numerical",
+                "psi": psi,
+                "status": drift_status(psi),
+                "edges": self.edges[name],
+                "reference": expected,
+                "current": current,
+                "count": total,
+            }
+        for name, counts in self.category_counts.items():
+            total = sum(counts.values())
+            expected = self.reference["categorical"][name]["proportions"]
+            unseen = {k: v for k, v in counts.items() if k not in expected}
+            psi = None
+            if total:
+                keys = list(expected) + list(unseen)
+                psi = population_stability_index(
+                    [expected.get(k, 0.0) for k in keys],
+                    [counts[k] / total for k in keys],
+                )
+            features[name] = {
+                "type": "categorical",
+                "psi": psi,
+                "status": drift_status(psi),
+                "reference": expected,
+                "current": {k: v / total for k, v in counts.items()} if total else None,
+                # Categories the OneHotEncoder ignores at prediction time
+                "unseen_categories": unseen,
+                "unseen_rate": sum(unseen.values()) / total if total else None,
+                "count": total,
+            }
+        return {
+            "reference_available": bool(self.edges or self.category_counts),
+            "reference_created": self.reference.get("created"),
+            "reference_rows": self.reference.get("n_rows"),
+            "observed_since": self.started,
+            "n_observed": self.n_observed,
+            "features": features,
+        }
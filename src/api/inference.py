@@ -1,33 +1,143 @@
+import os
+import threading
+import time
 import joblib
+import numpy as np
 import pandas as pd
 from datetime import datetime
+import bundle as bundle_format
+from bundle import ServingBundle
+from price_index import PriceIndex
+from prediction_cube import CubeManager, bundle_fingerprint, file_fingerprint
 from schemas import HousePredictionRequest, PredictionResponse
 
 # Load model and preprocessor
 MODEL_PATH = "models/trained/house_price_model.pkl"
 PREPROCESSOR_PATH = "models/trained/preprocessor.pkl"
+# Self-contained bundle exported by train_model.py; preferred over the pickles when present
+BUNDLE_PATH = os.getenv("MODEL_BUNDLE_PATH", "models/trained/house_price_model.npz")
+# price_per_sqft estimates by location and condition, for the pickle path (bundles embed their own)
+PRICE_INDEX_PATH = os.getenv("PRICE_INDEX_PATH", "models/trained/price_index.json")
 
+# Anytime prediction for /predict with a random forest bundle: stop adding trees
+# once the running mean's standard error is within ANYTIME_MAX_RELATIVE_SE of it
+# (e.g. 0.005) or ANYTIME_BUDGET_MS has passed. Both 0 (the default) = every tree.
+ANYTIME_MAX_RELATIVE_SE = float(os.getenv("ANYTIME_MAX_RELATIVE_SE", "0"))
+ANYTIME_BUDGET_MS = float(os.getenv("ANYTIME_BUDGET_MS", "0"))
+ANYTIME_BLOCK_TREES = int(os.getenv("ANYTIME_BLOCK_TREES", bundle_format.ANYTIME_BLOCK_TREES))
+ANYTIME_MIN_TREES = int(os.getenv("ANYTIME_MIN_TREES", bundle_format.ANYTIME_MIN_TREES))
+# Precomputed predictions for every input the UI can send (see prediction_cube.py);
+# set PREDICTION_CUBE_PATH="" to disable
+PREDICTION_CUBE_PATH = os.getenv("PREDICTION_CUBE_PATH", "models/trained/prediction_cube.npy")
+
+bundle = None
+model = None
+preprocessor = None
+price_index = None
 try:
-    model = joblib.load(MODEL_PATH)
-    preprocessor = joblib.load(PREPROCESSOR_PATH)
+    if os.path.exists(BUNDLE_PATH):
+        bundle = ServingBundle.load(BUNDLE_PATH)
+    else:
+        model = joblib.load(MODEL_PATH)
+        preprocessor = joblib.load(PREPROCESSOR_PATH)
+        if os.path.exists(PRICE_INDEX_PATH):
+            price_index = PriceIndex.from_file(PRICE_INDEX_PATH)
 except Exception as e:
     raise RuntimeError(f"Error loading model or preprocessor: {str(e)}")
 
+# The cube is only used when it was built from exactly the model being served
+model_fingerprint = (bundle_fingerprint(bundle) if bundle is not None
+                     else file_fingerprint([MODEL_PATH, PREPROCESSOR_PATH, PRICE_INDEX_PATH]))
+cube_manager = CubeManager(PREDICTION_CUBE_PATH, model_fingerprint)
+
+anytime_enabled = (bundle is not None and bundle.supports_anytime
+                   and (ANYTIME_MAX_RELATIVE_SE > 0 or ANYTIME_BUDGET_MS > 0))
+_anytime_lock = threading.Lock()
+_anytime_counts = {"requests": 0, "trees_used": 0, "stopped_early": 0}
+
+def anytime_stats() -> dict:
+    """Trees used by anytime /predict calls so far."""
+    with _anytime_lock:
+        counts = dict(_anytime_counts)
+    return {
+        "enabled": anytime_enabled,
+        "max_relative_se": ANYTIME_MAX_RELATIVE_SE,
+        "budget_ms": ANYTIME_BUDGET_MS,
+        "block_trees": ANYTIME_BLOCK_TREES,
+        "min_trees": ANYTIME_MIN_TREES,
+        "n_trees": bundle.n_trees if bundle is not None else None,
+        **counts,
+        "mean_trees_used": round(counts["trees_used"] / counts["requests"], 2) if counts["requests"] else None,
+    }
+
+def _predict_frame_anytime(input_data: pd.DataFrame, deadline):
+    """Like _predict_frame, but with as few of the bundle's trees as the limits allow."""
+    X = bundle.transform(bundle.add_derived_features(input_data))
+    predictions, trees_used = bundle.predict_anytime(
+        X, ANYTIME_MAX_RELATIVE_SE, ANYTIME_BLOCK_TREES, ANYTIME_MIN_TREES, deadline
+    )
+    with _anytime_lock:
+        _anytime_counts["requests"] += 1
+        _anytime_counts["trees_used"] += trees_used
+        _anytime_counts["stopped_early"] += int(trees_used < bundle.n_trees)
+    return predictions, trees_used
+
+def _model_predict_frame(input_data: pd.DataFrame):
+    """Derive features, preprocess and predict with whichever artifact is loaded."""
+    if bundle is not None:
+        return bundle.predict_frame(input_data)
+    input_data['house_age'] = datetime.now().year - input_data['year_built']
+    input_data['bed_bath_ratio'] = input_data['bedrooms'] / input_data['bathrooms']
+    if price_index is not None:
+        input_data['price_per_sqft'] = price_index.lookup(input_data['location'], input_data['condition'])
+    else:
+        input_data['price_per_sqft'] = 0  # Dummy value for compatibility
+
+    # Preprocess input data
+    processed_features = preprocessor.transform(input_data)
+
+    # Make prediction
+    return model.predict(processed_features)
+
+def _predict_frame(input_data: pd.DataFrame):
+    """Predictions from the cube where the inputs are on its grid, from the model elsewhere."""
+    predictions, hit = cube_manager.lookup_frame(input_data)
+    if not hit.all():
+        misses = input_data[~hit].reset_index(drop=True)
+        predictions[~hit] = _model_predict_frame(misses)
+    return predictions
+
+def rebuild_prediction_cube(should_yield):
+    """Coroutine that scores the cube with the loaded model, pausing while `should_yield()`."""
+    return cube_manager.rebuild(
+        lambda frame: np.asarray(_model_predict_frame(frame), dtype=np.float64), should_yield
+    )
+
+def predict_dataframe(input_data: pd.DataFrame) -> np.ndarray:
+    """
+    Predictions for a frame of raw request fields, e.g. a chunk of a batch job.
+    """
+    return np.asarray(_predict_frame(input_data), dtype=np.float64)
+
 def predict_price(request: HousePredictionRequest) -> PredictionResponse:
     """
     Predict house price based on input features.
     """
+    start = time.perf_counter()
     # Prepare input data
     input_data = pd.DataFrame([request.dict()])
-    input_data['house_age'] = datetime.now().year - input_data['year_built']
-    input_data['bed_bath_ratio'] = input_data['bedrooms'] / input_data['bathrooms']
-    input_data['price_per_sqft'] = 0  # Dummy value for compatibility
-
-    # Preprocess input data
-    processed_features = preprocessor.transform(input_data)
 
     # Make prediction
-    predicted_price = model.predict(processed_features)[0]
+    trees_used = None
+    cached, hit = cube_manager.lookup_frame(input_data)
+    if hit[0]:
+        predicted_price = cached[0]
+    elif anytime_enabled:
+        deadline = start + ANYTIME_BUDGET_MS / 1000 if ANYTIME_BUDGET_MS > 0 else None
+        predictions, trees_used = _predict_frame_anytime(input_data, deadline)
+        predicted_price = predictions[0]
+    else:
+        predicted_price = _model_predict_frame(input_data)[0]
 
     # Convert numpy.float32 to Python float and round to 2 decimal places
     predicted_price = round(float(predicted_price), 2)
@@ -42,7 +152,8 @@ def predict_price(request: HousePredictionRequest) -> PredictionResponse:
         predicted_price=predicted_price,
         confidence_interval=confidence_interval,
         features_importance={},
-        prediction_time=datetime.now().isoformat()
+        prediction_time=datetime.now().isoformat(),
+        trees_used=trees_used
     )
 
 def batch_predict(requests: list[HousePredictionRequest]) -> list[float]:
@@ -50,13 +161,7 @@ def batch_predict(requests: list[HousePredictionRequest]) -> list[float]:
     Perform batch predictions.
     """
     input_data = pd.DataFrame([req.dict() for req in requests])
-    input_data['house_age'] = datetime.now().year - input_data['year_built']
-    input_data['bed_bath_ratio'] = input_data['bedrooms'] / input_data['bathrooms']
-    input_data['price_per_sqft'] = 0  # Dummy value for compatibility
-
-    # Preprocess input data
-    processed_features = preprocessor.transform(input_data)
 
     # Make predictions
-    predictions = model.predict(processed_features)
+    predictions = _predict_frame(input_data)
     return predictions.tolist()
\ No newline at end of file
@@ -1,7 +1,109 @@
-from fastapi import FastAPI
+import os
+import time
+from contextlib import asynccontextmanager
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from inference import predict_price, batch_predict
+from fastapi.responses import FileResponse, JSONResponse
+from inference import predict_price, batch_predict, predict_dataframe, anytime_stats
+from inference import cube_manager, rebuild_prediction_cube
 from schemas import HousePredictionRequest, PredictionResponse
+from drift import DriftMonitor
+import request_log
+from request_log import RequestLogger
+from admission import AdmissionController, Overloaded
+import batch_jobs
+from batch_jobs import BatchJobManager, JobRejected, field_checks
+
+# Reference statistics written by feature engineering and shipped with the model
+DRIFT_REFERENCE_PATH = os.getenv("DRIFT_REFERENCE_PATH", "models/trained/drift_reference.json")
+drift_monitor = DriftMonitor.from_file(DRIFT_REFERENCE_PATH)
+
+# Request/response log for replay, auditing and retraining; set REQUEST_LOG_PATH="" to disable
+REQUEST_LOG_PATH = os.getenv("REQUEST_LOG_PATH", "logs/requests.jsonl")
+request_logger = RequestLogger(
+    REQUEST_LOG_PATH,
+    capacity=int(os.getenv("REQUEST_LOG_CAPACITY", request_log.REQUEST_LOG_CAPACITY)),
+    batch_size=int(os.getenv("REQUEST_LOG_BATCH_SIZE", request_log.REQUEST_LOG_BATCH_SIZE)),
+    flush_interval_s=float(os.getenv("REQUEST_LOG_FLUSH_INTERVAL_S", request_log.REQUEST_LOG_FLUSH_INTERVAL_S)),
+    max_bytes=int(os.getenv("REQUEST_LOG_MAX_BYTES", request_log.REQUEST_LOG_MAX_BYTES)),
+    max_age_s=float(os.getenv("REQUEST_LOG_MAX_AGE_S", request_log.REQUEST_LOG_MAX_AGE_S)),
+    compress=os.getenv("REQUEST_LOG_COMPRESS", "1") != "0",
+) if REQUEST_LOG_PATH else None
+
+# Admission control: predictions run in a worker thread, at most ADMISSION_MAX_CONCURRENCY
+# at a time; requests that would wait longer than their latency budget are shed.
+# /predict (priority 0) is served before /batch-predict (priority 1).
+admission = AdmissionController(int(os.getenv("ADMISSION_MAX_CONCURRENCY", "2")))
+admission.add_endpoint(
+    "/predict",
+    priority=0,
+    max_concurrency=int(os.getenv("PREDICT_MAX_CONCURRENCY", "2")),
+    max_queue=int(os.getenv("PREDICT_MAX_QUEUE", "64")),
+    latency_budget_s=float(os.getenv("PREDICT_LATENCY_BUDGET_MS", "500")) / 1000,
+    initial_service_s=0.01,
+)
+admission.add_endpoint(
+    "/batch-predict",
+    priority=1,
+    max_concurrency=int(os.getenv("BATCH_MAX_CONCURRENCY", "1")),
+    max_queue=int(os.getenv("BATCH_MAX_QUEUE", "8")),
+    latency_budget_s=float(os.getenv("BATCH_LATENCY_BUDGET_MS", "2000")) / 1000,
+    initial_service_s=0.1,
+)
+# Chunks of background batch jobs (priority 2) only get slots no request is waiting for
+admission.add_endpoint(
+    "/jobs",
+    priority=2,
+    max_concurrency=int(os.getenv("BATCH_JOBS_CHUNK_CONCURRENCY", "1")),
+    max_queue=int(os.getenv("BATCH_JOBS_MAX_RUNNING", batch_jobs.BATCH_JOBS_MAX_RUNNING)),
+    latency_budget_s=float(os.getenv("BATCH_JOBS_CHUNK_BUDGET_MS", "30000")) / 1000,
+    initial_service_s=0.2,
+)
+
+# Set PREDICTION_CUBE_REBUILD=0 to serve without a cube rather than build one at startup
+PREDICTION_CUBE_REBUILD = os.getenv("PREDICTION_CUBE_REBUILD", "1") != "0"
+
+# Large scoring jobs: uploaded CSVs are scored in chunks in the background and
+# results kept on local disk under BATCH_JOB_DIR for BATCH_JOBS_TTL_S seconds
+job_manager = BatchJobManager(
+    os.getenv("BATCH_JOB_DIR", "jobs"),
+    score_frame=predict_dataframe,
+    required_columns=HousePredictionRequest.model_fields.keys(),
+    checks=field_checks(HousePredictionRequest.model_json_schema()),
+    admission=admission,
+    endpoint="/jobs",
+    max_running=int(os.getenv("BATCH_JOBS_MAX_RUNNING", batch_jobs.BATCH_JOBS_MAX_RUNNING)),
+    max_queued=int(os.getenv("BATCH_JOBS_MAX_QUEUED", batch_jobs.BATCH_JOBS_MAX_QUEUED)),
+    chunk_rows=int(os.getenv("BATCH_JOBS_CHUNK_ROWS", batch_jobs.BATCH_JOBS_CHUNK_ROWS)),
+    # A chunk holds a slot /predict may be waiting for: keep it well inside /predict's budget
+    chunk_target_s=float(os.getenv(
+        "BATCH_JOBS_CHUNK_TARGET_MS", admission.policies["/predict"].latency_budget_s * 1000 / 2
+    )) / 1000,
+    ttl_s=float(os.getenv("BATCH_JOBS_TTL_S", batch_jobs.BATCH_JOBS_TTL_S)),
+    max_upload_bytes=int(os.getenv("BATCH_JOBS_MAX_UPLOAD_BYTES", batch_jobs.BATCH_JOBS_MAX_UPLOAD_BYTES)),
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Flush the request log in the background while serving, and drain it on shutdown
+    if request_logger is not None:
+        request_logger.start()
+    job_manager.start()
+    # A cube missing or built from another model is rebuilt in the background;
+    # until it's ready every request goes to the model
+    cube_task = None
+    if PREDICTION_CUBE_REBUILD and cube_manager.needs_rebuild:
+        # Outside admission control: its own thread, paused whenever requests are queued
+        cube_task = asyncio.create_task(rebuild_prediction_cube(admission.has_waiters))
+    yield
+    if cube_task is not None:
+        cube_task.cancel()
+        await asyncio.gather(cube_task, return_exceptions=True)
+    await job_manager.stop()
+    if request_logger is not None:
+        await request_logger.stop()
 
 # Initialize FastAPI app with metadata
 app = FastAPI(
@@ -12,6 +114,7 @@ app = FastAPI(
         "Authored by Gourav Shah."
     ),
     version="1.0.0",
+    lifespan=lifespan,
     contact={
         "name": "School of Devops",
         "url": "https://schoolofdevops.com",
@@ -32,7 +135,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Health check endpoint
+# Shed requests get a fast answer telling the client when to come back
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": f"Server overloaded: {exc.reason}", "endpoint": exc.endpoint},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(JobRejected)
+async def job_rejected_handler(request: Request, exc: JobRejected):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.reason})
+
+# Health check endpoint (never subject to admission control, so probes stay fast)
 @app.get("/health", response_model=dict)
 async def health_check():
     return {"status": "healthy", "model_loaded": True}
@@ -40,9 +156,89 @@ async def health_check():
 # Prediction endpoint
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(request: HousePredictionRequest):
-    return predict_price(request)
+    start = time.perf_counter()
+    async with admission.admit("/predict"):
+        response = await run_in_threadpool(predict_price, request)
+    drift_monitor.observe_request(request)
+    if request_logger is not None:
+        request_logger.log("/predict", request.dict(), response.dict(), (time.perf_counter() - start) * 1000)
+    return response
 
 # Batch prediction endpoint
 @app.post("/batch-predict", response_model=list)
 async def batch_predict_endpoint(requests: list[HousePredictionRequest]):
-    return batch_predict(requests)
\ No newline at end of file
+    start = time.perf_counter()
+    async with admission.admit("/batch-predict"):
+        predictions = await run_in_threadpool(batch_predict, requests)
+    for request in requests:
+        drift_monitor.observe_request(request)
+    if request_logger is not None:
+        request_logger.log(
+            "/batch-predict",
+            [request.dict() for request in requests],
+            predictions,
+            (time.perf_counter() - start) * 1000,
+        )
+    return predictions
+
+# Feature drift of live requests against the training data
+@app.get("/drift", response_model=dict)
+async def drift_report():
+    return drift_monitor.report()
+
+# Start a fresh observation window, e.g. after deploying a retrained model
+@app.post("/drift/reset", response_model=dict)
+async def drift_reset():
+    drift_monitor.reset()
+    return {"status": "reset", "observed_since": drift_monitor.started}
+
+# Request log throughput and drop counters
+@app.get("/request-log/stats", response_model=dict)
+async def request_log_stats():
+    if request_logger is None:
+        return {"enabled": False}
+    return {"enabled": True, **request_logger.stats()}
+
+# Admission control counters, including shed requests per endpoint
+@app.get("/admission/stats", response_model=dict)
+async def admission_stats():
+    return admission.stats()
+
+# Prediction cube status, build progress and hit rate
+@app.get("/prediction-cube/stats", response_model=dict)
+async def prediction_cube_stats():
+    return cube_manager.stats()
+
+# Trees used by anytime /predict calls (see ANYTIME_* in inference.py)
+@app.get("/anytime/stats", response_model=dict)
+async def anytime_stats_endpoint():
+    return anytime_stats()
+
+
+# -----------------------------
+# Background batch jobs
+# -----------------------------
+# Submit a CSV (header with the /predict fields, optional id column) as the raw request body
+@app.post("/jobs", response_model=dict, status_code=202)
+async def submit_job(request: Request):
+    job = await job_manager.submit(request.stream())
+    return job.to_dict()
+
+@app.get("/jobs/stats", response_model=dict)
+async def job_stats():
+    return job_manager.stats()
+
+# Status and progress of a job
+@app.get("/jobs/{job_id}", response_model=dict)
+async def job_status(job_id: str):
+    return job_manager.get(job_id).to_dict()
+
+# CSV of row, id (if given), predicted_price and error for every input row
+@app.get("/jobs/{job_id}/results")
+async def job_results(job_id: str):
+    return FileResponse(job_manager.results_path(job_id), media_type="text/csv", filename=f"{job_id}.csv")
+
+# Cancel a running job or delete a finished one's results
+@app.delete("/jobs/{job_id}", response_model=dict)
+async def delete_job(job_id: str):
+    return job_manager.delete(job_id).to_dict()
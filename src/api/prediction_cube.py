@@ -0,0 +1,276 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("prediction-cube")
+
+# Every input the Streamlit UI (streamlit_app/app.py) can send; keep the two in sync.
+# Numeric axes are arithmetic progressions, so a value's index is (value - start) / step.
+CUBE_AXES = [
+    {"name": "sqft", "start": 500, "step": 50, "count": 91},
+    {"name": "bedrooms", "start": 1, "step": 1, "count": 6},
+    {"name": "bathrooms", "start": 1, "step": 0.5, "count": 7},
+    # The UI sends locations lowercased
+    {"name": "location", "values": ["urban", "suburban", "rural", "waterfront", "mountain"]},
+    {"name": "year_built", "start": 1900, "step": 1, "count": 126},
+    {"name": "condition", "values": ["Good"]},
+]
+# Grid points scored per predict call while building offline
+CUBE_BATCH_ROWS = 100000
+# The API rebuilds while serving, in batches of about 0.1 s on the sample forest,
+# and waits this long whenever requests are queued before scoring the next one
+CUBE_REBUILD_BATCH_ROWS = 2000
+CUBE_YIELD_S = 0.05
+
+def cube_metadata_path(path):
+    """Metadata is kept next to the array: prediction_cube.npy -> prediction_cube.json."""
+    return os.path.splitext(path)[0] + ".json"
+
+def bundle_fingerprint(bundle):
+    """Identifies a serving bundle by its checksum."""
+    return "bundle:" + bundle.arrays["checksum"].tobytes().decode()
+
+def file_fingerprint(paths):
+    """SHA-256 over the bytes of the files the model is loaded from."""
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+def axis_values(axis):
+    if "values" in axis:
+        return np.asarray(axis["values"], dtype=object)
+    return axis["start"] + axis["step"] * np.arange(axis["count"])
+
+def cube_shape(axes):
+    return tuple(len(axis_values(axis)) for axis in axes)
+
+def grid_frame(axes, start, stop):
+    """Request fields of the grid points with flat indexes start..stop-1."""
+    indexes = np.unravel_index(np.arange(start, stop), cube_shape(axes))
+    return pd.DataFrame({axis["name"]: axis_values(axis)[idx] for axis, idx in zip(axes, indexes)})
+
+class PredictionCube:
+    """
+    Predictions for every point of a discrete input grid, stored as a
+    C-ordered float64 .npy array and memory-mapped, so only the pages that
+    are looked up get read. A request on the grid is answered by computing its
+    flat index; anything else is a miss for the model to score.
+
+    The metadata records the model fingerprint and the year the cube was
+    built in, since house_age depends on the current year.
+    """
+
+    def __init__(self, values, metadata):
+        self.values = values
+        self.metadata = metadata
+        self.axes = metadata["axes"]
+        self.shape = cube_shape(self.axes)
+        if tuple(values.shape) != self.shape:
+            raise ValueError(f"Prediction cube has shape {values.shape}, expected {self.shape}")
+        self.strides = np.array([int(np.prod(self.shape[i + 1:])) for i in range(len(self.shape))], dtype=np.int64)
+        # Category axes are matched exactly, as the model sees them
+        self.category_index = {
+            axis["name"]: pd.Index(axis["values"]) for axis in self.axes if "values" in axis
+        }
+
+    @classmethod
+    def load(cls, path):
+        with open(cube_metadata_path(path)) as f:
+            metadata = json.load(f)
+        return cls(np.load(path, mmap_mode="r"), metadata)
+
+    def is_current(self, fingerprint):
+        return self.metadata["fingerprint"] == fingerprint and self.metadata["year"] == datetime.now().year
+
+    def lookup_frame(self, frame):
+        """
+        (predictions, hit mask) for a frame of request fields. Predictions are
+        only meaningful where the mask is True.
+        """
+        n_rows = len(frame)
+        hit = np.ones(n_rows, dtype=bool)
+        if self.metadata["year"] != datetime.now().year:
+            # Built last year: every house_age is off by at least one
+            return np.zeros(n_rows), ~hit
+        flat = np.zeros(n_rows, dtype=np.int64)
+        for axis, stride in zip(self.axes, self.strides):
+            column = np.asarray(frame[axis["name"]])
+            if "values" in axis:
+                idx = self.category_index[axis["name"]].get_indexer(column.astype(str))
+                hit &= idx >= 0
+            else:
+                numbers = column.astype(np.float64)
+                with np.errstate(invalid="ignore"):
+                    idx = np.rint((numbers - axis["start"]) / axis["step"])
+                    hit &= (idx >= 0) & (idx < axis["count"])
+                    # Exactly on the grid, not merely close to it
+                    hit &= axis["start"] + axis["step"] * idx == numbers
+                idx = np.where(hit, idx, 0).astype(np.int64)
+            flat += np.where(hit, idx, 0) * stride
+        predictions = np.zeros(n_rows)
+        predictions[hit] = self.values.reshape(-1)[flat[hit]]
+        return predictions, hit
+
+class CubeBuilder:
+    """
+    Scores a grid in batches into a memory-mapped temporary file, then moves it
+    into place. Batches can be scored in any order, one call at a time.
+    """
+
+    def __init__(self, path, fingerprint, axes=CUBE_AXES, batch_rows=CUBE_BATCH_ROWS):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.axes = axes
+        self.batch_rows = batch_rows
+        self.shape = cube_shape(axes)
+        self.size = int(np.prod(self.shape))
+        self.rows_done = 0
+        self.started = time.time()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.tmp_path = f"{path}.tmp.npy"
+        self.values = np.lib.format.open_memmap(self.tmp_path, mode="w+", dtype=np.float64, shape=self.shape)
+
+    def ranges(self):
+        return [(start, min(start + self.batch_rows, self.size)) for start in range(0, self.size, self.batch_rows)]
+
+    def score(self, start, stop, predict_frame):
+        self.values.reshape(-1)[start:stop] = predict_frame(grid_frame(self.axes, start, stop))
+        self.rows_done += stop - start
+
+    def finish(self):
+        """Flush the array, write its metadata and swap both into place. Returns the loaded cube."""
+        self.values.flush()
+        del self.values
+        metadata = {
+            "fingerprint": self.fingerprint,
+            "year": datetime.now().year,
+            "axes": self.axes,
+            "size": self.size,
+            "created": datetime.now().isoformat(),
+            "build_s": round(time.time() - self.started, 2),
+        }
+        # The array goes first: a crash in between leaves the old metadata, whose fingerprint won't match
+        os.replace(self.tmp_path, self.path)
+        tmp_metadata = f"{cube_metadata_path(self.path)}.tmp"
+        with open(tmp_metadata, "w") as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(tmp_metadata, cube_metadata_path(self.path))
+        return PredictionCube.load(self.path)
+
+    def abort(self):
+        if hasattr(self, "values"):
+            del self.values
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+def build_cube(path, predict_frame, fingerprint, axes=CUBE_AXES, batch_rows=CUBE_BATCH_ROWS):
+    """Score the whole grid in this thread (the offline build step)."""
+    builder = CubeBuilder(path, fingerprint, axes, batch_rows)
+    try:
+        for start, stop in builder.ranges():
+            builder.score(start, stop, predict_frame)
+        return builder.finish()
+    except BaseException:
+        builder.abort()
+        raise
+
+class CubeManager:
+    """
+    The API's view of the cube: loads it when it matches the serving model,
+    answers lookups, rebuilds it in the background when it's missing or stale,
+    and counts hits and misses.
+
+    A rebuild scores on its own thread rather than in an admission slot, so
+    it never makes requests wait for a slot or get shed, and it pauses
+    between small batches while `should_yield()` reports queued requests.
+    """
+
+    def __init__(self, path, fingerprint, axes=CUBE_AXES, batch_rows=CUBE_REBUILD_BATCH_ROWS):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.axes = axes
+        self.batch_rows = batch_rows
+        self.cube = None
+        self.builder = None
+        self.status = "missing"
+        self.error = None
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path) and os.path.exists(cube_metadata_path(path)):
+            try:
+                cube = PredictionCube.load(path)
+                if cube.is_current(fingerprint):
+                    self.cube, self.status = cube, "ready"
+                else:
+                    self.status = "stale"
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable prediction cube {path}: {e}")
+
+    @property
+    def needs_rebuild(self):
+        return bool(self.path) and (self.cube is None or not self.cube.is_current(self.fingerprint))
+
+    def lookup_frame(self, frame):
+        """(predictions, hit mask); all misses while there is no current cube."""
+        if self.cube is None:
+            return np.zeros(len(frame)), np.zeros(len(frame), dtype=bool)
+        predictions, hit = self.cube.lookup_frame(frame)
+        n_hits = int(hit.sum())
+        self.hits += n_hits
+        self.misses += len(frame) - n_hits
+        return predictions, hit
+
+    async def rebuild(self, predict_frame, should_yield):
+        """Score the grid batch by batch in the background, then swap the new cube in."""
+        self.status, self.error = "building", None
+        builder = self.builder = CubeBuilder(self.path, self.fingerprint, self.axes, self.batch_rows)
+        logger.info(f"Building prediction cube of {builder.size} points at {self.path}")
+        loop = asyncio.get_running_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="prediction-cube")
+        try:
+            for start, stop in builder.ranges():
+                # Requests are waiting for a slot: the cube can wait
+                while should_yield():
+                    await asyncio.sleep(CUBE_YIELD_S)
+                await loop.run_in_executor(executor, builder.score, start, stop, predict_frame)
+            self.cube = await loop.run_in_executor(executor, builder.finish)
+            self.status = "ready"
+            logger.info(f"Prediction cube ready after {self.cube.metadata['build_s']} s")
+        except asyncio.CancelledError:
+            builder.abort()
+            self.status = "stale" if self.cube is not None else "missing"
+            raise
+        except Exception as e:
+            logger.exception("Prediction cube build failed")
+            builder.abort()
+            self.status, self.error = "failed", str(e)
+        finally:
+            self.builder = None
+            executor.shutdown(wait=False)
+
+    def stats(self):
+        builder = self.builder
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "status": self.status,
+            "error": self.error,
+            "points": int(np.prod(cube_shape(self.axes))),
+            "build_progress": round(builder.rows_done / builder.size, 4) if builder is not None else None,
+            "created": self.cube.metadata.get("created") if self.cube is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
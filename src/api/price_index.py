@@ -0,0 +1,56 @@
+import json
+
+import numpy as np
+
+class PriceIndex:
+    """
+    Smoothed price_per_sqft by location and condition, built at feature
+    engineering time (see build_price_index in src/features/engineer.py).
+
+    Serving can't compute price_per_sqft from the request because it needs the
+    price, so it looks up this estimate instead. `table` has one row per known
+    location plus a final row for unknown locations, and likewise one column
+    per known condition plus a final unknown column. A lookup is two
+    vectorized searches into the short sorted vocabularies and one gather.
+    """
+
+    def __init__(self, locations, conditions, table):
+        self.locations = np.asarray(locations).astype(str)
+        self.conditions = np.asarray(conditions).astype(str)
+        self.table = np.asarray(table, dtype=np.float64)
+        if self.table.shape != (len(self.locations) + 1, len(self.conditions) + 1):
+            raise ValueError(f"Price index table has shape {self.table.shape}, "
+                             f"expected {(len(self.locations) + 1, len(self.conditions) + 1)}")
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["locations"], data["conditions"], data["table"])
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        return cls(arrays[f"{prefix}_locations"], arrays[f"{prefix}_conditions"], arrays[f"{prefix}_table"])
+
+    def to_arrays(self, prefix):
+        return {
+            f"{prefix}_locations": self.locations,
+            f"{prefix}_conditions": self.conditions,
+            f"{prefix}_table": self.table,
+        }
+
+    @staticmethod
+    def _positions(vocab, values):
+        """Index of each value in the sorted `vocab`, or len(vocab) when it isn't there."""
+        values = np.asarray(values).astype(str)
+        if len(vocab) == 0:
+            return np.zeros(len(values), dtype=np.int64)
+        idx = np.searchsorted(vocab, values).clip(0, len(vocab) - 1)
+        return np.where(vocab[idx] == values, idx, len(vocab))
+
+    def lookup(self, locations, conditions):
+        """Estimated price_per_sqft for each (location, condition) pair."""
+        return self.table[self._positions(self.locations, locations), self._positions(self.conditions, conditions)]
@@ -0,0 +1,178 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger("request-log")
+
+# Defaults, overridable through environment variables in main.py
+REQUEST_LOG_CAPACITY = 10000
+REQUEST_LOG_BATCH_SIZE = 500
+REQUEST_LOG_FLUSH_INTERVAL_S = 1.0
+REQUEST_LOG_MAX_BYTES = 100 * 1024 * 1024
+REQUEST_LOG_MAX_AGE_S = 3600
+
+class RequestLogger:
+    """
+    Append-only JSON Lines log of prediction requests and responses.
+
+    `log` only appends to a bounded in-memory buffer, so endpoints never wait
+    on disk. A background task drains the buffer in batches and writes each
+    batch in a worker thread. When the buffer is full new records are dropped
+    and counted instead of blocking the request. The active file is rotated
+    once it exceeds `max_bytes` or is older than `max_age_s`; rotated files
+    are timestamped and optionally gzip-compressed.
+
+    Like the drift monitor, `log` is called from `async def` endpoints on the
+    event loop thread, so the buffer and counters need no lock.
+    """
+
+    def __init__(
+        self,
+        path,
+        capacity=REQUEST_LOG_CAPACITY,
+        batch_size=REQUEST_LOG_BATCH_SIZE,
+        flush_interval_s=REQUEST_LOG_FLUSH_INTERVAL_S,
+        max_bytes=REQUEST_LOG_MAX_BYTES,
+        max_age_s=REQUEST_LOG_MAX_AGE_S,
+        compress=True,
+    ):
+        self.path = path
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.compress = compress
+
+        self.buffer = deque()
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.rotations = 0
+        self.opened_at = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+    # -----------------------------
+    # Request path
+    # -----------------------------
+    def log(self, endpoint, request, response, latency_ms):
+        """Queue one record; never blocks. Returns False if the record was dropped."""
+        if len(self.buffer) >= self.capacity:
+            self.dropped += 1
+            return False
+        self.buffer.append({
+            "timestamp": datetime.now().isoformat(),
+            "endpoint": endpoint,
+            "latency_ms": round(latency_ms, 3),
+            "request": request,
+            "response": response,
+        })
+        self.logged += 1
+        if len(self.buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    # -----------------------------
+    # Background flushing
+    # -----------------------------
+    def start(self):
+        """Start the flush task on the running event loop."""
+        if self._task is None:
+            # Bind the event to the running loop (it may have been created before it)
+            self._wakeup = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush task once it has written whatever is still buffered."""
+        if self._task is not None:
+            # Let the task finish its current write rather than cancelling it mid-batch
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self.buffer:
+                await self.flush()
+        # Drain records logged after the last wakeup
+        while self.buffer:
+            await self.flush()
+
+    async def flush(self):
+        """Write up to one batch of buffered records to disk."""
+        batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+        if not batch:
+            return
+        try:
+            # Serializing a batch of /batch-predict records takes long enough to stall
+            # every in-flight request, so it happens in the worker thread with the write
+            await asyncio.to_thread(self._write, batch)
+            self.written += len(batch)
+        except OSError as e:
+            # Losing log records must not take the API down
+            self.write_errors += 1
+            self.dropped += len(batch)
+            logger.error(f"Failed to write {len(batch)} request log records to {self.path}: {e}")
+
+    # -----------------------------
+    # File handling (runs in a worker thread)
+    # -----------------------------
+    def _write(self, batch):
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in batch)
+        if self._should_rotate():
+            self._rotate()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self.opened_at is None:
+            self.opened_at = time.time()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def _should_rotate(self):
+        if not os.path.exists(self.path):
+            return False
+        if self.opened_at is None:
+            # A file left over from a previous process: age it from its mtime
+            self.opened_at = os.path.getmtime(self.path)
+        too_big = os.path.getsize(self.path) >= self.max_bytes
+        too_old = time.time() - self.opened_at >= self.max_age_s
+        return too_big or too_old
+
+    def _rotate(self):
+        root, ext = os.path.splitext(self.path)
+        rotated = f"{root}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{ext}"
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self.opened_at = None
+        self.rotations += 1
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "running": self._task is not None and not self._task.done(),
+            "buffered": len(self.buffer),
+            "capacity": self.capacity,
+            "logged": self.logged,
+            "written": self.written,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+            "rotations": self.rotations,
+        }
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 
 class HousePredictionRequest(BaseModel):
     sqft: float = Field(..., gt=0, description="Square footage of the house")
@@ -13,4 +13,6 @@ class PredictionResponse(BaseModel):
     predicted_price: float
     confidence_interval: List[float]
     features_importance: dict
-    prediction_time: str
\ No newline at end of file
+    prediction_time: str
+    # Trees averaged for this prediction when anytime prediction is on
+    trees_used: Optional[int] = None
\ No newline at end of file
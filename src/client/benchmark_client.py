@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import time
+import urllib.request
+
+import numpy as np
+
+from price_client import PriceClient, AsyncPriceClient, DEFAULT_BASE_URL, DEFAULT_BATCH_SIZE
+
+# -----------------------------
+# Configure logging
+# -----------------------------
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+# httpx logs every request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+LOCATIONS = ["urban", "suburban", "rural", "waterfront", "mountain"]
+
+# -----------------------------
+# Argument parser
+# -----------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare prediction throughput of one plain HTTP request per house "
+                    "against the pooled, batching client in price_client.py."
+    )
+    parser.add_argument("--url", type=str, default=DEFAULT_BASE_URL, help="Base URL of a running prediction API")
+    parser.add_argument("--rows", type=int, default=5000, help="Houses to price in each client mode")
+    parser.add_argument("--naive-rows", type=int, default=300,
+                        help="Houses to price one plain request at a time (slow, so fewer)")
+    parser.add_argument("--callers", type=int, default=32,
+                        help="Threads or coroutines calling predict/predict_price at once")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per /batch-predict call")
+    parser.add_argument("--output", type=str, default="models/benchmark/client_benchmark.json",
+                        help="Path to write the JSON report")
+    return parser.parse_args()
+
+def random_houses(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "sqft": float(rng.integers(10, 100) * 50),
+            "bedrooms": int(rng.integers(1, 7)),
+            "bathrooms": float(rng.integers(2, 9) / 2),
+            "location": LOCATIONS[rng.integers(len(LOCATIONS))],
+            "year_built": int(rng.integers(1900, 2024)),
+            "condition": "Good",
+        }
+        for _ in range(n)
+    ]
+
+# -----------------------------
+# Modes
+# -----------------------------
+def naive(url, houses):
+    """One new connection and one /predict request per house, like a curl loop."""
+    prices = []
+    for house in houses:
+        request = urllib.request.Request(f"{url}/predict", data=json.dumps(house).encode(),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            prices.append(json.load(response)["predicted_price"])
+    return prices
+
+def pooled_predict(client, houses, callers):
+    """PriceClient.predict per house from `callers` threads: pooled connections, no batching."""
+    with concurrent.futures.ThreadPoolExecutor(callers) as pool:
+        return [r.predicted_price for r in pool.map(client.predict, houses)]
+
+def grouped_predict_price(client, houses, callers):
+    """PriceClient.predict_price per house from `callers` threads, grouped into /batch-predict calls."""
+    with concurrent.futures.ThreadPoolExecutor(callers) as pool:
+        return list(pool.map(client.predict_price, houses))
+
+async def async_predict_price(url, houses, callers, batch_size):
+    """AsyncPriceClient.predict_price per house from `callers` coroutines."""
+    async with AsyncPriceClient(url, batch_size=batch_size) as client:
+        results = [None] * len(houses)
+        positions = iter(range(len(houses)))
+
+        async def caller():
+            for i in positions:
+                results[i] = await client.predict_price(houses[i])
+
+        await asyncio.gather(*(caller() for _ in range(callers)))
+        return results
+
+def timed(fn, n_rows):
+    start = time.perf_counter()
+    prices = fn()
+    elapsed = time.perf_counter() - start
+    return prices, {"rows": n_rows, "seconds": round(elapsed, 3), "rows_per_sec": round(n_rows / elapsed, 1)}
+
+# -----------------------------
+# Main logic
+# -----------------------------
+def main(args):
+    url = args.url.rstrip("/")
+    houses = random_houses(args.rows)
+    naive_houses = houses[:args.naive_rows]
+
+    report = {"url": url, "callers": args.callers, "batch_size": args.batch_size, "modes": {}}
+    naive_prices, report["modes"]["naive_per_request"] = timed(lambda: naive(url, naive_houses), len(naive_houses))
+    with PriceClient(url, batch_size=args.batch_size) as client:
+        client.health()  # open a pooled connection before timing
+        results = {
+            "pooled_predict": timed(lambda: pooled_predict(client, houses, args.callers), len(houses)),
+            "predict_batch": timed(lambda: client.predict_batch(houses), len(houses)),
+            "grouped_predict_price": timed(lambda: grouped_predict_price(client, houses, args.callers), len(houses)),
+        }
+    results["async_predict_price"] = timed(
+        lambda: asyncio.run(async_predict_price(url, houses, args.callers, args.batch_size)), len(houses)
+    )
+
+    naive_rate = report["modes"]["naive_per_request"]["rows_per_sec"]
+    for mode, (prices, stats) in results.items():
+        # Every mode must return the same prices, in input order
+        matches = np.allclose(np.round(prices[:len(naive_prices)], 2), naive_prices)
+        report["modes"][mode] = {**stats, "speedup_vs_naive": round(stats["rows_per_sec"] / naive_rate, 1),
+                                 "matches_naive": bool(matches)}
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for mode, stats in report["modes"].items():
+        logger.info(f"{mode}: {stats['rows_per_sec']:,.0f} rows/sec"
+                    + (f" ({stats['speedup_vs_naive']}x naive)" if "speedup_vs_naive" in stats else ""))
+    logger.info(f"Saved client benchmark to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,284 @@
+import asyncio
+import concurrent.futures
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+import httpx
+
+# Request and response models are the API's own, so client and server can't drift apart
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from schemas import HousePredictionRequest, PredictionResponse  # noqa: E402
+
+# Defaults, overridable per client
+DEFAULT_BASE_URL = os.getenv("API_URL", "http://localhost:8000")
+DEFAULT_TIMEOUT_S = 10.0
+# Connections kept open to the API, and requests in flight at once
+DEFAULT_MAX_CONNECTIONS = 8
+DEFAULT_MAX_CONCURRENCY = 4
+# Rows per /batch-predict call, and how long predict_price waits for company
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_LINGER_MS = 5.0
+# Retries of 429/503 responses and connection errors, with exponential backoff
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_S = 0.1
+DEFAULT_MAX_BACKOFF_S = 5.0
+
+RETRY_STATUS_CODES = {429, 503}
+
+class PriceAPIError(Exception):
+    """A request the API rejected, or kept shedding after every retry."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+def as_request(request):
+    """A HousePredictionRequest from a model instance or a plain dict."""
+    if isinstance(request, HousePredictionRequest):
+        return request
+    return HousePredictionRequest.model_validate(request)
+
+def retry_delay(attempt, response, backoff_s, max_backoff_s):
+    """Seconds to wait before retry `attempt` (0-based): the server's Retry-After, else jittered backoff."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), max_backoff_s)
+        except ValueError:
+            pass
+    return min(backoff_s * 2 ** attempt, max_backoff_s) * random.uniform(0.5, 1.0)
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _decode(response):
+    if response.status_code >= 400:
+        try:
+            detail = response.json().get("detail")
+        except ValueError:
+            detail = response.text
+        raise PriceAPIError(response.status_code, detail)
+    return response.json()
+
+# -----------------------------
+# Synchronous client
+# -----------------------------
+class PriceClient:
+    """
+    Thread-safe client for the prediction API over a pooled keep-alive
+    connection. `predict_batch` splits rows into /batch-predict calls sent
+    `max_concurrency` at a time. `predict_price` can be called from many
+    threads: a background thread groups the waiting calls into /batch-predict
+    requests of up to `batch_size` rows.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, timeout_s=DEFAULT_TIMEOUT_S,
+                 max_connections=DEFAULT_MAX_CONNECTIONS, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 batch_size=DEFAULT_BATCH_SIZE, linger_ms=DEFAULT_LINGER_MS, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_s=DEFAULT_BACKOFF_S, max_backoff_s=DEFAULT_MAX_BACKOFF_S):
+        self.http = httpx.Client(
+            base_url=base_url.rstrip("/"),
+            timeout=timeout_s,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self.batch_size = batch_size
+        self.linger_s = linger_ms / 1000
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_concurrency, thread_name_prefix="price-client")
+        self._pending = queue.Queue()
+        self._batcher = None
+        self._batcher_lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._closed = True
+        if self._batcher is not None:
+            self._pending.put(None)
+            self._batcher.join()
+        self.executor.shutdown(wait=True)
+        self.http.close()
+
+    def _post(self, path, payload):
+        """POST with retries on 429/503 and connection errors."""
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = self.http.post(path, json=payload)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return _decode(response)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            if attempt < self.max_retries:
+                time.sleep(retry_delay(attempt, response, self.backoff_s, self.max_backoff_s))
+        return _decode(response)
+
+    def health(self):
+        return _decode(self.http.get("/health"))
+
+    def predict(self, request):
+        """POST /predict for one house; returns the full PredictionResponse."""
+        return PredictionResponse.model_validate(self._post("/predict", as_request(request).model_dump()))
+
+    def predict_batch(self, requests):
+        """Predicted prices for any number of houses, in input order."""
+        rows = [as_request(r).model_dump() for r in requests]
+        futures = [self.executor.submit(self._post, "/batch-predict", chunk) for chunk in chunks(rows, self.batch_size)]
+        return [price for future in futures for price in future.result()]
+
+    def predict_price(self, request):
+        """Predicted price for one house, sent in a /batch-predict call together with other waiting calls."""
+        if self._closed:
+            raise RuntimeError("Client is closed")
+        future = concurrent.futures.Future()
+        self._pending.put((as_request(request).model_dump(), future))
+        with self._batcher_lock:
+            if self._batcher is None:
+                self._batcher = threading.Thread(target=self._batch_loop, name="price-client-batcher", daemon=True)
+                self._batcher.start()
+        return future.result()
+
+    def _batch_loop(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.linger_s
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._pending.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._pending.put(None)  # seen again by the outer loop once this batch is sent
+                    break
+                batch.append(item)
+            self.executor.submit(self._send_batch, batch)
+
+    def _send_batch(self, batch):
+        try:
+            prices = self._post("/batch-predict", [row for row, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), price in zip(batch, prices):
+            future.set_result(price)
+
+# -----------------------------
+# Asyncio client
+# -----------------------------
+class AsyncPriceClient:
+    """
+    asyncio version of PriceClient. Concurrent `predict_price` calls are
+    grouped into /batch-predict requests of up to `batch_size` rows, waiting at
+    most `linger_ms` for a batch to fill; at most `max_concurrency` requests
+    are in flight at once.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, timeout_s=DEFAULT_TIMEOUT_S,
+                 max_connections=DEFAULT_MAX_CONNECTIONS, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 batch_size=DEFAULT_BATCH_SIZE, linger_ms=DEFAULT_LINGER_MS, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_s=DEFAULT_BACKOFF_S, max_backoff_s=DEFAULT_MAX_BACKOFF_S):
+        self.http = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            timeout=timeout_s,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self.batch_size = batch_size
+        self.linger_s = linger_ms / 1000
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending = []
+        self._flush_timer = None
+        self._in_flight = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """Send whatever is still waiting for a batch, then close the connections."""
+        if self._pending:
+            self._flush()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        await self.http.aclose()
+
+    async def _post(self, path, payload):
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                response = None
+                try:
+                    response = await self.http.post(path, json=payload)
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        return _decode(response)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                if attempt < self.max_retries:
+                    await asyncio.sleep(retry_delay(attempt, response, self.backoff_s, self.max_backoff_s))
+            return _decode(response)
+
+    async def health(self):
+        return _decode(await self.http.get("/health"))
+
+    async def predict(self, request):
+        """POST /predict for one house; returns the full PredictionResponse."""
+        return PredictionResponse.model_validate(await self._post("/predict", as_request(request).model_dump()))
+
+    async def predict_batch(self, requests):
+        """Predicted prices for any number of houses, in input order."""
+        rows = [as_request(r).model_dump() for r in requests]
+        results = await asyncio.gather(*(self._post("/batch-predict", chunk) for chunk in chunks(rows, self.batch_size)))
+        return [price for prices in results for price in prices]
+
+    async def predict_price(self, request):
+        """Predicted price for one house, sent in a /batch-predict call together with other waiting calls."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((as_request(request).model_dump(), future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(self.linger_s, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send_batch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send_batch(self, batch):
+        try:
+            prices = await self._post("/batch-predict", [row for row, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), price in zip(batch, prices):
+            if not future.done():
+                future.set_result(price)
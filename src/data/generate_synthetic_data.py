@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('data-generator')
+
+COLUMNS = ['price', 'sqft', 'bedrooms', 'bathrooms', 'location', 'year_built', 'condition']
+# Modelled jointly as a Gaussian, price and sqft on a log scale
+NUMERIC_COLUMNS = ['price', 'sqft', 'bedrooms', 'bathrooms', 'year_built']
+LOG_COLUMNS = ['price', 'sqft']
+# Columns that can be blanked out; a missing target is not realistic
+MISSING_VALUE_COLUMNS = ['sqft', 'bedrooms', 'bathrooms', 'location', 'year_built', 'condition']
+
+def fit_distribution(df, smoothing=0.0, shrinkage=5.0):
+    """
+    Fit a generative model of the raw housing data.
+
+    (location, condition) pairs are drawn from their empirical joint frequencies,
+    so combinations that never occur (e.g. Urban/Poor) are not generated unless
+    `smoothing` > 0. Numeric columns are multivariate normal around a per-pair
+    mean, shrunk towards the global mean for rare pairs, with a pooled
+    within-pair covariance that keeps e.g. the price/sqft correlation.
+    """
+    df = df.dropna(subset=COLUMNS)
+    values = df[NUMERIC_COLUMNS].astype(float).copy()
+    for column in LOG_COLUMNS:
+        values[column] = np.log(values[column])
+
+    locations = sorted(df['location'].unique())
+    conditions = sorted(df['condition'].unique())
+    counts = pd.crosstab(df['location'], df['condition']).reindex(
+        index=locations, columns=conditions, fill_value=0
+    ).to_numpy(dtype=float)
+    joint = (counts + smoothing) / (counts + smoothing).sum()
+
+    global_mean = values.mean().to_numpy()
+    means = np.tile(global_mean, (len(locations), len(conditions), 1))
+    residuals = []
+    for (location, condition), group in values.groupby([df['location'], df['condition']]):
+        i, j = locations.index(location), conditions.index(condition)
+        n = len(group)
+        means[i, j] = (n * group.mean().to_numpy() + shrinkage * global_mean) / (n + shrinkage)
+        residuals.append(group.to_numpy() - group.mean().to_numpy())
+    residuals = np.vstack(residuals)
+    covariance = np.cov(residuals, rowvar=False)
+    # Small ridge so the Cholesky factor exists even for degenerate columns
+    covariance += np.eye(len(NUMERIC_COLUMNS)) * 1e-6
+
+    return {
+        'locations': locations,
+        'conditions': conditions,
+        'joint': joint,
+        'means': means,
+        'cholesky': np.linalg.cholesky(covariance),
+        'year_min': int(df['year_built'].min()),
+    }
+
+def sample_rows(dist, n_rows, rng, missing_rate=0.0, outlier_rate=0.0):
+    """Draw `n_rows` synthetic rows, then inject missing values and price outliers."""
+    locations, conditions = dist['locations'], dist['conditions']
+    cells = rng.choice(dist['joint'].size, size=n_rows, p=dist['joint'].ravel())
+    loc_idx, cond_idx = np.divmod(cells, len(conditions))
+
+    noise = rng.standard_normal((n_rows, len(NUMERIC_COLUMNS))) @ dist['cholesky'].T
+    numeric = dist['means'][loc_idx, cond_idx] + noise
+    col = {name: numeric[:, k] for k, name in enumerate(NUMERIC_COLUMNS)}
+
+    current_year = datetime.now().year
+    df = pd.DataFrame({
+        'price': np.round(np.exp(col['price']), -3),
+        'sqft': np.round(np.exp(col['sqft'])),
+        'bedrooms': np.clip(np.round(col['bedrooms']), 1, None),
+        'bathrooms': np.clip(np.round(col['bathrooms'] * 2) / 2, 1, None),
+        'location': np.asarray(locations, dtype=object)[loc_idx],
+        'year_built': np.clip(np.round(col['year_built']), dist['year_min'] - 50, current_year),
+        'condition': np.asarray(conditions, dtype=object)[cond_idx],
+    })
+
+    # Outliers far outside the IQR fences, so the cleaning step has something to remove
+    if outlier_rate > 0:
+        is_outlier = rng.random(n_rows) < outlier_rate
+        factors = np.where(rng.random(n_rows) < 0.5, rng.uniform(4, 8, n_rows), rng.uniform(0.05, 0.2, n_rows))
+        df.loc[is_outlier, 'price'] = np.round(df.loc[is_outlier, 'price'] * factors[is_outlier], -3)
+
+    if missing_rate > 0:
+        for column in MISSING_VALUE_COLUMNS:
+            df.loc[rng.random(n_rows) < missing_rate, column] = np.nan
+
+    # Keep integer columns as integers where no value was blanked out
+    for column in ['price', 'sqft', 'bedrooms', 'year_built']:
+        if not df[column].isnull().any():
+            df[column] = df[column].astype(np.int64)
+    return df[COLUMNS]
+
+def _write_chunk(task):
+    dist, n_rows, seed, path, missing_rate, outlier_rate = task
+    rng = np.random.default_rng(seed)
+    sample_rows(dist, n_rows, rng, missing_rate, outlier_rate).to_csv(path, index=False)
+    return path, n_rows
+
+def generate(input_file, output, n_rows, chunk_size=500_000, workers=None, missing_rate=0.01,
+             outlier_rate=0.005, seed=42, smoothing=0.0, partitioned=False):
+    """
+    Generate `n_rows` synthetic rows in parallel chunks of `chunk_size`.
+
+    With `partitioned`, `output` is a directory of part-NNNNN.csv files;
+    otherwise the parts are concatenated into the single CSV `output`.
+    """
+    start = time.perf_counter()
+    raw = pd.read_csv(input_file)
+    dist = fit_distribution(raw, smoothing=smoothing)
+    logger.info(f"Fitted distribution on {len(raw)} rows from {input_file}")
+
+    output = Path(output)
+    parts_dir = output if partitioned else output.with_name(output.name + '.parts')
+    parts_dir.mkdir(parents=True, exist_ok=True)
+
+    n_chunks = max(1, -(-n_rows // chunk_size))
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    tasks = [
+        (dist, min(chunk_size, n_rows - i * chunk_size), seeds[i],
+         parts_dir / f"part-{i:05d}.csv", missing_rate, outlier_rate)
+        for i in range(n_chunks)
+    ]
+
+    workers = workers or os.cpu_count()
+    logger.info(f"Generating {n_rows:,} rows in {n_chunks} chunks with {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = []
+        for path, rows in pool.map(_write_chunk, tasks):
+            parts.append(path)
+            logger.info(f"Wrote {rows:,} rows to {path}")
+
+    if not partitioned:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'wb') as out:
+            for i, path in enumerate(parts):
+                with open(path, 'rb') as part:
+                    if i > 0:
+                        part.readline()  # header is written once
+                    shutil.copyfileobj(part, out, length=16 * 1024 * 1024)
+        shutil.rmtree(parts_dir)
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Generated {n_rows:,} rows to {output} in {elapsed:.1f}s ({n_rows / elapsed:,.0f} rows/sec)")
+    return output
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic house-price data that follows the raw data's joint distribution."
+    )
+    parser.add_argument("-i", "--input-file", default="data/raw/house_data.csv",
+                        help="Raw CSV to fit the distribution on")
+    parser.add_argument("-o", "--output", default="data/raw/synthetic_house_data.csv",
+                        help="Output CSV, or output directory with --partitioned")
+    parser.add_argument("-n", "--rows", type=int, default=1_000_000, help="Number of rows to generate")
+    parser.add_argument("--chunk-size", type=int, default=500_000, help="Rows per chunk")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--missing-rate", type=float, default=0.01,
+                        help="Fraction of values blanked out in each feature column")
+    parser.add_argument("--outlier-rate", type=float, default=0.005,
+                        help="Fraction of rows with an extreme price")
+    parser.add_argument("--smoothing", type=float, default=0.0,
+                        help="Additive smoothing of location/condition counts; 0 keeps unseen pairs unseen")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="Keep one CSV per chunk in the output directory")
+    args = parser.parse_args()
+
+    generate(
+        input_file=args.input_file,
+        output=args.output,
+        n_rows=args.rows,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        missing_rate=args.missing_rate,
+        outlier_rate=args.outlier_rate,
+        seed=args.seed,
+        smoothing=args.smoothing,
+        partitioned=args.partitioned,
+    )
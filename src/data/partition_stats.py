@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# -----------------------------
+# Per-partition statistics
+# -----------------------------
+def column_stats(df):
+    """
+    Everything cleaning needs to know about one partition, small enough to
+    send between processes: per column, the missing count and the exact
+    distribution of present values. Numeric columns keep (sorted distinct
+    values, counts) arrays, others a {value: count} dict.
+    """
+    stats = {}
+    for column in df.columns:
+        values = df[column]
+        present = values.dropna()
+        entry = {'missing': int(len(values) - len(present))}
+        if present.empty:
+            # No values to tell the column's type by
+            entry['kind'] = None
+        elif pd.api.types.is_numeric_dtype(values):
+            entry['kind'] = 'numeric'
+            entry['values'], entry['counts'] = np.unique(present.to_numpy(dtype=np.float64), return_counts=True)
+        else:
+            entry['kind'] = 'category'
+            entry['counts'] = present.value_counts(sort=False).to_dict()
+        stats[column] = entry
+    return stats
+
+def merge_stats(partition_stats):
+    """Combine column_stats() of every partition into the same form for the whole dataset."""
+    merged = {}
+    for stats in partition_stats:
+        for column, entry in stats.items():
+            total = merged.setdefault(column, {'missing': 0, 'kind': None, 'parts': []})
+            total['missing'] += entry['missing']
+            if entry['kind'] is None:
+                continue
+            if total['kind'] not in (None, entry['kind']):
+                raise ValueError(f"Column {column} is numeric in some partitions and not in others")
+            total['kind'] = entry['kind']
+            total['parts'].append(entry)
+
+    for column, total in merged.items():
+        parts = total.pop('parts')
+        if total['kind'] == 'numeric':
+            values = np.concatenate([p['values'] for p in parts])
+            counts = np.concatenate([p['counts'] for p in parts])
+            total['values'], inverse = np.unique(values, return_inverse=True)
+            total['counts'] = np.bincount(inverse, weights=counts).astype(np.int64)
+        elif total['kind'] == 'category':
+            counts = {}
+            for p in parts:
+                for value, n in p['counts'].items():
+                    counts[value] = counts.get(value, 0) + n
+            total['counts'] = counts
+    return merged
+
+# -----------------------------
+# Global values from merged statistics
+# -----------------------------
+def quantile_from_counts(values, counts, q):
+    """pandas' default (linear) quantile of the data that `values` repeated `counts` times would be."""
+    cumulative = np.cumsum(counts)
+    position = (cumulative[-1] - 1) * q
+    lower = int(np.floor(position))
+    upper = min(lower + 1, int(cumulative[-1]) - 1)
+    # Value at each sorted position
+    low_value, high_value = values[np.searchsorted(cumulative, [lower, upper], side='right')]
+    return float(low_value + (high_value - low_value) * (position - lower))
+
+def mode_from_counts(counts):
+    """pandas' mode()[0]: the most frequent value, the smallest one on ties."""
+    top = max(counts.values())
+    return sorted(value for value, n in counts.items() if n == top)[0]
+
+def fill_values(merged):
+    """
+    The values fill_missing() would use on the concatenated dataset: the median
+    of numeric columns and the mode of the others, for columns with any
+    missing value.
+    """
+    fills = {}
+    for column, total in merged.items():
+        if not total['missing'] or total['kind'] is None:
+            continue
+        if total['kind'] == 'numeric':
+            fills[column] = quantile_from_counts(total['values'], total['counts'], 0.5)
+        else:
+            fills[column] = mode_from_counts(total['counts'])
+    return fills
+
+def price_bounds(merged, fills):
+    """
+    remove_price_outliers()' 1.5 IQR bounds for the whole dataset. Missing
+    prices count at their fill value, as they are filled before the outlier
+    step.
+    """
+    price = merged['price']
+    values, counts = price['values'], price['counts']
+    if price['missing'] and 'price' in fills:
+        values = np.append(values, fills['price'])
+        counts = np.append(counts, price['missing'])
+        order = np.argsort(values, kind='stable')
+        values, counts = values[order], counts[order]
+    q1 = quantile_from_counts(values, counts, 0.25)
+    q3 = quantile_from_counts(values, counts, 0.75)
+    iqr = q3 - q1
+    return q1 - 1.5 * iqr, q3 + 1.5 * iqr
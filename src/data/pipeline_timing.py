@@ -0,0 +1,102 @@
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Bump when the report layout changes, so comparisons skip incompatible runs
+TIMING_REPORT_VERSION = 1
+
+# -----------------------------
+# Memory helpers
+# -----------------------------
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+# -----------------------------
+# Pipeline step timer
+# -----------------------------
+class PipelineTimer:
+    """
+    Records wall time, CPU time, rows/sec and peak RSS for each step of a
+    data pipeline stage, and writes them as a JSON report.
+
+    Each step yields a dict where the caller fills in `rows_out` (and
+    `bytes` for file writes); `rows_in` is passed up front when known.
+    Throughput is rows_in per second, or rows_out when there's no input
+    count. When disabled every method is a cheap no-op.
+    """
+
+    def __init__(self, stage, enabled=True):
+        self.stage = stage
+        self.enabled = enabled
+        self.steps = []
+        self.metadata = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def step(self, name, rows_in=None):
+        """Time the enclosed block and record it under `name`."""
+        record = {"rows_in": rows_in, "rows_out": None, "bytes": None}
+        if not self.enabled:
+            yield record
+            return
+        rss_before = peak_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            rss_after = peak_rss_mb()
+            rows = record["rows_in"] if record["rows_in"] is not None else record["rows_out"]
+            entry = {
+                "step": name,
+                "wall_time_s": round(wall, 6),
+                "cpu_time_s": round(cpu, 6),
+                "rows_in": record["rows_in"],
+                "rows_out": record["rows_out"],
+                "rows_per_s": round(rows / wall, 1) if rows is not None and wall > 0 else None,
+                "peak_rss_mb": round(rss_after, 2),
+                "peak_rss_growth_mb": round(rss_after - rss_before, 2),
+            }
+            if record["bytes"] is not None:
+                entry["bytes"] = record["bytes"]
+                entry["mb_per_s"] = round(record["bytes"] / 1e6 / wall, 2) if wall > 0 else None
+            self.steps.append(entry)
+
+    def add_metadata(self, **kwargs):
+        if self.enabled:
+            self.metadata.update(kwargs)
+
+    def report(self):
+        """Return the report as a JSON-serializable dict."""
+        return {
+            "version": TIMING_REPORT_VERSION,
+            "stage": self.stage,
+            "created": datetime.now().isoformat(),
+            "metadata": {
+                "python_version": platform.python_version(),
+                "platform": platform.platform(),
+                **self.metadata,
+            },
+            "total_wall_time_s": round(time.perf_counter() - self._started, 6),
+            "peak_rss_mb": round(peak_rss_mb(), 2),
+            "steps": self.steps,
+        }
+
+    def save(self, path):
+        if not self.enabled:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
@@ -4,7 +4,18 @@ import argparse
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import glob
+import json
 import logging
+import os
+import shutil
+import tempfile
+
+from pipeline_timing import PipelineTimer
+from partition_stats import column_stats, merge_stats, fill_values, price_bounds
+from validation import load_schema, validate_data
 
 # Run from the project root dir.
 
@@ -27,10 +38,26 @@ def load_data(file_path):
     logger.info(f"Loading data from {file_path}")
     return pd.read_csv(file_path)
 
-def clean_data(df):
-    """Clean the dataset by handling missing values and outliers."""
+def clean_data(df, timer=None):
+    """
+    Clean the dataset by handling missing values and outliers. Each step is
+    timed when a PipelineTimer is passed.
+    """
     logger.info("Cleaning dataset")
+    timer = timer or PipelineTimer("data_processing", enabled=False)
+    
+    with timer.step("fill_missing", rows_in=len(df)) as step:
+        df_cleaned = fill_missing(df)
+        step["rows_out"] = len(df_cleaned)
+    
+    with timer.step("remove_price_outliers", rows_in=len(df_cleaned)) as step:
+        df_cleaned = remove_price_outliers(df_cleaned)
+        step["rows_out"] = len(df_cleaned)
     
+    return df_cleaned
+
+def fill_missing(df):
+    """Fill missing numeric values with the median and categorical ones with the mode."""
     # Make a copy to avoid modifying the original dataframe
     df_cleaned = df.copy()
     
@@ -51,6 +78,10 @@ def clean_data(df):
                 df_cleaned[column] = df_cleaned[column].fillna(mode_value)
                 logger.info(f"Filled missing values in {column} with mode: {mode_value}")
     
+    return df_cleaned
+
+def remove_price_outliers(df_cleaned):
+    """Drop rows whose price is outside 1.5 IQR of the quartiles."""
     # Handle outliers in price (target variable)
     # Using IQR method to identify outliers
     Q1 = df_cleaned['price'].quantile(0.25)
@@ -71,22 +102,226 @@ def clean_data(df):
     
     return df_cleaned
 
-def process_data(input_file, output_file):
+def validate(df, schema_file, quarantine_file, validation_report, timer):
+    """
+    Check every row against the column schema before cleaning, so invalid
+    values don't reach the median/mode fills. Failing rows are quarantined.
+    """
+    schema = load_schema(schema_file)
+    with timer.step("validate", rows_in=len(df)) as step:
+        df_valid, report = validate_data(df, schema, quarantine_file)
+        step["rows_out"] = len(df_valid)
+    report["schema_file"] = schema_file
+
+    failures = {code: n for code, n in report["failures_by_rule"].items() if n}
+    logger.info(
+        f"Validated {report['rows_in']} rows against {schema_file}: "
+        f"{report['rows_quarantined']} quarantined to {quarantine_file}"
+    )
+    for code, n in sorted(failures.items(), key=lambda item: -item[1]):
+        logger.info(f"  {code}: {n} rows")
+    for name, n in report["normalized_values"].items():
+        if n:
+            logger.info(f"Normalized {n} {name} values to their vocabulary spelling")
+
+    if validation_report:
+        Path(validation_report).parent.mkdir(parents=True, exist_ok=True)
+        with open(validation_report, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved validation report to {validation_report}")
+    return df_valid
+
+# -----------------------------
+# Partitioned processing
+# -----------------------------
+def resolve_partitions(input_spec):
+    """Input CSVs, in name order: every *.csv in a directory, or the matches of a glob."""
+    if os.path.isdir(input_spec):
+        paths = sorted(glob.glob(os.path.join(input_spec, '*.csv')))
+    else:
+        paths = sorted(glob.glob(input_spec, recursive=True))
+    if not paths:
+        raise ValueError(f"No CSV partitions found for {input_spec}")
+    return paths
+
+def _stage_partition(task):
+    """
+    Pass 1, in a worker: load and validate one partition, keep its valid rows
+    in a staging pickle and return their column statistics.
+    """
+    source, staging_file, schema, quarantine_file = task
+    df = pd.read_csv(source)
+    info = {'source': source, 'source_bytes': os.path.getsize(source), 'rows_in': len(df),
+            'rows_quarantined': 0, 'quarantine_file': None}
+    if schema is not None:
+        df, report = validate_data(df, schema, quarantine_file)
+        info.update(rows_quarantined=report['rows_quarantined'], quarantine_file=quarantine_file)
+        info['failures_by_rule'] = report['failures_by_rule']
+        info['normalized_values'] = report['normalized_values']
+    df.to_pickle(staging_file)
+    return info, column_stats(df)
+
+def _clean_partition(task):
+    """Pass 2, in a worker: fill and filter one staged partition with the global values, then write it."""
+    staging_file, output_file, fills, (lower_bound, upper_bound) = task
+    df = pd.read_pickle(staging_file)
+    for column, value in fills.items():
+        if column in df.columns and df[column].isnull().any():
+            df[column] = df[column].fillna(value)
+    rows_filled = len(df)
+    df = df[(df['price'] >= lower_bound) & (df['price'] <= upper_bound)]
+    df.to_csv(output_file, index=False)
+    os.remove(staging_file)
+    return {'rows_outliers': rows_filled - len(df), 'rows_out': len(df), 'output_bytes': os.path.getsize(output_file)}
+
+def _json_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+def process_partitioned(input_spec, output_dir, workers=None, timing_report=None, schema_file=None,
+                        quarantine_file=None, validation_report=None):
+    """
+    Clean many raw CSV partitions into one part-NNNNN.csv per input, in
+    parallel, with the same values as process_data() on their concatenation.
+
+    Pass 1 validates each partition and returns its exact value counts; they
+    are merged into the global medians, modes and price IQR bounds. Pass 2
+    fills and filters each partition with those. Only statistics travel
+    between processes, so the work scales with the number of workers.
+    manifest.json in `output_dir` maps every part to its source.
+    """
+    timer = PipelineTimer("data_processing", enabled=bool(timing_report))
+    sources = resolve_partitions(input_spec)
+    workers = workers or os.cpu_count()
+    timer.add_metadata(input_file=input_spec, output_file=output_dir, partitions=len(sources), workers=workers)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # Parts left by an earlier run with more partitions would be read as data
+    for stale in output_dir.glob('part-*.csv'):
+        stale.unlink()
+    schema = load_schema(schema_file) if schema_file else None
+    quarantine_dir = Path(quarantine_file).with_suffix('') if schema and quarantine_file else None
+    if quarantine_dir is not None:
+        quarantine_dir.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Processing {len(sources)} partitions from {input_spec} with {workers} workers")
+
+    staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=output_dir)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = [f"part-{i:05d}.csv" for i in range(len(sources))]
+            tasks = [
+                (source, os.path.join(staging_dir, f"{part}.pkl"), schema,
+                 str(quarantine_dir / part) if quarantine_dir is not None else None)
+                for source, part in zip(sources, parts)
+            ]
+            with timer.step("stage_partitions") as step:
+                staged = list(pool.map(_stage_partition, tasks))
+                rows_valid = sum(info['rows_in'] - info['rows_quarantined'] for info, _ in staged)
+                step['rows_out'] = rows_valid
+                step['bytes'] = sum(info['source_bytes'] for info, _ in staged)
+
+            with timer.step("merge_statistics", rows_in=len(staged)):
+                merged = merge_stats([stats for _, stats in staged])
+                fills = fill_values(merged)
+                bounds = price_bounds(merged, fills)
+            for column, value in fills.items():
+                logger.info(f"Filling {merged[column]['missing']} missing values in {column} with: {value}")
+            logger.info(f"Keeping prices between {bounds[0]:,.2f} and {bounds[1]:,.2f}")
+
+            clean_tasks = [
+                (staging_file, str(output_dir / part), fills, bounds)
+                for (_, staging_file, _, _), part in zip(tasks, parts)
+            ]
+            with timer.step("clean_partitions", rows_in=rows_valid) as step:
+                cleaned = list(pool.map(_clean_partition, clean_tasks))
+                step['rows_out'] = sum(c['rows_out'] for c in cleaned)
+                step['bytes'] = sum(c['output_bytes'] for c in cleaned)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    # Rule counts go to the validation report; everything else about a part to the manifest
+    lineage_keys = ('source', 'source_bytes', 'rows_in', 'rows_quarantined', 'quarantine_file')
+    partitions = [
+        {'part': part, **{key: info[key] for key in lineage_keys}, **result}
+        for part, (info, _), result in zip(parts, staged, cleaned)
+    ]
+    manifest = {
+        'created': datetime.now().isoformat(),
+        'input': input_spec,
+        'schema_file': schema_file,
+        'fill_values': {column: _json_value(value) for column, value in fills.items()},
+        'price_bounds': list(bounds),
+        'rows_in': sum(p['rows_in'] for p in partitions),
+        'rows_out': sum(p['rows_out'] for p in partitions),
+        'partitions': partitions,
+    }
+    with open(output_dir / 'manifest.json', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Cleaned {manifest['rows_in']} rows into {manifest['rows_out']} across {len(parts)} parts "
+                f"in {output_dir}; lineage in {output_dir / 'manifest.json'}")
+
+    if schema is not None:
+        report = {
+            'created': manifest['created'],
+            'rows_in': manifest['rows_in'],
+            'rows_valid': rows_valid,
+            'rows_quarantined': sum(p['rows_quarantined'] for p in partitions),
+            'quarantine_file': str(quarantine_dir) if quarantine_dir is not None else None,
+            'failures_by_rule': {},
+            'normalized_values': {},
+            'schema_file': schema_file,
+        }
+        for info, _ in staged:
+            for key in ('failures_by_rule', 'normalized_values'):
+                for code, n in info[key].items():
+                    report[key][code] = report[key].get(code, 0) + n
+        logger.info(f"Validated {report['rows_in']} rows against {schema_file}: "
+                    f"{report['rows_quarantined']} quarantined to {report['quarantine_file']}")
+        if validation_report:
+            Path(validation_report).parent.mkdir(parents=True, exist_ok=True)
+            with open(validation_report, "w") as f:
+                json.dump(report, f, indent=2)
+            logger.info(f"Saved validation report to {validation_report}")
+
+    if timing_report:
+        timer.save(timing_report)
+        logger.info(f"Saved timing report to {timing_report}")
+    return manifest
+
+def process_data(input_file, output_file, timing_report=None, schema_file=None,
+                 quarantine_file=None, validation_report=None):
     """Full data processing pipeline."""
+    timer = PipelineTimer("data_processing", enabled=bool(timing_report))
+    timer.add_metadata(input_file=input_file, output_file=output_file)
+
     # Create output directory if it doesn't exist
     output_path = Path(output_file).parent
     output_path.mkdir(parents=True, exist_ok=True)
     
     # Load data
-    df = load_data(input_file)
+    with timer.step("load_csv") as step:
+        df = load_data(input_file)
+        step["rows_out"] = len(df)
+        step["bytes"] = Path(input_file).stat().st_size
     logger.info(f"Loaded data with shape: {df.shape}")
+
+    # Validate against the schema, quarantining failing rows
+    if schema_file:
+        df = validate(df, schema_file, quarantine_file, validation_report, timer)
     
     # Clean data
-    df_cleaned = clean_data(df)
+    df_cleaned = clean_data(df, timer)
     
     # Save processed data
-    df_cleaned.to_csv(output_file, index=False)
+    with timer.step("write_csv", rows_in=len(df_cleaned)) as step:
+        df_cleaned.to_csv(output_file, index=False)
+        step["rows_out"] = len(df_cleaned)
+        step["bytes"] = Path(output_file).stat().st_size
     logger.info(f"Saved processed data to {output_file}")
+
+    if timing_report:
+        timer.save(timing_report)
+        logger.info(f"Saved timing report to {timing_report}")
     
     return df_cleaned
 
@@ -97,16 +332,63 @@ if __name__ == "__main__":
     parser.add_argument(
         "-i", "--input-file",
         default="data/raw/house_data.csv",
-        help="Path to raw CSV"
+        help="Path to raw CSV; with --partitioned, a directory of CSVs or a glob such as 'data/raw/drops/*/*.csv'"
     )
     parser.add_argument(
         "-o", "--output-file",
         default="data/processed/cleaned_house_data.csv",
-        help="Path to write cleaned CSV"
+        help="Path to write cleaned CSV; with --partitioned, the directory to write part-NNNNN.csv files to"
+    )
+    parser.add_argument(
+        "--timing-report",
+        default="reports/timing/data_processing.json",
+        help="Path to write the per-step timing, rows/sec and memory report ('' to skip)"
+    )
+    parser.add_argument(
+        "--schema",
+        default="configs/data_schema.yaml",
+        help="Column schema to validate rows against ('' to skip validation)"
+    )
+    parser.add_argument(
+        "--quarantine-file",
+        default="data/quarantine/house_data_quarantine.csv",
+        help="Path to write rows that fail validation, with their reason codes"
+    )
+    parser.add_argument(
+        "--validation-report",
+        default="reports/validation/data_validation.json",
+        help="Path to write per-rule failure counts ('' to skip)"
+    )
+    parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        help="Clean every CSV matched by --input-file in parallel, one output part per input "
+             "(quarantined rows go to a directory named after --quarantine-file)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes with --partitioned (default: all cores)"
     )
     args = parser.parse_args()
 
-    process_data(
-        input_file=args.input_file,
-        output_file=args.output_file
-    )
+    if args.partitioned:
+        process_partitioned(
+            input_spec=args.input_file,
+            output_dir=args.output_file,
+            workers=args.workers,
+            timing_report=args.timing_report,
+            schema_file=args.schema,
+            quarantine_file=args.quarantine_file,
+            validation_report=args.validation_report
+        )
+    else:
+        process_data(
+            input_file=args.input_file,
+            output_file=args.output_file,
+            timing_report=args.timing_report,
+            schema_file=args.schema,
+            quarantine_file=args.quarantine_file,
+            validation_report=args.validation_report
+        )
@@ -0,0 +1,162 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import yaml
+
+# Rows validated at a time; bounds the temporary masks, not the result
+VALIDATION_CHUNK_ROWS = 1_000_000
+
+# -----------------------------
+# Schema
+# -----------------------------
+def load_schema(path):
+    """Read a column schema such as configs/data_schema.yaml, resolving `current_year`."""
+    with open(path) as f:
+        schema = yaml.safe_load(f)
+    for spec in schema['columns'].values():
+        for key in ('min', 'max', 'min_exclusive', 'max_exclusive'):
+            if spec.get(key) == 'current_year':
+                spec[key] = datetime.now().year
+    return schema
+
+def category_lookup(spec):
+    """Map of casefolded spelling -> vocabulary value, including aliases."""
+    lookup = {str(value).strip().casefold(): value for value in spec['values']}
+    for alias, value in (spec.get('aliases') or {}).items():
+        if value not in spec['values']:
+            raise ValueError(f"Alias {alias!r} maps to {value!r}, which is not in the vocabulary")
+        lookup[str(alias).strip().casefold()] = value
+    return lookup
+
+# -----------------------------
+# Column checks
+# -----------------------------
+def check_column(values, spec):
+    """
+    Check one column against its spec. Returns (cleaned column, [(rule, bad
+    mask)], values respelled). Numbers come back numeric and categories in
+    their vocabulary spelling.
+    """
+    kind = spec['type']
+    respelled = 0
+    rules = []
+    if kind == 'category':
+        # Work on the distinct values and their codes (-1 for missing), not on every string
+        codes, uniques = pd.factorize(values)
+        missing = codes < 0
+    else:
+        missing = values.isna().to_numpy()
+    if spec.get('required'):
+        rules.append(('missing', missing))
+
+    if kind in ('number', 'integer'):
+        cleaned = pd.to_numeric(values, errors='coerce')
+        numbers = cleaned.to_numpy(dtype=np.float64)
+        present = ~np.isnan(numbers)
+        rules.append(('not_numeric', ~missing & ~present))
+        if kind == 'integer':
+            rules.append(('not_integer', present & (np.floor(numbers) != numbers)))
+        with np.errstate(invalid='ignore'):
+            if 'min' in spec:
+                rules.append(('below_min', present & (numbers < spec['min'])))
+            if 'min_exclusive' in spec:
+                rules.append(('below_min', present & (numbers <= spec['min_exclusive'])))
+            if 'max' in spec:
+                rules.append(('above_max', present & (numbers > spec['max'])))
+            if 'max_exclusive' in spec:
+                rules.append(('above_max', present & (numbers >= spec['max_exclusive'])))
+    elif kind == 'category':
+        lookup = category_lookup(spec)
+        mapped = [lookup.get(str(u).strip().casefold()) for u in uniques]
+        # The extra last entry is what code -1 (missing) picks up
+        unknown = np.array([m is None for m in mapped] + [False])
+        changed = np.array([m is not None and m != u for m, u in zip(mapped, uniques)] + [False])
+        cleaned = pd.Series(np.array(mapped + [None], dtype=object)[codes], index=values.index, dtype=object)
+        rules.append(('unknown_category', unknown[codes]))
+        respelled = int(changed[codes].sum())
+    else:
+        raise ValueError(f"Unknown column type {kind!r}")
+
+    # Collapse rules that share a code (min and min_exclusive both give below_min)
+    merged = {}
+    for rule, bad in rules:
+        merged[rule] = merged[rule] | bad if rule in merged else bad
+    return cleaned, list(merged.items()), respelled
+
+def validate_chunk(df, schema):
+    """
+    Validate every column of `df` at once. Returns (cleaned frame, valid mask,
+    reason per row, failures per rule code, respelled values per category
+    column). Reasons are `column:rule` codes joined with ';', and empty for
+    valid rows.
+    """
+    columns = schema['columns']
+    absent = [name for name in columns if name not in df.columns]
+    if absent:
+        raise ValueError(f"Input is missing schema columns: {absent}")
+
+    cleaned = df.copy()
+    codes = []
+    normalized = {}
+    bits = np.zeros(len(df), dtype=np.int64)
+    for name, spec in columns.items():
+        cleaned[name], rules, respelled = check_column(df[name], spec)
+        if spec['type'] == 'category':
+            normalized[name] = respelled
+        for rule, bad in rules:
+            bits |= bad.astype(np.int64) << len(codes)
+            codes.append(f"{name}:{rule}")
+    if len(codes) > 63:
+        raise ValueError(f"Schema defines {len(codes)} rules; at most 63 are supported")
+
+    valid = bits == 0
+    counts = {code: int(((bits >> k) & 1).sum()) for k, code in enumerate(codes)}
+    # Build the reason string once per distinct combination of failed rules
+    reasons = np.full(len(df), '', dtype=object)
+    if not valid.all():
+        combos, inverse = np.unique(bits[~valid], return_inverse=True)
+        labels = np.array([';'.join(c for k, c in enumerate(codes) if combo >> k & 1) for combo in combos], dtype=object)
+        reasons[~valid] = labels[inverse]
+    return cleaned, valid, reasons, counts, normalized
+
+def validate_data(df, schema, quarantine_file=None, chunk_rows=VALIDATION_CHUNK_ROWS):
+    """
+    Validate `df` chunk by chunk. Failing rows are written to `quarantine_file`
+    (original values plus their input row number and reasons) and left out of
+    the returned frame. Returns (valid rows, report).
+    """
+    if quarantine_file:
+        os.makedirs(os.path.dirname(quarantine_file) or '.', exist_ok=True)
+    kept = []
+    counts = {}
+    normalized = {}
+    n_quarantined = 0
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        cleaned, valid, reasons, chunk_counts, chunk_normalized = validate_chunk(chunk, schema)
+        kept.append(cleaned if valid.all() else cleaned[valid])
+        for code, n in chunk_counts.items():
+            counts[code] = counts.get(code, 0) + n
+        for name, n in chunk_normalized.items():
+            normalized[name] = normalized.get(name, 0) + n
+        n_quarantined += int((~valid).sum())
+        if quarantine_file:
+            rejected = chunk[~valid].copy()
+            rejected.insert(0, 'row', np.arange(start, start + len(chunk))[~valid])
+            rejected['reasons'] = reasons[~valid]
+            rejected.to_csv(quarantine_file, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+    valid_df = pd.concat(kept) if len(kept) > 1 else kept[0]
+    report = {
+        'created': datetime.now().isoformat(),
+        'rows_in': int(len(df)),
+        'rows_valid': int(len(valid_df)),
+        'rows_quarantined': n_quarantined,
+        'quarantine_file': quarantine_file,
+        'failures_by_rule': counts,
+        # Category values accepted after fixing their case, spacing or alias
+        'normalized_values': normalized,
+    }
+    return valid_df, report
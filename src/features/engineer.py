@@ -8,6 +8,19 @@ from sklearn.preprocessing import OneHotEncoder
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 import joblib
+import json
+import os
+import sys
+from scipy import sparse
+
+# The step timer lives with the data processing script; share it so both stages report alike
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+from pipeline_timing import PipelineTimer  # noqa: E402
+# Training's hold-out split, and the price index lookup exactly as serving does it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+from holdout import holdout_mask  # noqa: E402
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from price_index import PriceIndex  # noqa: E402
 
 # Set up logging
 logging.basicConfig(
@@ -16,6 +29,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger('feature-engineering')
 
+# Features the API's drift monitor compares live requests against
+DRIFT_NUMERICAL_FEATURES = ['sqft', 'bathrooms', 'house_age']
+DRIFT_CATEGORICAL_FEATURES = ['location', 'condition']
+DRIFT_REFERENCE_FILENAME = 'drift_reference.json'
+
+# Serving-time stand-in for price_per_sqft, which needs the price itself
+PRICE_INDEX_FILENAME = 'price_index.json'
+# Pseudo-count pulling small groups' medians towards their prior
+PRICE_INDEX_SMOOTHING = 5.0
+# Folds of the training rows for out-of-fold price_per_sqft values
+PRICE_INDEX_FOLDS = 5
+
 def create_features(df):
     """Create new features from existing data."""
     logger.info("Creating new features")
@@ -28,7 +53,8 @@ def create_features(df):
     df_featured['house_age'] = current_year - df_featured['year_built']
     logger.info("Created 'house_age' feature")
     
-    # Price per square foot
+    # Price per square foot. It needs the price, so run_feature_engineering
+    # replaces it with price index lookups before the model sees it
     df_featured['price_per_sqft'] = df_featured['price'] / df_featured['sqft']
     logger.info("Created 'price_per_sqft' feature")
     
@@ -60,54 +86,271 @@ def create_preprocessor():
         ('onehot', OneHotEncoder(handle_unknown='ignore'))
     ])
     
-    # Combine preprocessors in a column transformer
+    # Combine preprocessors in a column transformer; always output a sparse
+    # matrix so the one-hot block never gets densified, however many categories
     preprocessor = ColumnTransformer(
         transformers=[
             ('num', numerical_transformer, numerical_features),
             ('cat', categorical_transformer, categorical_features)
-        ]
+        ],
+        sparse_threshold=1.0
     )
     
     return preprocessor
 
-def run_feature_engineering(input_file, output_file, preprocessor_file):
-    """Full feature engineering pipeline."""
-    # Load cleaned data
-    logger.info(f"Loading data from {input_file}")
-    df = pd.read_csv(input_file)
-    
-    # Create features
-    df_featured = create_features(df)
-    logger.info(f"Created featured dataset with shape: {df_featured.shape}")
-    
-    # Create and fit the preprocessor
+def build_drift_reference(df_featured, n_bins=10):
+    """
+    Reference distributions for drift monitoring: decile bin edges and bin
+    proportions for numerical features, category proportions for categoricals.
+    Bins are right-closed on the left edge (a value equal to an edge goes to
+    the bin above), matching bisect_right in the API.
+    """
+    reference = {
+        'created': datetime.now().isoformat(),
+        'n_rows': int(len(df_featured)),
+        'numerical': {},
+        'categorical': {},
+    }
+    for column in DRIFT_NUMERICAL_FEATURES:
+        values = df_featured[column].dropna().to_numpy(dtype=float)
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+        reference['numerical'][column] = {
+            'edges': edges.tolist(),
+            'proportions': (counts / counts.sum()).tolist(),
+        }
+    for column in DRIFT_CATEGORICAL_FEATURES:
+        proportions = df_featured[column].value_counts(normalize=True)
+        reference['categorical'][column] = {
+            'proportions': {str(k): float(v) for k, v in proportions.items()},
+        }
+    return reference
+
+def build_price_index(df_featured, smoothing=PRICE_INDEX_SMOOTHING):
+    """
+    Smoothed median price_per_sqft for every location x condition pair.
+
+    Location and condition medians are shrunk towards the global median with
+    `smoothing` pseudo-rows. Each pair's median is then shrunk towards the
+    product of its location and condition effects. The extra last row and
+    column cover locations and conditions not seen in training.
+    """
+    df = df_featured[['location', 'condition', 'price_per_sqft']].dropna()
+    df = df.astype({'location': str, 'condition': str})
+    global_median = float(df['price_per_sqft'].median())
+
+    def shrink(median, count, prior):
+        return (count * median + smoothing * prior) / (count + smoothing)
+
+    def level_estimates(column):
+        stats = df.groupby(column)['price_per_sqft'].agg(['median', 'count'])
+        return {k: shrink(row['median'], row['count'], global_median) for k, row in stats.iterrows()}
+
+    location_est = level_estimates('location')
+    condition_est = level_estimates('condition')
+    pair_stats = df.groupby(['location', 'condition'])['price_per_sqft'].agg(['median', 'count'])
+
+    locations = sorted(location_est)
+    conditions = sorted(condition_est)
+    table = np.empty((len(locations) + 1, len(conditions) + 1))
+    counts = np.zeros((len(locations) + 1, len(conditions) + 1), dtype=np.int64)
+    for i, loc in enumerate(locations + [None]):
+        for j, cond in enumerate(conditions + [None]):
+            loc_effect = location_est[loc] if loc is not None else global_median
+            cond_effect = condition_est[cond] if cond is not None else global_median
+            prior = loc_effect * cond_effect / global_median
+            if (loc, cond) in pair_stats.index:
+                median, count = pair_stats.loc[(loc, cond)]
+                table[i, j] = shrink(median, count, prior)
+                counts[i, j] = count
+            else:
+                table[i, j] = prior
+
+    return {
+        'created': datetime.now().isoformat(),
+        'n_rows': int(len(df)),
+        'smoothing': smoothing,
+        'global_median': global_median,
+        'locations': locations,
+        'conditions': conditions,
+        'table': table.tolist(),
+        'counts': counts.tolist(),
+    }
+
+def lookup_price_per_sqft(price_index, df):
+    """price_per_sqft for each row of `df` from a build_price_index() result, as serving looks it up."""
+    return PriceIndex.from_dict(price_index).lookup(df['location'].to_numpy(), df['condition'].to_numpy())
+
+def serving_price_per_sqft(df_featured, folds=PRICE_INDEX_FOLDS):
+    """
+    The price index serving will use, built from the rows train_model.py
+    trains on, and price_per_sqft for every row as serving would see it, so
+    the model trains on the feature it is served. Hold-out rows look it up in
+    that index. Each training row looks it up in an index built from the
+    other `folds` - 1 folds of the training rows, so its own price never
+    leaks into its feature. Returns (index, values).
+    """
+    train_idx = np.flatnonzero(~holdout_mask(0, len(df_featured)))
+    price_index = build_price_index(df_featured.iloc[train_idx])
+    values = lookup_price_per_sqft(price_index, df_featured)
+    fold = np.arange(len(train_idx)) % folds
+    for k in range(folds):
+        rows = train_idx[fold == k]
+        if len(rows):
+            fold_index = build_price_index(df_featured.iloc[train_idx[fold != k]])
+            values[rows] = lookup_price_per_sqft(fold_index, df_featured.iloc[rows])
+    return price_index, values
+
+def save_feature_matrix(output_file, X, feature_names, y=None, target_name='price'):
+    """
+    Save the transformed feature matrix. A .npz path keeps it sparse: CSR
+    arrays under the keys scipy.sparse.save_npz uses (so load_npz can read it)
+    plus feature names and the target. Any other path is written as a dense CSV.
+    """
+    X = sparse.csr_matrix(X)
+    dense_bytes = X.shape[0] * X.shape[1] * X.dtype.itemsize
+    sparse_bytes = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    density = X.nnz / max(X.shape[0] * X.shape[1], 1)
+    logger.info(
+        f"Feature matrix {X.shape[0]} x {X.shape[1]}, density {density:.3f}: "
+        f"{dense_bytes / 1e6:.2f} MB dense vs {sparse_bytes / 1e6:.2f} MB CSR"
+    )
+
+    if output_file.endswith('.npz'):
+        arrays = {
+            'format': np.array('csr'),
+            'shape': np.array(X.shape),
+            'data': X.data,
+            'indices': X.indices,
+            'indptr': X.indptr,
+            'feature_names': np.asarray(feature_names, dtype=str),
+        }
+        if y is not None:
+            arrays['target'] = np.asarray(y, dtype=np.float64)
+            arrays['target_name'] = np.array(target_name)
+        np.savez(output_file, **arrays)
+    else:
+        df_transformed = pd.DataFrame(X.toarray())
+        if y is not None:
+            df_transformed[target_name] = np.asarray(y)
+        df_transformed.to_csv(output_file, index=False)
+    return X
+
+def fit_and_save_preprocessor(X, df_featured, price_index, preprocessor_file, timer):
+    """Fit a new preprocessor and save it with the drift reference and price index next to it."""
     preprocessor = create_preprocessor()
-    X = df_featured.drop(columns=['price'], errors='ignore')  # Features only
-    y = df_featured['price'] if 'price' in df_featured.columns else None  # Target column (if available)
-    X_transformed = preprocessor.fit_transform(X)
+    with timer.step('preprocessor_fit_transform', rows_in=len(X)) as step:
+        X_transformed = preprocessor.fit_transform(X)
+        step['rows_out'] = X_transformed.shape[0]
+    if timer.enabled:
+        # fit_transform can't be split without transforming twice, so time the
+        # transform alone (what serving pays per row) with one extra pass
+        with timer.step('preprocessor_transform', rows_in=len(X)) as step:
+            step['rows_out'] = preprocessor.transform(X).shape[0]
     logger.info("Fitted the preprocessor and transformed the features")
     
     # Save the preprocessor
     joblib.dump(preprocessor, preprocessor_file)
     logger.info(f"Saved preprocessor to {preprocessor_file}")
+
+    # Save reference statistics for drift monitoring next to the preprocessor
+    reference_file = os.path.join(os.path.dirname(preprocessor_file), DRIFT_REFERENCE_FILENAME)
+    with timer.step('build_drift_reference', rows_in=len(df_featured)):
+        reference = build_drift_reference(df_featured)
+    with open(reference_file, 'w') as f:
+        json.dump(reference, f, indent=2)
+    logger.info(f"Saved drift reference statistics to {reference_file}")
+
+    # Save the price_per_sqft lookup index that serving uses in place of the real value
+    price_index_file = os.path.join(os.path.dirname(preprocessor_file), PRICE_INDEX_FILENAME)
+    with open(price_index_file, 'w') as f:
+        json.dump(price_index, f, indent=2)
+    logger.info(f"Saved price_per_sqft index to {price_index_file}")
     
-    # Save fully preprocessed data
-    df_transformed = pd.DataFrame(X_transformed)
-    if y is not None:
-        df_transformed['price'] = y.values
-    df_transformed.to_csv(output_file, index=False)
+    return X_transformed, preprocessor
+
+def run_feature_engineering(input_file, output_file, preprocessor_file, timing_report=None, transform_only=False):
+    """
+    Full feature engineering pipeline. With `transform_only`, the preprocessor
+    already saved at `preprocessor_file` is applied as-is (for rows appended
+    to an existing model's data) and none of the saved artifacts are rewritten.
+    """
+    timer = PipelineTimer('feature_engineering', enabled=bool(timing_report))
+    timer.add_metadata(input_file=input_file, output_file=output_file)
+
+    # Load cleaned data
+    logger.info(f"Loading data from {input_file}")
+    with timer.step('load_csv') as step:
+        df = pd.read_csv(input_file)
+        step['rows_out'] = len(df)
+        step['bytes'] = os.path.getsize(input_file)
+    
+    # Create features
+    with timer.step('create_features', rows_in=len(df)) as step:
+        df_featured = create_features(df)
+        step['rows_out'] = len(df_featured)
+    logger.info(f"Created featured dataset with shape: {df_featured.shape}")
+
+    # Serving has no price, so it looks price_per_sqft up in the price index;
+    # train on those lookups rather than on the real price / sqft
+    price_index_file = os.path.join(os.path.dirname(preprocessor_file), PRICE_INDEX_FILENAME)
+    if transform_only:
+        with open(price_index_file) as f:
+            price_index = json.load(f)
+        # Appended rows were never part of the saved index
+        df_featured['price_per_sqft'] = lookup_price_per_sqft(price_index, df_featured)
+        logger.info(f"Looked up price_per_sqft in the existing price index {price_index_file}")
+    else:
+        with timer.step('build_price_index', rows_in=len(df_featured)) as step:
+            price_index, price_per_sqft = serving_price_per_sqft(df_featured)
+            df_featured['price_per_sqft'] = price_per_sqft
+            step['rows_out'] = len(df_featured)
+        logger.info("Replaced price_per_sqft with out-of-fold price index lookups")
+
+    X = df_featured.drop(columns=['price'], errors='ignore')  # Features only
+    y = df_featured['price'] if 'price' in df_featured.columns else None  # Target column (if available)
+    if transform_only:
+        # Same columns and scaling the existing model was trained on
+        preprocessor = joblib.load(preprocessor_file)
+        with timer.step('preprocessor_transform', rows_in=len(X)) as step:
+            X_transformed = preprocessor.transform(X)
+            step['rows_out'] = X_transformed.shape[0]
+        logger.info(f"Transformed the features with the existing preprocessor {preprocessor_file}")
+    else:
+        X_transformed, preprocessor = fit_and_save_preprocessor(X, df_featured, price_index, preprocessor_file, timer)
+
+    # Save fully preprocessed data (sparse for .npz outputs)
+    write_step = 'write_npz' if output_file.endswith('.npz') else 'write_csv'
+    with timer.step(write_step, rows_in=X_transformed.shape[0]) as step:
+        X_saved = save_feature_matrix(
+            output_file, X_transformed, preprocessor.get_feature_names_out(),
+            y.values if y is not None else None
+        )
+        step['rows_out'] = X_saved.shape[0]
+        step['bytes'] = os.path.getsize(output_file)
     logger.info(f"Saved fully preprocessed data to {output_file}")
+
+    timer.add_metadata(n_features=int(X_saved.shape[1]), nnz=int(X_saved.nnz))
+    if timing_report:
+        timer.save(timing_report)
+        logger.info(f"Saved timing report to {timing_report}")
     
-    return df_transformed
+    return X_saved
 
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description='Feature engineering for housing data.')
     parser.add_argument('--input', required=True, help='Path to cleaned CSV file')
-    parser.add_argument('--output', required=True, help='Path for output CSV file (engineered features)')
+    parser.add_argument('--output', required=True,
+                        help='Path for the engineered features: .npz for a sparse CSR matrix, otherwise CSV')
     parser.add_argument('--preprocessor', required=True, help='Path for saving the preprocessor')
+    parser.add_argument('--timing-report', default='reports/timing/feature_engineering.json',
+                        help="Path to write the per-step timing, rows/sec and memory report ('' to skip)")
+    parser.add_argument('--transform-only', action='store_true',
+                        help='Apply the preprocessor already saved at --preprocessor instead of fitting a new one '
+                             '(for new rows to update an existing model with)')
     
     args = parser.parse_args()
     
-    run_feature_engineering(args.input, args.output, args.preprocessor)
+    run_feature_engineering(args.input, args.output, args.preprocessor, args.timing_report, args.transform_only)
@@ -0,0 +1,124 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error
+
+from serving_bundle import ServingBundle
+from benchmark_price_index import request_frame
+from holdout import holdout_mask
+
+# -----------------------------
+# Configure logging
+# -----------------------------
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Argument parser
+# -----------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure how many trees, how much latency and how much accuracy anytime "
+                    "prediction saves or loses for single-row requests, per stopping threshold."
+    )
+    parser.add_argument("--bundle", type=str, default="models/trained/house_price_model.npz",
+                        help="Random forest serving bundle")
+    parser.add_argument("--data", type=str, default="data/processed/cleaned_house_data.csv",
+                        help="Cleaned CSV with request fields and price")
+    parser.add_argument("--output", type=str, default="models/benchmark/anytime_benchmark.json",
+                        help="Path to write the JSON report")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.02, 0.01, 0.005, 0.0025, 0.001],
+                        help="ANYTIME_MAX_RELATIVE_SE values to compare")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="Also apply this per-request time budget (ANYTIME_BUDGET_MS)")
+    parser.add_argument("--block-trees", type=int, default=None, help="Trees per step (ANYTIME_BLOCK_TREES)")
+    parser.add_argument("--min-trees", type=int, default=None, help="Fewest trees per answer (ANYTIME_MIN_TREES)")
+    parser.add_argument("--rows", type=int, default=1000, help="Hold-out rows to predict one at a time")
+    return parser.parse_args()
+
+# -----------------------------
+# Measurements
+# -----------------------------
+def run_single_rows(predict, X):
+    """Predict each row of X on its own, as /predict does. Returns (predictions, trees used, seconds)."""
+    predictions, trees, samples = [], [], []
+    predict(X[:1])  # warm up
+    for i in range(X.shape[0]):
+        start = time.perf_counter()
+        prediction, used = predict(X[i:i + 1])
+        samples.append(time.perf_counter() - start)
+        predictions.append(prediction[0])
+        trees.append(used)
+    return np.asarray(predictions), np.asarray(trees), np.asarray(samples)
+
+def summarize(n_trees, y_true, full_pred, predictions, trees, samples):
+    samples_ms = samples * 1000
+    deviation = np.abs(predictions - full_pred) / np.abs(full_pred).clip(1e-9)
+    return {
+        "mean_trees_used": round(float(trees.mean()), 2),
+        "stopped_early": round(float((trees < n_trees).mean()), 4),
+        "p50_ms": round(float(np.percentile(samples_ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(samples_ms, 95)), 4),
+        "mean_ms": round(float(samples_ms.mean()), 4),
+        "mae": round(float(mean_absolute_error(y_true, predictions)), 2),
+        # Accuracy loss relative to averaging every tree
+        "deviation_from_full_mean": round(float(deviation.mean()), 6),
+        "deviation_from_full_p99": round(float(np.percentile(deviation, 99)), 6),
+        "deviation_from_full_max": round(float(deviation.max()), 6),
+    }
+
+# -----------------------------
+# Main logic
+# -----------------------------
+def main(args):
+    bundle = ServingBundle.load(args.bundle)
+    if not bundle.supports_anytime:
+        raise ValueError(f"{args.bundle} is not an averaging ensemble; anytime prediction needs a random forest")
+    options = {k: v for k, v in (("block_trees", args.block_trees), ("min_trees", args.min_trees)) if v is not None}
+
+    df = pd.read_csv(args.data)
+    # Same row order and split as train_model.py, so these rows were not trained on
+    test_idx = np.flatnonzero(holdout_mask(0, len(df)))
+    test = df.iloc[test_idx[:args.rows]]
+    X = bundle.transform(bundle.add_derived_features(request_frame(test)))
+    y_true = test["price"].to_numpy()
+
+    full_pred, full_trees, full_samples = run_single_rows(lambda row: (bundle.predict(row), bundle.n_trees), X)
+    report = {
+        "bundle": args.bundle,
+        "model_version": bundle.version,
+        "n_trees": bundle.n_trees,
+        "rows": int(X.shape[0]),
+        "budget_ms": args.budget_ms,
+        "all_trees": summarize(bundle.n_trees, y_true, full_pred, full_pred, full_trees, full_samples),
+        "thresholds": {},
+    }
+    for threshold in args.thresholds:
+        def predict(row):
+            deadline = time.perf_counter() + args.budget_ms / 1000 if args.budget_ms else None
+            return bundle.predict_anytime(row, threshold, deadline=deadline, **options)
+        report["thresholds"][str(threshold)] = summarize(bundle.n_trees, y_true, full_pred, *run_single_rows(predict, X))
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    full = report["all_trees"]
+    logger.info(f"All {bundle.n_trees} trees: p50 {full['p50_ms']:.3f} ms, MAE {full['mae']:.2f}")
+    for threshold, stats in report["thresholds"].items():
+        logger.info(
+            f"max_relative_se={threshold}: {stats['mean_trees_used']:.1f} trees on average, "
+            f"p50 {stats['p50_ms']:.3f} ms, MAE {stats['mae']:.2f}, "
+            f"p99 deviation from all trees {stats['deviation_from_full_p99']:.2%}"
+        )
+    logger.info(f"Saved anytime benchmark to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,157 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import yaml
+from sklearn.metrics import mean_absolute_error, r2_score
+
+from dataset import load_dataset
+from holdout import holdout_split
+from profiling import measure_single_row_latency, measure_batch_throughput
+from train_model import MODEL_MAP, get_model_instance, model_input
+
+# -----------------------------
+# Configure logging
+# -----------------------------
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from the `benchmark` section of model_config.yaml or the CLI
+DEFAULT_LATENCY_BUDGET_MS = 20.0
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_REPEATS = 200
+
+# -----------------------------
+# Argument parser
+# -----------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark every supported model on accuracy, latency and size, "
+                    "and pick the most accurate one that fits a latency budget."
+    )
+    parser.add_argument("--config", type=str, required=True, help="Path to model_config.yaml")
+    parser.add_argument("--data", type=str, required=True,
+                        help="Path to processed dataset: sparse .npz from engineer.py, or CSV")
+    parser.add_argument("--output", type=str, default="models/benchmark/model_benchmark.json",
+                        help="Path to write the JSON benchmark report")
+    parser.add_argument("--latency-budget-ms", type=float, default=None,
+                        help="Max p95 single-row predict latency in ms for a model to be eligible")
+    parser.add_argument("--batch-size", type=int, default=None, help="Rows per batched predict call")
+    parser.add_argument("--repeats", type=int, default=None, help="Timed repetitions per latency measurement")
+    return parser.parse_args()
+
+# -----------------------------
+# Measurements
+# -----------------------------
+def measure_artifact(model, repeats=5):
+    """Serialized size and joblib load time of the model."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.pkl")
+        joblib.dump(model, path)
+        size_bytes = os.path.getsize(path)
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            joblib.load(path)
+            samples.append(time.perf_counter() - start)
+    return {
+        "artifact_size_bytes": size_bytes,
+        "load_time_ms": round(float(np.median(samples)) * 1000, 4),
+    }
+
+def benchmark_model(name, params, X_train, X_test, y_train, y_test, batch_size, repeats):
+    model = get_model_instance(name, params)
+
+    start = time.perf_counter()
+    model.fit(model_input(name, X_train), y_train)
+    fit_time = time.perf_counter() - start
+
+    # Accuracy on the matrix as trained (XGBoost reads absent sparse entries as
+    # missing); latency on dense rows, which is what serving predicts from
+    y_pred = model.predict(model_input(name, X_test))
+    X_serve = X_test.toarray() if hasattr(X_test, "toarray") else X_test
+    return {
+        "model": name,
+        "parameters": params,
+        "mae": float(mean_absolute_error(y_test, y_pred)),
+        "r2": float(r2_score(y_test, y_pred)),
+        "fit_time_s": round(fit_time, 4),
+        "single_row": measure_single_row_latency(model, X_serve, repeats),
+        "batch": measure_batch_throughput(model, X_serve, batch_size, repeats),
+        **measure_artifact(model),
+    }
+
+def select_model(results, latency_budget_ms):
+    """Lowest-MAE model whose p95 single-row latency fits the budget, or None."""
+    eligible = [r for r in results if r["single_row"]["p95_ms"] <= latency_budget_ms]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda r: (r["mae"], -r["r2"]))["model"]
+
+# -----------------------------
+# Main logic
+# -----------------------------
+def main(args):
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    model_cfg = config['model']
+    bench_cfg = config.get('benchmark', {}) or {}
+
+    # An explicit 0 on the command line is a value, not "unset"
+    latency_budget_ms = (args.latency_budget_ms if args.latency_budget_ms is not None
+                         else bench_cfg.get('latency_budget_ms', DEFAULT_LATENCY_BUDGET_MS))
+    batch_size = args.batch_size if args.batch_size is not None else bench_cfg.get('batch_size', DEFAULT_BATCH_SIZE)
+    repeats = args.repeats if args.repeats is not None else bench_cfg.get('repeats', DEFAULT_REPEATS)
+    model_params = bench_cfg.get('parameters', {}) or {}
+
+    # Same split as train_model.py so the accuracy numbers are comparable
+    X, y, _ = load_dataset(args.data, model_cfg['target_variable'])
+    if not hasattr(X, "toarray"):
+        X = X.to_numpy(dtype=np.float64)
+    y = np.asarray(y)
+    X_train, X_test, y_train, y_test = holdout_split(X, y)
+
+    results = []
+    for name in MODEL_MAP:
+        # The tuned parameters apply to the configured best model; the others use
+        # benchmark.parameters.<name> when given and library defaults otherwise.
+        params = model_cfg['parameters'] if name == model_cfg['best_model'] else model_params.get(name, {})
+        logger.info(f"Benchmarking {name}")
+        results.append(benchmark_model(name, params, X_train, X_test, y_train, y_test, batch_size, repeats))
+
+    selected = select_model(results, latency_budget_ms)
+    report = {
+        "dataset": args.data,
+        "n_rows": int(X.shape[0]),
+        "latency_budget_ms": latency_budget_ms,
+        "batch_size": batch_size,
+        "repeats": repeats,
+        "selected_model": selected,
+        "results": results,
+    }
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    header = f"{'model':<18}{'MAE':>12}{'R2':>8}{'p95 1-row ms':>14}{'batch rows/s':>14}{'load ms':>10}{'size KB':>10}"
+    logger.info("Benchmark results:\n" + "\n".join([header] + [
+        f"{r['model']:<18}{r['mae']:>12.2f}{r['r2']:>8.4f}{r['single_row']['p95_ms']:>14.3f}"
+        f"{r['batch']['rows_per_sec']:>14.0f}{r['load_time_ms']:>10.2f}{r['artifact_size_bytes'] / 1024:>10.1f}"
+        for r in results
+    ]))
+    if selected is None:
+        logger.warning(f"No model meets the {latency_budget_ms} ms p95 latency budget")
+    else:
+        logger.info(f"Selected model within {latency_budget_ms} ms budget: {selected}")
+    logger.info(f"Saved benchmark report to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,138 @@
+import argparse
+import copy
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error, r2_score
+
+from holdout import holdout_mask
+from serving_bundle import ServingBundle, SERVING_DERIVED_FEATURES
+
+# -----------------------------
+# Configure logging
+# -----------------------------
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+REQUEST_FIELDS = ["sqft", "bedrooms", "bathrooms", "location", "year_built", "condition"]
+
+# -----------------------------
+# Argument parser
+# -----------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure the latency cost and accuracy gain of looking up price_per_sqft "
+                    "in the serving bundle's price index instead of filling it with 0."
+    )
+    parser.add_argument("--bundle", type=str, default="models/trained/house_price_model.npz",
+                        help="Serving bundle exported with a price index")
+    parser.add_argument("--data", type=str, default="data/processed/cleaned_house_data.csv",
+                        help="Cleaned CSV with request fields and price, for the accuracy comparison")
+    parser.add_argument("--output", type=str, default="models/benchmark/price_index_benchmark.json",
+                        help="Path to write the JSON report")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per batched call")
+    parser.add_argument("--repeats", type=int, default=2000, help="Timed repetitions per measurement")
+    return parser.parse_args()
+
+# -----------------------------
+# Measurements
+# -----------------------------
+def time_call(fn, repeats):
+    fn()  # warm up
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples_us = np.asarray(samples) * 1e6
+    return {
+        "p50_us": round(float(np.percentile(samples_us, 50)), 2),
+        "p95_us": round(float(np.percentile(samples_us, 95)), 2),
+    }
+
+def request_frame(df):
+    """Columns as the API builds them from request JSON."""
+    return {name: df[name].to_numpy() for name in REQUEST_FIELDS}
+
+def latency_report(bundle, constant_bundle, df, batch_size, repeats):
+    index = bundle.indexes["price_per_sqft"]
+    single = request_frame(df.iloc[:1])
+    batch = request_frame(df.sample(batch_size, replace=True, random_state=0))
+    report = {}
+    for label, frame, n in (("single_row", single, repeats), ("batch", batch, max(repeats // 10, 10))):
+        report[label] = {
+            "lookup_only": time_call(lambda: index.lookup(frame["location"], frame["condition"]), n),
+            "predict_with_lookup": time_call(lambda: bundle.predict_frame(dict(frame)), n),
+            "predict_with_constant": time_call(lambda: constant_bundle.predict_frame(dict(frame)), n),
+        }
+        report[label]["lookup_share_of_predict"] = round(
+            report[label]["lookup_only"]["p50_us"] / report[label]["predict_with_lookup"]["p50_us"], 4
+        )
+    return report
+
+def accuracy_report(bundle, df):
+    """Hold-out accuracy with price_per_sqft from the index, as 0, and as the true (leaky) value."""
+    # Same row order and split as train_model.py and the price index build in
+    # engineer.py, so neither the model nor the index has seen these rows
+    test_idx = np.flatnonzero(holdout_mask(0, len(df)))
+    test = df.iloc[test_idx]
+    frame = bundle.add_derived_features(request_frame(test))
+    variants = {
+        "price_index": frame["price_per_sqft"],
+        "constant_zero": np.zeros(len(test)),
+        "true_value": (test["price"] / test["sqft"]).to_numpy(),
+    }
+    report = {}
+    for label, price_per_sqft in variants.items():
+        y_pred = bundle.predict(bundle.transform({**frame, "price_per_sqft": price_per_sqft}))
+        report[label] = {
+            "mae": round(float(mean_absolute_error(test["price"], y_pred)), 2),
+            "r2": round(float(r2_score(test["price"], y_pred)), 4),
+        }
+    return report
+
+# -----------------------------
+# Main logic
+# -----------------------------
+def main(args):
+    bundle = ServingBundle.load(args.bundle)
+    if "price_per_sqft" not in bundle.indexes:
+        raise ValueError(f"{args.bundle} has no price index; retrain after running feature engineering")
+    # Same bundle with the old constant-0 price_per_sqft, for comparison
+    constant_bundle = copy.copy(bundle)
+    constant_bundle.derived_features = SERVING_DERIVED_FEATURES
+
+    df = pd.read_csv(args.data)
+    report = {
+        "bundle": args.bundle,
+        "model_version": bundle.version,
+        "index_size": {
+            "locations": len(bundle.indexes["price_per_sqft"].locations),
+            "conditions": len(bundle.indexes["price_per_sqft"].conditions),
+        },
+        "latency": latency_report(bundle, constant_bundle, df, args.batch_size, args.repeats),
+        "accuracy": accuracy_report(bundle, df),
+    }
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for label, stats in report["latency"].items():
+        logger.info(
+            f"{label}: lookup {stats['lookup_only']['p50_us']:.1f} us, predict "
+            f"{stats['predict_with_constant']['p50_us']:.1f} -> {stats['predict_with_lookup']['p50_us']:.1f} us "
+            f"(p50; lookup is {stats['lookup_share_of_predict']:.1%} of predict)"
+        )
+    for label, stats in report["accuracy"].items():
+        logger.info(f"price_per_sqft from {label}: hold-out MAE {stats['mae']:.2f}, R² {stats['r2']:.4f}")
+    logger.info(f"Saved price index benchmark to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
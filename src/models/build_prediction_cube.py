@@ -0,0 +1,55 @@
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from serving_bundle import ServingBundle
+# prediction_cube ships with the API; serving_bundle has put src/api on the path
+from prediction_cube import CUBE_AXES, CUBE_BATCH_ROWS, build_cube, bundle_fingerprint  # noqa: E402
+
+# -----------------------------
+# Configure logging
+# -----------------------------
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Argument parser
+# -----------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Score every input the UI can send with the serving bundle and save the "
+                    "predictions as a memory-mapped cube for the API."
+    )
+    parser.add_argument("--bundle", type=str, default="models/trained/house_price_model.npz",
+                        help="Serving bundle exported by train_model.py")
+    parser.add_argument("--output", type=str, default="models/trained/prediction_cube.npy",
+                        help="Cube array to write; its metadata goes next to it as .json")
+    parser.add_argument("--batch-rows", type=int, default=CUBE_BATCH_ROWS, help="Grid points per predict call")
+    return parser.parse_args()
+
+# -----------------------------
+# Main logic
+# -----------------------------
+def main(args):
+    bundle = ServingBundle.load(args.bundle)
+    start = time.perf_counter()
+    cube = build_cube(
+        args.output,
+        bundle.predict_frame,
+        bundle_fingerprint(bundle),
+        CUBE_AXES,
+        args.batch_rows,
+    )
+    elapsed = time.perf_counter() - start
+    size_mb = cube.values.nbytes / (1024 * 1024)
+    logger.info(f"Scored {cube.values.size} grid points {cube.shape} in {elapsed:.1f} s "
+                f"({cube.values.size / elapsed:,.0f} rows/sec)")
+    logger.info(f"Saved prediction cube ({size_mb:.1f} MB) for model {bundle.version} to {args.output}")
+    logger.info(f"Prediction range: {float(np.min(cube.values)):,.0f} to {float(np.max(cube.values)):,.0f}")
+    return cube
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,214 @@
+import copy
+import logging
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_absolute_error, r2_score
+
+from profiling import measure_single_row_latency, measure_batch_throughput
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from the `compression` section of model_config.yaml
+DEFAULT_R2_TOLERANCE = 0.001
+DEFAULT_PRUNE_METHOD = "greedy"
+DEFAULT_MAX_TREES = 30
+DEFAULT_LATENCY_REPEATS = 200
+DEFAULT_BATCH_SIZE = 1000
+# Rows used to choose trees; the per-tree prediction matrix is rows x trees
+MAX_SELECTION_ROWS = 20_000
+# Fewest rows in each half of the hold-out; fewer can't tell an R² drop of
+# r2_tolerance from noise
+DEFAULT_MIN_SELECTION_ROWS = 200
+
+# Students a model can be distilled into, with their default hyperparameters
+DISTILL_STUDENTS = {
+    "gradient_boosting": (GradientBoostingRegressor, {"n_estimators": 100, "max_depth": 3,
+                                                      "learning_rate": 0.1, "random_state": 42}),
+    "linear": (LinearRegression, {}),
+}
+
+# -----------------------------
+# Forest pruning
+# -----------------------------
+def tree_predictions(forest, X):
+    """Each tree's predictions on X, one column per tree."""
+    return np.column_stack([tree.predict(X) for tree in forest.estimators_])
+
+def _r2(y, pred, ss_tot):
+    return 1.0 - ((y[:, None] - pred) ** 2).sum(axis=0) / ss_tot
+
+def select_trees_greedy(P, y, target_r2, max_trees):
+    """
+    Forward selection: repeatedly add the tree that most improves the R² of
+    the averaged subset, until it reaches `target_r2` or `max_trees`.
+    """
+    ss_tot = float(((y - y.mean()) ** 2).sum())
+    selected, total = [], np.zeros(len(y))
+    remaining = np.ones(P.shape[1], dtype=bool)
+    while len(selected) < max_trees and remaining.any():
+        candidates = np.flatnonzero(remaining)
+        # R² of every one-tree extension at once
+        scores = _r2(y, (total[:, None] + P[:, candidates]) / (len(selected) + 1), ss_tot)
+        best = candidates[scores.argmax()]
+        selected.append(int(best))
+        remaining[best] = False
+        total += P[:, best]
+        if scores.max() >= target_r2:
+            break
+    return selected
+
+def select_trees_by_importance(P, y, target_r2, max_trees):
+    """Rank trees by their own R² and keep the shortest prefix reaching `target_r2`."""
+    ss_tot = float(((y - y.mean()) ** 2).sum())
+    order = np.argsort(-_r2(y, P, ss_tot))[:max_trees]
+    prefix_means = np.cumsum(P[:, order], axis=1) / np.arange(1, len(order) + 1)
+    reached = np.flatnonzero(_r2(y, prefix_means, ss_tot) >= target_r2)
+    k = int(reached[0]) + 1 if len(reached) else len(order)
+    return [int(i) for i in order[:k]]
+
+PRUNE_METHODS = {"greedy": select_trees_greedy, "importance": select_trees_by_importance}
+
+def prune_forest(forest, X_select, y_select, r2_tolerance=DEFAULT_R2_TOLERANCE,
+                 method=DEFAULT_PRUNE_METHOD, max_trees=DEFAULT_MAX_TREES):
+    """
+    A copy of `forest` keeping the fewest trees whose average stays within
+    `r2_tolerance` of the full forest's R² on the selection rows.
+    """
+    if method not in PRUNE_METHODS:
+        raise ValueError(f"Unknown pruning method {method!r}; expected one of {sorted(PRUNE_METHODS)}")
+    y_select = np.asarray(y_select, dtype=np.float64)
+    P = tree_predictions(forest, X_select)
+    target_r2 = float(r2_score(y_select, P.mean(axis=1))) - r2_tolerance
+    selected = PRUNE_METHODS[method](P, y_select, target_r2, min(max_trees, P.shape[1]))
+    if float(r2_score(y_select, P[:, selected].mean(axis=1))) < target_r2:
+        logger.warning(f"Pruning stopped at max_trees={max_trees} before reaching R² {target_r2:.6f}")
+
+    pruned = copy.deepcopy(forest)
+    pruned.estimators_ = [forest.estimators_[i] for i in selected]
+    pruned.n_estimators = len(selected)
+    return pruned, selected
+
+# -----------------------------
+# Distillation
+# -----------------------------
+def distill(teacher, X_train, student, params=None):
+    """Fit a `student` model (see DISTILL_STUDENTS) to the teacher's predictions on X_train."""
+    if student not in DISTILL_STUDENTS:
+        raise ValueError(f"Unknown distillation student {student!r}; expected one of {sorted(DISTILL_STUDENTS)}")
+    cls, defaults = DISTILL_STUDENTS[student]
+    model = cls(**{**defaults, **(params or {})})
+    # The teacher's predictions are smoother targets than the noisy prices
+    model.fit(X_train, teacher.predict(X_train))
+    return model
+
+# -----------------------------
+# Evaluation
+# -----------------------------
+def evaluate_tier(model, X_eval, y_eval, teacher_pred, predictor=None, repeats=DEFAULT_LATENCY_REPEATS,
+                  batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Accuracy against the true prices and against the full model, plus serving
+    latency of `predictor` (the tier's serving bundle, or the model itself) on
+    dense rows.
+    """
+    y_pred = model.predict(X_eval)
+    X_dense = X_eval.toarray() if hasattr(X_eval, "toarray") else np.asarray(X_eval, dtype=np.float64)
+    predictor = predictor or model
+    return {
+        "mae": float(mean_absolute_error(y_eval, y_pred)),
+        "r2": float(r2_score(y_eval, y_pred)),
+        # How closely the tier reproduces the full model
+        "fidelity_r2": float(r2_score(teacher_pred, y_pred)),
+        "single_row": measure_single_row_latency(predictor, X_dense, repeats),
+        "batch": measure_batch_throughput(predictor, X_dense, batch_size, repeats),
+    }
+
+def split_holdout(X_test, y_test, seed=42):
+    """Split the hold-out rows in half: one half picks trees, the other scores every tier."""
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(X_test.shape[0])
+    half = len(order) // 2
+    y_test = np.asarray(y_test)
+    return X_test[order[:half]], y_test[order[:half]], X_test[order[half:]], y_test[order[half:]]
+
+def compress_model(model, X_train, X_select, y_select, config):
+    """
+    Build the compressed tiers configured in the `compression` config section.
+    Returns {tier name: (model, info)}, where info describes how the tier was
+    made (e.g. the selected tree indices).
+    """
+    tiers = {}
+    if isinstance(model, RandomForestRegressor):
+        pruned, selected = prune_forest(
+            model, X_select, y_select,
+            r2_tolerance=config.get("r2_tolerance", DEFAULT_R2_TOLERANCE),
+            method=config.get("prune_method", DEFAULT_PRUNE_METHOD),
+            max_trees=config.get("max_trees", DEFAULT_MAX_TREES),
+        )
+        tiers["pruned"] = (pruned, {"n_trees": len(selected), "selected_trees": selected})
+        logger.info(f"Pruned forest to {len(selected)} of {len(model.estimators_)} trees")
+    else:
+        logger.info(f"Skipping tree pruning: {type(model).__name__} is not a random forest")
+
+    for student in config.get("distill") or []:
+        params = (config.get("student_params") or {}).get(student)
+        tiers[f"distilled_{student}"] = (distill(model, X_train, student, params), {"student": student})
+        logger.info(f"Distilled model into {student}")
+    return tiers
+
+def build_tiers(model, full_bundle, X_train, X_test, y_test, config, export_tier):
+    """
+    Compress `model`, score each tier against the full model on held-out rows
+    the pruning never saw, and export the tiers whose R² stays within
+    `r2_tolerance` of the full model's with `export_tier(name, tier model)`
+    (which returns the tier's serving bundle). Tiers that miss it are reported
+    as rejected and not returned.
+    Returns ({tier name: tier model}, report).
+    """
+    if hasattr(X_test, "iloc"):
+        X_test = X_test.to_numpy(dtype=np.float64)
+    r2_tolerance = config.get("r2_tolerance", DEFAULT_R2_TOLERANCE)
+    min_rows = config.get("min_selection_rows", DEFAULT_MIN_SELECTION_ROWS)
+    X_select, y_select, X_eval, y_eval = split_holdout(X_test, y_test)
+    report = {"selection_rows": int(X_select.shape[0]), "evaluation_rows": int(X_eval.shape[0]),
+              "r2_tolerance": r2_tolerance, "tiers": {}}
+    if X_select.shape[0] < min_rows:
+        report["skipped"] = (f"{X_test.shape[0]} hold-out rows; each half needs at least "
+                             f"min_selection_rows={min_rows}")
+        logger.warning(f"Skipping compression: {report['skipped']}")
+        return {}, report
+
+    # The split is shuffled, so a prefix is a random sample
+    X_select, y_select = X_select[:MAX_SELECTION_ROWS], y_select[:MAX_SELECTION_ROWS]
+    report["selection_rows"] = int(X_select.shape[0])
+    repeats = config.get("repeats", DEFAULT_LATENCY_REPEATS)
+    batch_size = config.get("batch_size", DEFAULT_BATCH_SIZE)
+
+    teacher_pred = model.predict(X_eval)
+    full = evaluate_tier(model, X_eval, y_eval, teacher_pred, full_bundle, repeats, batch_size)
+    report["full"] = {**full, "n_trees": len(getattr(model, "estimators_", [])) or None}
+
+    models = {}
+    for name, (tier_model, info) in compress_model(model, X_train, X_select, y_select, config).items():
+        # Check accuracy on the evaluation half before spending an export on the tier
+        r2 = float(r2_score(y_eval, tier_model.predict(X_eval)))
+        r2_drop = full["r2"] - r2
+        if r2_drop > r2_tolerance:
+            report["tiers"][name] = {**info, "r2": r2, "r2_drop": r2_drop, "rejected": True}
+            logger.warning(f"Rejecting {name}: R² {r2:.4f} is {r2_drop:.4f} below the full model's "
+                           f"{full['r2']:.4f}, more than r2_tolerance={r2_tolerance}")
+            continue
+
+        bundle = export_tier(name, tier_model)
+        metrics = evaluate_tier(tier_model, X_eval, y_eval, teacher_pred, bundle, repeats, batch_size)
+        metrics["r2_drop"] = r2_drop
+        metrics["speedup_single_row"] = round(full["single_row"]["p50_ms"] / metrics["single_row"]["p50_ms"], 2)
+        metrics["speedup_batch"] = round(metrics["batch"]["rows_per_sec"] / full["batch"]["rows_per_sec"], 2)
+        report["tiers"][name] = {**info, **metrics, "rejected": False}
+        models[name] = tier_model
+        logger.info(f"{name}: R² {metrics['r2']:.4f} (full {full['r2']:.4f}), "
+                    f"single-row p50 {metrics['single_row']['p50_ms']:.3f} ms "
+                    f"({metrics['speedup_single_row']}x faster)")
+    return models, report
@@ -0,0 +1,63 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Part files inside a partitioned dataset directory, read in name order
+PART_PATTERNS = ("part-*.npz", "part-*.csv")
+
+def load_dataset(path, target):
+    """
+    Features and target from the processed dataset. A .npz written by
+    engineer.py loads as a CSR matrix without densifying it; a CSV loads as a
+    DataFrame. Returns (X, y, nbytes).
+    """
+    if path.endswith('.npz'):
+        with np.load(path, allow_pickle=False) as data:
+            X = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+            if 'target' not in data.files or str(data['target_name']) != target:
+                raise ValueError(f"{path} has no '{target}' target column")
+            y = data['target']
+        nbytes = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes + y.nbytes
+        return X, y, nbytes
+    data = pd.read_csv(path)
+    return data.drop(columns=[target]), data[target], int(data.memory_usage(deep=True).sum())
+
+def dataset_parts(path):
+    """The files making up `path`: the file itself, or a directory's part files."""
+    if not os.path.isdir(path):
+        return [path]
+    for pattern in PART_PATTERNS:
+        parts = sorted(glob.glob(os.path.join(path, pattern)))
+        if parts:
+            return parts
+    raise ValueError(f"No part-*.npz or part-*.csv files in {path}")
+
+def count_rows(path):
+    """Row count without loading the data: CSV lines are counted, .npz shapes read."""
+    total = 0
+    for part in dataset_parts(path):
+        if part.endswith('.npz'):
+            with np.load(part, allow_pickle=False) as data:
+                total += int(data['shape'][0])
+        else:
+            with open(part, 'rb') as f:
+                total += sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b'')) - 1
+    return total
+
+def iter_chunks(path, target, chunk_size):
+    """
+    Yield (X, y) chunks of at most `chunk_size` rows, in file order. CSVs are
+    streamed with pandas; a .npz part (already compact CSR) is loaded one part
+    at a time and sliced, so a directory of parts bounds memory by part size.
+    """
+    for part in dataset_parts(path):
+        if part.endswith('.npz'):
+            X, y, _ = load_dataset(part, target)
+            for start in range(0, X.shape[0], chunk_size):
+                yield X[start:start + chunk_size], y[start:start + chunk_size]
+        else:
+            for chunk in pd.read_csv(part, chunksize=chunk_size):
+                yield chunk.drop(columns=[target]), chunk[target].to_numpy()
@@ -0,0 +1,29 @@
+import numpy as np
+from scipy import sparse
+
+# The one hold-out split every stage agrees on: feature engineering builds the
+# price index without these rows, and training and the benchmarks score on them
+HOLDOUT_TEST_SIZE = 0.2
+HOLDOUT_SEED = 42
+
+def holdout_mask(start, n_rows, test_size=HOLDOUT_TEST_SIZE, seed=HOLDOUT_SEED):
+    """
+    Hold-out membership of global rows start..start+n_rows-1, from a hash of
+    the row index, so the split doesn't depend on chunk size or file layout.
+    """
+    with np.errstate(over="ignore"):
+        z = np.arange(start, start + n_rows, dtype=np.uint64) + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15)
+        # splitmix64 finalizer
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(np.float64) / float(1 << 53) < test_size
+
+def take_rows(X, mask):
+    """Rows of X (sparse, array, DataFrame or Series) where `mask` is True."""
+    return X[mask] if sparse.issparse(X) or isinstance(X, np.ndarray) else X.iloc[mask]
+
+def holdout_split(X, y):
+    """In-memory (X_train, X_test, y_train, y_test) with the rows holdout_mask() picks held out."""
+    mask = holdout_mask(0, X.shape[0])
+    return take_rows(X, ~mask), take_rows(X, mask), take_rows(y, ~mask), take_rows(y, mask)
@@ -0,0 +1,201 @@
+import copy
+import logging
+import time
+
+import joblib
+import mlflow
+import mlflow.sklearn
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from mlflow.tracking import MlflowClient
+from scipy import sparse
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the `incremental` section of model_config.yaml
+DEFAULT_ADD_ESTIMATORS = 30
+DEFAULT_RETIRE_OLDEST = 0
+DEFAULT_HOLDOUT_FRACTION = 0.2
+
+# -----------------------------
+# Base model and data
+# -----------------------------
+def load_base_model(model_name, base_model=None):
+    """
+    The model to update and its registry version: `base_model` as a .pkl path
+    or MLflow model URI, or by default the newest registered version of
+    `model_name`. The version is None for a .pkl.
+    """
+    if base_model and base_model.endswith(".pkl"):
+        logger.info(f"Loading base model from {base_model}")
+        return joblib.load(base_model), None
+    client = MlflowClient()
+    if base_model:
+        # models:/<name>/<version> names its version; anything else is taken as-is
+        version = None
+        parts = base_model.split("/")
+        if base_model.startswith("models:/") and len(parts) == 3 and parts[2].isdigit():
+            version = client.get_model_version(parts[1], parts[2])
+        uri = base_model
+    else:
+        versions = client.search_model_versions(f"name='{model_name}'")
+        if not versions:
+            raise ValueError(f"No registered versions of {model_name} to update; train a full model first")
+        version = max(versions, key=lambda v: int(v.version))
+        uri = f"models:/{model_name}/{version.version}"
+    logger.info(f"Loading base model from {uri}")
+    return mlflow.sklearn.load_model(uri), version
+
+def base_run_metrics(version):
+    """Metrics of the run that produced a registered version, {} if unknown."""
+    if version is None or not version.run_id:
+        return {}
+    return dict(MlflowClient().get_run(version.run_id).data.metrics)
+
+def _rows(X, start, stop):
+    return X.iloc[start:stop] if isinstance(X, (pd.DataFrame, pd.Series)) else X[start:stop]
+
+def rolling_split(X, y, holdout_fraction=DEFAULT_HOLDOUT_FRACTION):
+    """
+    Split appended rows by arrival order: the oldest to train on, the newest
+    `holdout_fraction` held out, so the update is judged on listings newer than
+    any it learned from.
+    """
+    n_rows = X.shape[0]
+    n_test = max(1, int(round(n_rows * holdout_fraction)))
+    if n_test >= n_rows:
+        raise ValueError(f"Need more than {n_test} new rows for a hold-out fraction of {holdout_fraction}")
+    cut = n_rows - n_test
+    return _rows(X, 0, cut), _rows(X, cut, n_rows), _rows(y, 0, cut), _rows(y, cut, n_rows)
+
+def stack_rows(a, b):
+    """Rows of `b` appended to `a`: sparse, dense or DataFrame alike."""
+    if sparse.issparse(a):
+        return sparse.vstack([a, b], format="csr")
+    if isinstance(a, (pd.DataFrame, pd.Series)):
+        return pd.concat([a, b], ignore_index=True)
+    return np.concatenate([a, b])
+
+# -----------------------------
+# Per-model updates
+# -----------------------------
+def grow_forest(model, X, y, add_estimators, retire_oldest=DEFAULT_RETIRE_OLDEST):
+    """
+    Fit `add_estimators` new trees on (X, y) with warm_start, then drop the
+    `retire_oldest` oldest trees. warm_start appends to estimators_, so the
+    list is oldest first.
+    """
+    total = len(model.estimators_) + add_estimators
+    if retire_oldest >= total:
+        raise ValueError(f"Retiring {retire_oldest} of {total} trees would leave an empty forest")
+    warm_start = model.warm_start
+    model.set_params(warm_start=True, n_estimators=total)
+    model.fit(X, y)
+    if retire_oldest:
+        model.estimators_ = model.estimators_[retire_oldest:]
+    model.set_params(n_estimators=len(model.estimators_), warm_start=warm_start)
+    return model
+
+def grow_boosting(model, X, y, add_estimators):
+    """Fit `add_estimators` more stages on (X, y), starting from the current ensemble's predictions."""
+    warm_start = model.warm_start
+    model.set_params(warm_start=True, n_estimators=model.n_estimators_ + add_estimators)
+    model.fit(X, y)
+    model.set_params(warm_start=warm_start)
+    return model
+
+def continue_xgboost(model, X, y, add_estimators):
+    """Boost `add_estimators` more rounds on (X, y) from the existing booster."""
+    booster = model.get_booster()
+    total = booster.num_boosted_rounds() + add_estimators
+    updated = xgb.XGBRegressor(**{**model.get_params(), "n_estimators": add_estimators})
+    updated.fit(X, y, xgb_model=booster)
+    # Record the full round count, as if it had been trained in one go
+    updated.set_params(n_estimators=total)
+    return updated
+
+def continue_training(model, X, y, add_estimators=DEFAULT_ADD_ESTIMATORS, retire_oldest=DEFAULT_RETIRE_OLDEST):
+    """A copy of `model` updated with the new rows (X, y); the base model is left untouched."""
+    model = copy.deepcopy(model)
+    if retire_oldest and not isinstance(model, RandomForestRegressor):
+        raise ValueError("Only RandomForest trees are independent enough to retire")
+    if isinstance(model, RandomForestRegressor):
+        return grow_forest(model, X, y, add_estimators, retire_oldest)
+    if isinstance(model, GradientBoostingRegressor):
+        return grow_boosting(model, X, y, add_estimators)
+    if isinstance(model, xgb.XGBRegressor):
+        return continue_xgboost(model, X, y, add_estimators)
+    raise ValueError(f"{type(model).__name__} can't be updated incrementally; run a full retrain")
+
+def n_estimators(model):
+    if isinstance(model, xgb.XGBRegressor):
+        return int(model.get_booster().num_boosted_rounds())
+    if isinstance(model, GradientBoostingRegressor):
+        return int(model.n_estimators_)
+    return len(model.estimators_)
+
+def _evaluate(model, X, y):
+    pred = model.predict(X)
+    return {"mae": float(mean_absolute_error(y, pred)), "r2": float(r2_score(y, pred))}
+
+# -----------------------------
+# Incremental training
+# -----------------------------
+def train_incremental(base_model, X_train, y_train, X_test, y_test, config, base_metrics=None, base_data=None):
+    """
+    Update `base_model` with the new training rows and compare it with the
+    base model on the rolling hold-out. The cost of a full retrain is measured
+    by refitting on `base_data` plus the new rows when given as (X, y), else
+    estimated from the base run's `full_fit_s` and `n_train` metrics scaled to
+    the larger dataset. Returns (model, report).
+    """
+    add_estimators = int(config.get("add_estimators", DEFAULT_ADD_ESTIMATORS))
+    retire_oldest = int(config.get("retire_oldest", DEFAULT_RETIRE_OLDEST))
+    base_metrics = base_metrics or {}
+
+    start = time.perf_counter()
+    model = continue_training(base_model, X_train, y_train, add_estimators, retire_oldest)
+    fit_s = time.perf_counter() - start
+
+    report = {
+        "model": type(model).__name__,
+        "new_train_rows": int(X_train.shape[0]),
+        "holdout_rows": int(X_test.shape[0]),
+        "added_estimators": add_estimators,
+        "retired_estimators": retire_oldest,
+        "estimators_before": n_estimators(base_model),
+        "estimators_after": n_estimators(model),
+        "fit_s": round(fit_s, 3),
+        "base": _evaluate(base_model, X_test, y_test),
+        "incremental": _evaluate(model, X_test, y_test),
+    }
+
+    full = None
+    if base_data is not None:
+        X_base, y_base = base_data
+        X_full = stack_rows(X_base, X_train)
+        y_full = stack_rows(np.asarray(y_base), np.asarray(y_train))
+        full_model = type(base_model)(**base_model.get_params())
+        start = time.perf_counter()
+        full_model.fit(X_full, y_full)
+        full = {"fit_s": round(time.perf_counter() - start, 3), "n_train": int(X_full.shape[0]), "measured": True}
+        full.update(_evaluate(full_model, X_test, y_test))
+    elif base_metrics.get("full_fit_s") and base_metrics.get("n_train"):
+        # Tree fitting grows roughly linearly with the row count
+        n_train = int(base_metrics["n_train"]) + int(X_train.shape[0])
+        full = {
+            "fit_s": round(base_metrics["full_fit_s"] * n_train / base_metrics["n_train"], 3),
+            "n_train": n_train,
+            "measured": False,
+        }
+    report["full_retrain"] = full
+    if full is not None:
+        report["n_train"] = full["n_train"]
+        report["speedup_vs_full"] = round(full["fit_s"] / max(fit_s, 1e-9), 1)
+        report["saved_s"] = round(full["fit_s"] - fit_s, 3)
+    elif base_metrics.get("n_train"):
+        report["n_train"] = int(base_metrics["n_train"]) + int(X_train.shape[0])
+    return model, report
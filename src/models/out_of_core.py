@@ -0,0 +1,204 @@
+import logging
+import math
+import os
+import tempfile
+
+import numpy as np
+import xgboost as xgb
+from scipy import sparse
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.linear_model import LinearRegression
+
+from dataset import count_rows, iter_chunks
+from holdout import HOLDOUT_SEED, HOLDOUT_TEST_SIZE, holdout_mask, take_rows
+
+logger = logging.getLogger(__name__)
+
+# Rows kept from the first hold-out chunk to verify the serving bundle export
+CHECK_ROWS = 1000
+
+# -----------------------------
+# Streaming split and metrics
+# -----------------------------
+def iter_split(path, target, chunk_size, test_size, seed, holdout):
+    """Yield the training (holdout=False) or hold-out (holdout=True) rows of each chunk."""
+    start = 0
+    for X, y in iter_chunks(path, target, chunk_size):
+        mask = holdout_mask(start, X.shape[0], test_size, seed)
+        start += X.shape[0]
+        if not holdout:
+            mask = ~mask
+        if mask.any():
+            yield take_rows(X, mask), np.asarray(y)[mask]
+
+class StreamingMetrics:
+    """MAE and R² accumulated chunk by chunk from running sums."""
+
+    def __init__(self):
+        self.n = 0
+        self.abs_error = 0.0
+        self.sq_error = 0.0
+        self.sum_y = 0.0
+        self.sum_y2 = 0.0
+
+    def update(self, y_true, y_pred):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        error = y_true - np.asarray(y_pred, dtype=np.float64)
+        self.n += len(y_true)
+        self.abs_error += float(np.abs(error).sum())
+        self.sq_error += float(np.square(error).sum())
+        self.sum_y += float(y_true.sum())
+        self.sum_y2 += float(np.square(y_true).sum())
+
+    def mae(self):
+        return self.abs_error / self.n
+
+    def r2(self):
+        total = self.sum_y2 - self.sum_y ** 2 / self.n
+        return 1.0 - self.sq_error / total if total > 0 else 0.0
+
+# -----------------------------
+# Per-model streaming trainers
+# -----------------------------
+def fit_linear_regression(params, train_chunks):
+    """
+    Exact least squares from streamed sufficient statistics: the centred Gram
+    matrix X'X and X'y, accumulated chunk by chunk (memory is n_features²).
+    """
+    n, sum_x, sum_y, xtx, xty = 0, None, 0.0, None, None
+    for X, y in train_chunks():
+        X = X if sparse.issparse(X) else np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if xtx is None:
+            sum_x, xtx, xty = np.zeros(X.shape[1]), np.zeros((X.shape[1], X.shape[1])), np.zeros(X.shape[1])
+        n += X.shape[0]
+        sum_x += np.asarray(X.sum(axis=0)).ravel()
+        sum_y += float(y.sum())
+        gram = X.T @ X
+        xtx += gram.toarray() if sparse.issparse(gram) else gram
+        xty += np.asarray(X.T @ y).ravel()
+
+    fit_intercept = params.get("fit_intercept", True)
+    mean_x = sum_x / n if fit_intercept else np.zeros_like(sum_x)
+    mean_y = sum_y / n if fit_intercept else 0.0
+    gram_c = xtx - n * np.outer(mean_x, mean_x)
+    xty_c = xty - n * mean_x * mean_y
+    # Minimum-norm solution, like LinearRegression's lstsq on rank-deficient one-hot blocks
+    coef = np.linalg.pinv(gram_c, hermitian=True) @ xty_c
+
+    model = LinearRegression(**params)
+    model.coef_ = coef
+    model.intercept_ = float(mean_y - mean_x @ coef)
+    model.n_features_in_ = len(coef)
+    model.rank_ = int(np.linalg.matrix_rank(gram_c, hermitian=True))
+    return model
+
+def _fit_warm_start(model, total, train_chunks, n_chunks, unit):
+    """Grow `model` by about total/n_chunks estimators on each chunk in turn."""
+    per_chunk = max(1, math.ceil(total / max(n_chunks, 1)))
+    if n_chunks > total:
+        logger.warning(f"{n_chunks} chunks but only {total} {unit}: the last chunks will not be used; "
+                       f"raise --chunk-size to train on all rows")
+    model.set_params(warm_start=True, n_estimators=0)
+    for X, y in train_chunks():
+        if model.n_estimators >= total:
+            break
+        model.set_params(n_estimators=min(total, model.n_estimators + per_chunk))
+        model.fit(X, y)
+    return model
+
+def fit_random_forest(params, train_chunks, n_chunks):
+    """Chunked tree building: each chunk grows its share of the forest's trees."""
+    model = RandomForestRegressor(**params)
+    return _fit_warm_start(model, model.n_estimators, train_chunks, n_chunks, "trees")
+
+def fit_gradient_boosting(params, train_chunks, n_chunks):
+    """
+    Each chunk fits its share of boosting stages on the residuals of the stages
+    before it, like stochastic gradient boosting with one chunk per subsample.
+    """
+    model = GradientBoostingRegressor(**params)
+    return _fit_warm_start(model, model.n_estimators, train_chunks, n_chunks, "boosting stages")
+
+class _ChunkIter(xgb.DataIter):
+    """Feeds training chunks to XGBoost, which pages them to an on-disk cache."""
+
+    def __init__(self, train_chunks, cache_prefix):
+        self._train_chunks = train_chunks
+        self._it = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._it is None:
+            self._it = self._train_chunks()
+        try:
+            X, y = next(self._it)
+        except StopIteration:
+            return 0
+        input_data(data=X, label=y)
+        return 1
+
+    def reset(self):
+        self._it = None
+
+def fit_xgboost(params, train_chunks):
+    """External-memory XGBoost: an iterator-built DMatrix cached on disk, trained with hist."""
+    params = dict(params)
+    num_boost_round = params.pop("n_estimators", 100)
+    booster_params = {"tree_method": "hist", **params}
+    # Names the sklearn wrapper uses for what the native API calls seed and nthread
+    if "random_state" in booster_params:
+        booster_params["seed"] = booster_params.pop("random_state")
+    if "n_jobs" in booster_params:
+        booster_params["nthread"] = booster_params.pop("n_jobs")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        dtrain = xgb.DMatrix(_ChunkIter(train_chunks, os.path.join(cache_dir, "cache")))
+        booster = xgb.train(booster_params, dtrain, num_boost_round=num_boost_round)
+        # Release the page cache before its directory is removed
+        del dtrain
+
+    # Hand back the usual sklearn wrapper so logging, saving and bundle export are unchanged
+    model = xgb.XGBRegressor(**{"n_estimators": num_boost_round, **params})
+    model.load_model(bytearray(booster.save_raw(raw_format="json")))
+    return model
+
+# -----------------------------
+# Entry point
+# -----------------------------
+def train_out_of_core(name, params, path, target, chunk_size, test_size=HOLDOUT_TEST_SIZE, seed=HOLDOUT_SEED):
+    """
+    Train model `name` on the training rows of `path` (CSV, .npz or a
+    directory of part files) without loading the dataset all at once.
+    """
+    def train_chunks():
+        return iter_split(path, target, chunk_size, test_size, seed, holdout=False)
+
+    n_rows = count_rows(path)
+    n_chunks = max(1, math.ceil(n_rows * (1 - test_size) / chunk_size))
+    logger.info(f"Out-of-core training on {n_rows} rows in about {n_chunks} chunks of {chunk_size}")
+
+    if name == "LinearRegression":
+        return fit_linear_regression(params, train_chunks)
+    if name == "RandomForest":
+        return fit_random_forest(params, train_chunks, n_chunks)
+    if name == "GradientBoosting":
+        return fit_gradient_boosting(params, train_chunks, n_chunks)
+    if name == "XGBoost":
+        return fit_xgboost(params, train_chunks)
+    raise ValueError(f"Out-of-core training is not supported for {name}")
+
+def evaluate_out_of_core(model, path, target, chunk_size, test_size=HOLDOUT_TEST_SIZE, seed=HOLDOUT_SEED):
+    """
+    Hold-out MAE and R² in one streaming pass over `path`.
+
+    Returns (metrics, X_check, sparse_input), where X_check holds up to
+    CHECK_ROWS hold-out rows for verifying the serving bundle.
+    """
+    metrics = StreamingMetrics()
+    X_check, sparse_input = None, False
+    for X, y in iter_split(path, target, chunk_size, test_size, seed, holdout=True):
+        metrics.update(y, model.predict(X))
+        if X_check is None:
+            X_check, sparse_input = X[:CHECK_ROWS], sparse.issparse(X)
+    return {"mae": metrics.mae(), "r2": metrics.r2(), "n_test": metrics.n}, X_check, sparse_input
@@ -0,0 +1,203 @@
+import json
+import resource
+import sys
+import time
+import platform
+from contextlib import contextmanager
+
+import numpy as np
+import xgboost as xgb
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+
+# -----------------------------
+# Memory helpers
+# -----------------------------
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+# -----------------------------
+# Latency helpers
+# -----------------------------
+def percentiles_ms(samples):
+    samples_ms = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(samples_ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(samples_ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(samples_ms, 99)), 4),
+    }
+
+def measure_single_row_latency(model, X, repeats):
+    """Latency of predicting one row at a time, the /predict path."""
+    rows = [X[i % len(X)].reshape(1, -1) for i in range(repeats)]
+    model.predict(rows[0])  # warm up
+    samples = []
+    for row in rows:
+        start = time.perf_counter()
+        model.predict(row)
+        samples.append(time.perf_counter() - start)
+    return percentiles_ms(samples)
+
+def measure_batch_throughput(model, X, batch_size, repeats):
+    """Latency and rows/sec of predicting `batch_size` rows in one call, the /batch-predict path."""
+    batch = np.resize(X, (batch_size, X.shape[1]))
+    model.predict(batch)  # warm up
+    samples = []
+    for _ in range(max(repeats // 10, 3)):
+        start = time.perf_counter()
+        model.predict(batch)
+        samples.append(time.perf_counter() - start)
+    stats = percentiles_ms(samples)
+    stats["rows_per_sec"] = round(batch_size / float(np.median(samples)), 1)
+    return stats
+
+# -----------------------------
+# Training profiler
+# -----------------------------
+class TrainingProfiler:
+    """
+    Records wall time, CPU time and peak RSS for each phase of a training run.
+    When disabled every method is a cheap no-op, so call sites need no branching.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.phases = []
+        self.estimator_fit_times = []
+        # How estimator_fit_times were measured: "fit" or "separate_pass"
+        self.estimator_timing = None
+        self.metadata = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block and record it under `name`."""
+        if not self.enabled:
+            yield
+            return
+        rss_before = peak_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            rss_after = peak_rss_mb()
+            self.phases.append({
+                "phase": name,
+                "wall_time_s": round(wall, 6),
+                "cpu_time_s": round(cpu, 6),
+                # cpu/wall > 1 means the phase used more than one core
+                "cpu_utilization": round(cpu / wall, 3) if wall > 0 else None,
+                "peak_rss_mb": round(rss_after, 2),
+                "peak_rss_growth_mb": round(rss_after - rss_before, 2),
+            })
+
+    def add_metadata(self, **kwargs):
+        if self.enabled:
+            self.metadata.update(kwargs)
+
+    def fit(self, model, X, y):
+        """
+        Fit `model` with the same single `fit` call as when disabled, timed as
+        the "fit" phase, and record per-estimator fit times for ensembles.
+        Boosting reports them from inside that fit. A forest builds its trees
+        in parallel with no per-tree hook, so they come from a separate
+        "per_tree_timing" phase instead.
+        """
+        if not self.enabled:
+            return model.fit(X, y)
+        with self.phase("fit"):
+            if isinstance(model, xgb.XGBRegressor):
+                self._fit_xgboost(model, X, y)
+            elif isinstance(model, GradientBoostingRegressor):
+                self._fit_boosting(model, X, y)
+            else:
+                model.fit(X, y)
+        if isinstance(model, RandomForestRegressor):
+            with self.phase("per_tree_timing"):
+                self._time_forest_trees(model, X, y)
+        return model
+
+    def _fit_boosting(self, model, X, y):
+        # GradientBoosting calls `monitor` after every stage
+        last = [time.perf_counter()]
+
+        def monitor(i, estimator, local_vars):
+            now = time.perf_counter()
+            self.estimator_fit_times.append(now - last[0])
+            last[0] = now
+            return False
+
+        model.fit(X, y, monitor=monitor)
+        self.estimator_timing = "fit"
+
+    def _time_forest_trees(self, model, X, y):
+        # Grow an unfitted, single-threaded copy one tree at a time with
+        # warm_start. Each call also repeats fit()'s input validation, so the
+        # per-tree times add up to a little more than one core's share of the
+        # real fit; the trained model is left alone.
+        timing_model = clone(model).set_params(n_jobs=1, warm_start=True)
+        for n in range(1, model.n_estimators + 1):
+            start = time.perf_counter()
+            timing_model.set_params(n_estimators=n)
+            timing_model.fit(X, y)
+            self.estimator_fit_times.append(time.perf_counter() - start)
+        self.estimator_timing = "separate_pass"
+
+    def _fit_xgboost(self, model, X, y):
+        profiler = self
+
+        class _IterationTimer(xgb.callback.TrainingCallback):
+            def before_iteration(self, booster, epoch, evals_log):
+                self._start = time.perf_counter()
+                return False
+
+            def after_iteration(self, booster, epoch, evals_log):
+                profiler.estimator_fit_times.append(time.perf_counter() - self._start)
+                return False
+
+        callbacks = model.get_params().get("callbacks")
+        model.set_params(callbacks=[_IterationTimer()])
+        try:
+            model.fit(X, y)
+        finally:
+            # Don't leave the callback on the model, it would end up in the pickle
+            model.set_params(callbacks=callbacks)
+        self.estimator_timing = "fit"
+
+    def report(self):
+        """Return the profile as a JSON-serializable dict."""
+        report = {
+            "metadata": {
+                "python_version": platform.python_version(),
+                "platform": platform.platform(),
+                **self.metadata,
+            },
+            "total_wall_time_s": round(time.perf_counter() - self._started, 6),
+            "peak_rss_mb": round(peak_rss_mb(), 2),
+            "phases": self.phases,
+        }
+        if self.estimator_fit_times:
+            times = sorted(self.estimator_fit_times)
+            report["estimators"] = {
+                "timing": self.estimator_timing,
+                "count": len(times),
+                "total_s": round(sum(times), 6),
+                "mean_s": round(sum(times) / len(times), 6),
+                "min_s": round(times[0], 6),
+                "median_s": round(times[len(times) // 2], 6),
+                "max_s": round(times[-1], 6),
+                "fit_times_s": [round(t, 6) for t in self.estimator_fit_times],
+            }
+        return report
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
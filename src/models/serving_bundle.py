@@ -0,0 +1,246 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.compose import ColumnTransformer
+from sklearn.dummy import DummyRegressor
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LinearRegression
+from sklearn.preprocessing import OneHotEncoder
+
+# The bundle reader ships with the API; import it from there so both sides share one format
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from bundle import BUNDLE_FORMAT_VERSION, ServingBundle, bundle_checksum  # noqa: E402
+
+# How the serving path derives model inputs from request fields (mirrors
+# create_features in src/features/engineer.py). price_per_sqft needs the
+# target, so it is looked up in the price index when one is exported with the
+# bundle and filled with 0 otherwise.
+SERVING_DERIVED_FEATURES = [
+    {"name": "house_age", "op": "years_since", "args": ["year_built"]},
+    {"name": "bed_bath_ratio", "op": "ratio", "args": ["bedrooms", "bathrooms"]},
+    {"name": "price_per_sqft", "op": "constant", "args": [], "value": 0.0},
+]
+PRICE_INDEX_FEATURE = {"name": "price_per_sqft", "op": "lookup", "args": ["location", "condition"],
+                       "index": "price_per_sqft"}
+
+def derived_features(price_index=None):
+    """SERVING_DERIVED_FEATURES, with price_per_sqft looked up when there is an index."""
+    if price_index is None:
+        return SERVING_DERIVED_FEATURES
+    return [PRICE_INDEX_FEATURE if spec["name"] == PRICE_INDEX_FEATURE["name"] else spec
+            for spec in SERVING_DERIVED_FEATURES]
+
+# -----------------------------
+# Preprocessor
+# -----------------------------
+def _last_step(transformer):
+    return transformer.steps[-1][1] if hasattr(transformer, "steps") else transformer
+
+def compile_preprocessor(preprocessor):
+    """Extract imputer means and one-hot vocabularies from the fitted ColumnTransformer."""
+    if not isinstance(preprocessor, ColumnTransformer):
+        raise ValueError(f"Unsupported preprocessor: {type(preprocessor).__name__}")
+
+    numerical_features, num_fill = [], []
+    categorical_features, vocabularies = [], []
+    for name, transformer, columns in preprocessor.transformers_:
+        if transformer == "drop" or name == "remainder":
+            continue
+        step = _last_step(transformer)
+        if isinstance(step, SimpleImputer) and step.strategy in ("mean", "median", "constant"):
+            # The bundle lays out numerical columns first, as the ColumnTransformer does here
+            if categorical_features:
+                raise ValueError("Numerical transformers must come before categorical ones")
+            if len(step.statistics_) != len(columns):
+                raise ValueError(f"Imputer in '{name}' dropped all-empty columns; cannot compile")
+            numerical_features.extend(columns)
+            num_fill.extend(step.statistics_.astype(np.float64))
+        elif isinstance(step, OneHotEncoder) and step.drop_idx_ is None and step.handle_unknown == "ignore":
+            categorical_features.extend(columns)
+            vocabularies.extend(np.asarray(categories).astype(str) for categories in step.categories_)
+        else:
+            raise ValueError(f"Unsupported transformer '{name}': {type(step).__name__}")
+
+    offsets = np.cumsum([0] + [len(v) for v in vocabularies]).astype(np.int64)
+    arrays = {
+        "num_fill": np.asarray(num_fill, dtype=np.float64),
+        "cat_vocab": np.concatenate(vocabularies) if vocabularies else np.array([], dtype=str),
+        "cat_offsets": offsets,
+    }
+    metadata = {
+        "numerical_features": numerical_features,
+        "categorical_features": categorical_features,
+        "n_features": len(numerical_features) + int(offsets[-1]),
+    }
+    return arrays, metadata
+
+# -----------------------------
+# Models
+# -----------------------------
+def _flatten_trees(trees):
+    """Concatenate per-tree node arrays into one node table with global child indices."""
+    left, right, feature, threshold, value, default_left, roots = [], [], [], [], [], [], []
+    offset, max_depth = 0, 0
+    for t in trees:
+        is_leaf = t["left"] < 0
+        roots.append(offset)
+        left.append(np.where(is_leaf, -1, t["left"] + offset))
+        right.append(np.where(is_leaf, -1, t["right"] + offset))
+        # Leaves carry a dummy feature index so gathers stay in bounds
+        feature.append(np.where(is_leaf, 0, t["feature"]))
+        threshold.append(t["threshold"])
+        value.append(t["value"])
+        default_left.append(t["default_left"])
+        offset += len(t["left"])
+        max_depth = max(max_depth, t["max_depth"])
+    return {
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "value": np.concatenate(value),
+        "default_left": np.concatenate(default_left).astype(bool),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }, max_depth
+
+def _sklearn_tree(tree, scale=1.0):
+    t = tree.tree_
+    return {
+        "left": t.children_left,
+        "right": t.children_right,
+        "feature": t.feature,
+        "threshold": t.threshold,
+        "value": (t.value[:, 0, 0] * scale).astype(np.float64),
+        "default_left": t.missing_go_to_left.astype(bool),
+        "max_depth": t.max_depth,
+    }
+
+def _xgboost_trees(model):
+    learner = json.loads(model.get_booster().save_raw(raw_format="json"))["learner"]
+    if learner["gradient_booster"]["name"] != "gbtree":
+        raise ValueError(f"Unsupported XGBoost booster: {learner['gradient_booster']['name']}")
+    trees = []
+    for tree in learner["gradient_booster"]["model"]["trees"]:
+        left = np.asarray(tree["left_children"])
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+        # Depth via parent pointers; the node table is in breadth-first order
+        depth = np.zeros(len(left), dtype=np.int64)
+        for node, parent in enumerate(tree["parents"]):
+            if node > 0:
+                depth[node] = depth[parent] + 1
+        trees.append({
+            "left": left,
+            "right": np.asarray(tree["right_children"]),
+            "feature": np.asarray(tree["split_indices"]),
+            "threshold": conditions.astype(np.float64),
+            # Leaf values live in split_conditions and already include the learning rate
+            "value": conditions,
+            "default_left": np.asarray(tree["default_left"], dtype=bool),
+            "max_depth": int(depth.max()),
+        })
+    return trees, float(learner["learner_model_param"]["base_score"])
+
+def compile_model(model, sparse_input=False):
+    """
+    Flatten a fitted model into arrays plus the metadata needed to evaluate them.
+    `sparse_input` says the model was trained on a scipy sparse matrix.
+    """
+    if isinstance(model, LinearRegression):
+        return {"coef": np.asarray(model.coef_, dtype=np.float64)}, {
+            "model_kind": "linear",
+            "intercept": float(model.intercept_),
+        }
+    if isinstance(model, RandomForestRegressor):
+        arrays, max_depth = _flatten_trees([_sklearn_tree(e) for e in model.estimators_])
+        return arrays, {"model_kind": "trees", "aggregation": "mean", "split_rule": "le",
+                        "max_depth": max_depth, "base_score": 0.0}
+    if isinstance(model, GradientBoostingRegressor):
+        if model.init_ == "zero":
+            base_score = 0.0
+        elif isinstance(model.init_, DummyRegressor):
+            base_score = float(np.ravel(model.init_.constant_)[0])
+        else:
+            raise ValueError(f"Unsupported GradientBoosting init: {type(model.init_).__name__}")
+        trees = [_sklearn_tree(stage[0], scale=model.learning_rate) for stage in model.estimators_]
+        arrays, max_depth = _flatten_trees(trees)
+        return arrays, {"model_kind": "trees", "aggregation": "sum", "split_rule": "le",
+                        "max_depth": max_depth, "base_score": base_score}
+    if isinstance(model, xgb.XGBRegressor):
+        trees, base_score = _xgboost_trees(model)
+        arrays, max_depth = _flatten_trees(trees)
+        # XGBoost reads entries absent from a sparse matrix as missing, not 0
+        return arrays, {"model_kind": "trees", "aggregation": "sum", "split_rule": "lt",
+                        "max_depth": max_depth, "base_score": base_score,
+                        "zero_as_missing": bool(sparse_input)}
+    raise ValueError(f"Unsupported model for serving bundle: {type(model).__name__}")
+
+# -----------------------------
+# Export
+# -----------------------------
+def _verification_frame(bundle):
+    """Raw rows covering every category, an unknown category and missing numerics."""
+    rng = np.random.default_rng(0)
+    n_rows = max([len(v) for v in bundle.vocabularies] + [8]) + 2
+    frame = {}
+    for j, name in enumerate(bundle.numerical_features):
+        column = bundle.num_fill[j] * rng.uniform(0.5, 1.5, n_rows)
+        column[0] = np.nan
+        frame[name] = column
+    for name, vocab in zip(bundle.categorical_features, bundle.vocabularies):
+        frame[name] = np.array([vocab[i % len(vocab)] for i in range(n_rows - 1)] + ["__unknown__"], dtype=object)
+    return frame
+
+def export_serving_bundle(model, preprocessor, path, X_check=None, model_version=None, extra_metadata=None,
+                          price_index=None, sparse_input=False):
+    """
+    Compile `preprocessor` and `model` into a checksummed .npz bundle at `path`.
+    A PriceIndex, if given, is embedded for the price_per_sqft lookup.
+    `sparse_input` says the model was trained on a scipy sparse matrix.
+
+    The bundle is reloaded and checked against the originals: the preprocessor
+    on synthetic raw rows, and the model on `X_check` (preprocessed features).
+    """
+    pre_arrays, pre_meta = compile_preprocessor(preprocessor)
+    model_arrays, model_meta = compile_model(model, sparse_input)
+    metadata = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "model_version": model_version or time.strftime("%Y%m%d%H%M%S"),
+        "model_class": type(model).__name__,
+        "derived_features": derived_features(price_index),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **pre_meta,
+        **model_meta,
+        **(extra_metadata or {}),
+    }
+    arrays = {
+        **pre_arrays,
+        **model_arrays,
+        **(price_index.to_arrays(PRICE_INDEX_FEATURE["index"]) if price_index is not None else {}),
+        "metadata": np.frombuffer(json.dumps(metadata).encode(), dtype=np.uint8),
+    }
+    arrays["checksum"] = np.frombuffer(bundle_checksum(arrays).encode(), dtype=np.uint8)
+
+    # np.savez appends .npz when missing, so write to a name that already has it
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+    bundle = ServingBundle.load(path)
+    raw = _verification_frame(bundle)
+    expected = preprocessor.transform(pd.DataFrame(raw))
+    expected = expected.toarray() if hasattr(expected, "toarray") else np.asarray(expected)
+    if not np.allclose(bundle.transform(raw), expected):
+        raise ValueError("Serving bundle preprocessing does not match the fitted preprocessor")
+    if X_check is not None:
+        if not hasattr(X_check, "toarray"):
+            X_check = np.asarray(X_check, dtype=np.float64)
+        actual = bundle.predict(X_check)
+        if not np.allclose(actual, model.predict(X_check), rtol=1e-6, atol=1e-6):
+            raise ValueError("Serving bundle predictions do not match the trained model")
+    return bundle
@@ -4,16 +4,28 @@ import numpy as np
 import joblib
 import mlflow
 import mlflow.sklearn
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, r2_score
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.linear_model import LinearRegression
 import xgboost as xgb
 import yaml
 import logging
+from scipy import sparse
 from mlflow.tracking import MlflowClient
 import platform
 import sklearn
+from profiling import TrainingProfiler
+from serving_bundle import export_serving_bundle
+# serving_bundle puts src/api on sys.path
+from price_index import PriceIndex
+from dataset import load_dataset
+from holdout import holdout_split
+from out_of_core import train_out_of_core, evaluate_out_of_core
+from compression import build_tiers
+from incremental import load_base_model, base_run_metrics, rolling_split, train_incremental
+import os
+import shutil
+import time
 
 # -----------------------------
 # Configure logging
@@ -27,24 +39,58 @@ logger = logging.getLogger(__name__)
 def parse_args():
     parser = argparse.ArgumentParser(description="Train and register final model from config.")
     parser.add_argument("--config", type=str, required=True, help="Path to model_config.yaml")
-    parser.add_argument("--data", type=str, required=True, help="Path to processed CSV dataset")
+    parser.add_argument("--data", type=str, required=True,
+                        help="Path to processed dataset: sparse .npz from engineer.py, or CSV")
     parser.add_argument("--models-dir", type=str, required=True, help="Directory to save trained model")
     parser.add_argument("--mlflow-tracking-uri", type=str, default=None, help="MLflow tracking URI")
+    parser.add_argument("--preprocessor", type=str, default=None,
+                        help="Path to the fitted preprocessor (default: <models-dir>/trained/preprocessor.pkl)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-phase wall/CPU time and peak memory, logged as a JSON artifact")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="Stream the dataset (CSV, .npz or a directory of part files) in chunks "
+                             "instead of loading it into memory")
+    parser.add_argument("--chunk-size", type=int, default=100000,
+                        help="Rows per chunk with --out-of-core")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Update the latest registered model with the new rows in --data (transformed with "
+                             "engineer.py --transform-only) instead of training from scratch")
+    parser.add_argument("--base-model", type=str, default=None,
+                        help="Model to update with --incremental: a .pkl path or MLflow model URI "
+                             "(default: newest registered version)")
+    parser.add_argument("--base-data", type=str, default=None,
+                        help="Dataset the base model was trained on; with --incremental, also time a full "
+                             "retrain on it plus the new rows instead of estimating one")
+    parser.add_argument("--add-estimators", type=int, default=None,
+                        help="Trees or boosting rounds to add with --incremental (overrides the config)")
+    parser.add_argument("--retire-oldest", type=int, default=None,
+                        help="Oldest RandomForest trees to drop with --incremental (overrides the config)")
     return parser.parse_args()
 
 # -----------------------------
 # Load model from config
 # -----------------------------
+MODEL_MAP = {
+    'LinearRegression': LinearRegression,
+    'RandomForest': RandomForestRegressor,
+    'GradientBoosting': GradientBoostingRegressor,
+    'XGBoost': xgb.XGBRegressor
+}
+
+# Models that train on a scipy sparse matrix directly; others get a dense copy
+SPARSE_INPUT_MODELS = {'LinearRegression', 'RandomForest', 'GradientBoosting', 'XGBoost'}
+
 def get_model_instance(name, params):
-    model_map = {
-        'LinearRegression': LinearRegression,
-        'RandomForest': RandomForestRegressor,
-        'GradientBoosting': GradientBoostingRegressor,
-        'XGBoost': xgb.XGBRegressor
-    }
-    if name not in model_map:
+    if name not in MODEL_MAP:
         raise ValueError(f"Unsupported model: {name}")
-    return model_map[name](**params)
+    return MODEL_MAP[name](**params)
+
+def model_input(name, X):
+    """X as the model `name` should receive it: sparse if it can train on sparse, dense otherwise."""
+    if sparse.issparse(X) and name not in SPARSE_INPUT_MODELS:
+        logger.warning(f"{name} does not accept sparse input; densifying the feature matrix")
+        return X.toarray()
+    return X
 
 # -----------------------------
 # Main logic
@@ -59,94 +105,325 @@ def main(args):
         mlflow.set_tracking_uri(args.mlflow_tracking_uri)
         mlflow.set_experiment(model_cfg['name'])
 
-    # Load data
-    data = pd.read_csv(args.data)
-    target = model_cfg['target_variable']
+    profiler = TrainingProfiler(enabled=args.profile)
 
-    # Use all features except the target variable
-    X = data.drop(columns=[target])
-    y = data[target]
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    target = model_cfg['target_variable']
+    if args.incremental and args.out_of_core:
+        raise ValueError("--incremental and --out-of-core can't be combined")
+    incremental_cfg = dict(config.get('incremental') or {})
+    if args.add_estimators is not None:
+        incremental_cfg['add_estimators'] = args.add_estimators
+    if args.retire_oldest is not None:
+        incremental_cfg['retire_oldest'] = args.retire_oldest
+    if args.incremental:
+        with profiler.phase("load_base_model"):
+            base_model, base_version = load_base_model(model_cfg['name'], args.base_model)
+            base_metrics = base_run_metrics(base_version)
+        algorithm = {v: k for k, v in MODEL_MAP.items()}.get(type(base_model), type(base_model).__name__)
+    else:
+        algorithm = model_cfg['best_model']
+    profiler.add_metadata(
+        model=algorithm,
+        parameters=model_cfg['parameters'],
+        dataset=args.data,
+        out_of_core=args.out_of_core,
+        incremental=args.incremental,
+    )
+    if not args.out_of_core:
+        # Load data (features are everything except the target variable)
+        with profiler.phase("load_data"):
+            X, y, data_nbytes = load_dataset(args.data, target)
+            X = model_input(algorithm, X)
 
-    # Get model
-    model = get_model_instance(model_cfg['best_model'], model_cfg['parameters'])
+        with profiler.phase("split"):
+            if args.incremental:
+                # New rows arrive in order: hold out the newest
+                X_train, X_test, y_train, y_test = rolling_split(
+                    X, y, incremental_cfg.get('holdout_fraction', 0.2)
+                )
+            else:
+                X_train, X_test, y_train, y_test = holdout_split(X, y)
+        profiler.add_metadata(
+            n_rows=int(X.shape[0]),
+            n_features=int(X.shape[1]),
+            n_train=int(X_train.shape[0]),
+            n_test=int(X_test.shape[0]),
+            sparse_input=bool(sparse.issparse(X)),
+            dataset_memory_mb=round(data_nbytes / (1024 * 1024), 2),
+        )
 
     # Start MLflow run
-    with mlflow.start_run(run_name="final_training"):
-        logger.info(f"Training model: {model_cfg['best_model']}")
-        model.fit(X_train, y_train)
-        y_pred = model.predict(X_test)
+    with mlflow.start_run(run_name="incremental_training" if args.incremental else "final_training"):
+        logger.info(f"Training model: {algorithm}")
+        incremental_report = None
+        if args.incremental:
+            base_data = None
+            if args.base_data:
+                with profiler.phase("load_base_data"):
+                    X_base, y_base, _ = load_dataset(args.base_data, target)
+                    base_data = (model_input(algorithm, X_base), y_base)
+            with profiler.phase("fit_incremental"):
+                model, incremental_report = train_incremental(
+                    base_model, X_train, y_train, X_test, y_test, incremental_cfg, base_metrics, base_data
+                )
+            mae, r2 = incremental_report['incremental']['mae'], incremental_report['incremental']['r2']
+            X_check, sparse_input = X_test, sparse.issparse(X_train)
+            if incremental_report['full_retrain'] is not None:
+                full = incremental_report['full_retrain']
+                logger.info(f"Incremental fit took {incremental_report['fit_s']:.2f} s vs "
+                            f"{full['fit_s']:.2f} s for a full retrain ({'measured' if full['measured'] else 'estimated'}), "
+                            f"{incremental_report['speedup_vs_full']}x faster")
+        elif args.out_of_core:
+            # Stream the dataset twice: once to train, once for hold-out metrics
+            with profiler.phase("fit_out_of_core"):
+                model = train_out_of_core(
+                    model_cfg['best_model'], model_cfg['parameters'], args.data, target, args.chunk_size
+                )
+            with profiler.phase("evaluate_out_of_core"):
+                metrics, X_check, sparse_input = evaluate_out_of_core(model, args.data, target, args.chunk_size)
+            mae, r2 = metrics['mae'], metrics['r2']
+            profiler.add_metadata(chunk_size=args.chunk_size, n_test=metrics['n_test'], sparse_input=sparse_input)
+        else:
+            model = get_model_instance(model_cfg['best_model'], model_cfg['parameters'])
+            fit_start = time.perf_counter()
+            profiler.fit(model, X_train, y_train)
+            # Baseline for estimating what a full retrain costs once new rows arrive
+            fit_s = time.perf_counter() - fit_start
+            with profiler.phase("predict"):
+                y_pred = model.predict(X_test)
 
-        mae = float(mean_absolute_error(y_test, y_pred))
-        r2 = float(r2_score(y_test, y_pred))
+            mae = float(mean_absolute_error(y_test, y_pred))
+            r2 = float(r2_score(y_test, y_pred))
+            X_check, sparse_input = X_test, sparse.issparse(X_train)
 
         # Log params and metrics
-        mlflow.log_params(model_cfg['parameters'])
-        mlflow.log_metrics({'mae': mae, 'r2': r2})
+        with profiler.phase("mlflow_log_metrics"):
+            if args.incremental:
+                mlflow.log_params({
+                    'incremental': True,
+                    'base_model_version': base_version.version if base_version is not None else args.base_model,
+                    'add_estimators': incremental_report['added_estimators'],
+                    'retire_oldest': incremental_report['retired_estimators'],
+                    'n_estimators': incremental_report['estimators_after'],
+                })
+                mlflow.log_metrics({
+                    'fit_s': incremental_report['fit_s'],
+                    'base_mae': incremental_report['base']['mae'],
+                    'base_r2': incremental_report['base']['r2'],
+                    'new_train_rows': incremental_report['new_train_rows'],
+                })
+                if 'n_train' in incremental_report:
+                    mlflow.log_metric('n_train', incremental_report['n_train'])
+                if incremental_report['full_retrain'] is not None:
+                    mlflow.log_metrics({
+                        'full_fit_s': incremental_report['full_retrain']['fit_s'],
+                        'speedup_vs_full': incremental_report['speedup_vs_full'],
+                    })
+                mlflow.log_dict(incremental_report, "incremental/incremental_report.json")
+            else:
+                mlflow.log_params(model_cfg['parameters'])
+            if args.out_of_core:
+                mlflow.log_params({'out_of_core': True, 'chunk_size': args.chunk_size})
+            elif not args.incremental:
+                mlflow.log_metrics({'fit_s': fit_s, 'full_fit_s': fit_s, 'n_train': int(X_train.shape[0])})
+            mlflow.log_metrics({'mae': mae, 'r2': r2})
 
         # Log and register model
-        mlflow.sklearn.log_model(model, "tuned_model")
+        with profiler.phase("mlflow_log_model"):
+            mlflow.sklearn.log_model(model, "tuned_model")
         model_name = model_cfg['name']
         model_uri = f"runs:/{mlflow.active_run().info.run_id}/tuned_model"
 
-        logger.info("Registering model to MLflow Model Registry...")
-        client = MlflowClient()
-        try:
-            client.create_registered_model(model_name)
-        except mlflow.exceptions.RestException:
-            pass  # already exists
-
-        model_version = client.create_model_version(
-            name=model_name,
-            source=model_uri,
-            run_id=mlflow.active_run().info.run_id
-        )
+        with profiler.phase("mlflow_register_model"):
+            logger.info("Registering model to MLflow Model Registry...")
+            client = MlflowClient()
+            try:
+                client.create_registered_model(model_name)
+            except mlflow.exceptions.RestException:
+                pass  # already exists
 
-        # Transition model to "Staging"
-        client.transition_model_version_stage(
-            name=model_name,
-            version=model_version.version,
-            stage="Staging"
-        )
+            model_version = client.create_model_version(
+                name=model_name,
+                source=model_uri,
+                run_id=mlflow.active_run().info.run_id
+            )
 
-        # Add a human-readable description
-        description = (
-            f"Model for predicting house prices.\n"
-            f"Algorithm: {model_cfg['best_model']}\n"
-            f"Hyperparameters: {model_cfg['parameters']}\n"
-            f"Features used: All features in the dataset except the target variable\n"
-            f"Target variable: {target}\n"
-            f"Trained on dataset: {args.data}\n"
-            f"Model saved at: {args.models_dir}/trained/{model_name}.pkl\n"
-            f"Performance metrics:\n"
-            f"  - MAE: {mae:.2f}\n"
-            f"  - R²: {r2:.4f}"
-        )
-        client.update_registered_model(name=model_name, description=description)
-
-        # Add tags for better organization
-        client.set_registered_model_tag(model_name, "algorithm", model_cfg['best_model'])
-        client.set_registered_model_tag(model_name, "hyperparameters", str(model_cfg['parameters']))
-        client.set_registered_model_tag(model_name, "features", "All features except target variable")
-        client.set_registered_model_tag(model_name, "target_variable", target)
-        client.set_registered_model_tag(model_name, "training_dataset", args.data)
-        client.set_registered_model_tag(model_name, "model_path", f"{args.models_dir}/trained/{model_name}.pkl")
-
-        # Add dependency tags
-        deps = {
-            "python_version": platform.python_version(),
-            "scikit_learn_version": sklearn.__version__,
-            "xgboost_version": xgb.__version__,
-            "pandas_version": pd.__version__,
-            "numpy_version": np.__version__,
-        }
-        for k, v in deps.items():
-            client.set_registered_model_tag(model_name, k, v)
+            # Transition model to "Staging"
+            client.transition_model_version_stage(
+                name=model_name,
+                version=model_version.version,
+                stage="Staging"
+            )
+
+            if args.incremental:
+                # Lineage of the update on the version itself
+                tags = {
+                    "training_mode": "incremental",
+                    "parent_model_version": base_version.version if base_version is not None else args.base_model,
+                    "new_train_rows": incremental_report['new_train_rows'],
+                    "added_estimators": incremental_report['added_estimators'],
+                    "retired_estimators": incremental_report['retired_estimators'],
+                    "fit_s": incremental_report['fit_s'],
+                }
+                if incremental_report['full_retrain'] is not None:
+                    tags["speedup_vs_full"] = incremental_report['speedup_vs_full']
+                for k, v in tags.items():
+                    client.set_model_version_tag(model_name, model_version.version, k, str(v))
+
+            # Add a human-readable description
+            hyperparameters = model.get_params() if args.incremental else model_cfg['parameters']
+            description = (
+                f"Model for predicting house prices.\n"
+                f"Algorithm: {algorithm}\n"
+                f"Hyperparameters: {hyperparameters}\n"
+                f"Features used: All features in the dataset except the target variable\n"
+                f"Target variable: {target}\n"
+                f"Trained on dataset: {args.data}\n"
+                f"Model saved at: {args.models_dir}/trained/{model_name}.pkl\n"
+                f"Performance metrics:\n"
+                f"  - MAE: {mae:.2f}\n"
+                f"  - R²: {r2:.4f}"
+            )
+            if args.incremental:
+                description += (
+                    f"\nIncrementally updated from version {tags['parent_model_version']} "
+                    f"with {incremental_report['new_train_rows']} new rows"
+                )
+            client.update_registered_model(name=model_name, description=description)
+
+            # Add tags for better organization
+            client.set_registered_model_tag(model_name, "algorithm", algorithm)
+            client.set_registered_model_tag(model_name, "hyperparameters", str(hyperparameters))
+            client.set_registered_model_tag(model_name, "features", "All features except target variable")
+            client.set_registered_model_tag(model_name, "target_variable", target)
+            client.set_registered_model_tag(model_name, "training_dataset", args.data)
+            client.set_registered_model_tag(model_name, "model_path", f"{args.models_dir}/trained/{model_name}.pkl")
+
+            # Add dependency tags
+            deps = {
+                "python_version": platform.python_version(),
+                "scikit_learn_version": sklearn.__version__,
+                "xgboost_version": xgb.__version__,
+                "pandas_version": pd.__version__,
+                "numpy_version": np.__version__,
+            }
+            for k, v in deps.items():
+                client.set_registered_model_tag(model_name, k, v)
 
         # Save model locally
         save_path = f"{args.models_dir}/trained/{model_name}.pkl"
-        joblib.dump(model, save_path)
+        with profiler.phase("save_model"):
+            joblib.dump(model, save_path)
         logger.info(f"Saved trained model to: {save_path}")
+
+        # Export a self-contained serving bundle (numpy arrays only, no pickles)
+        bundle = None
+        preprocessor_path = args.preprocessor or f"{args.models_dir}/trained/preprocessor.pkl"
+        if os.path.exists(preprocessor_path):
+            # Files written by feature engineering next to the preprocessor
+            price_index_path = os.path.join(os.path.dirname(preprocessor_path), "price_index.json")
+            price_index = PriceIndex.from_file(price_index_path) if os.path.exists(price_index_path) else None
+            if price_index is None:
+                logger.warning(f"No price index at {price_index_path}; serving will use price_per_sqft = 0")
+
+            preprocessor = joblib.load(preprocessor_path)
+            bundle_path = f"{args.models_dir}/trained/{model_name}.npz"
+            with profiler.phase("export_bundle"):
+                bundle = export_serving_bundle(
+                    model,
+                    preprocessor,
+                    bundle_path,
+                    X_check=X_check,
+                    model_version=f"{model_version.version}-{mlflow.active_run().info.run_id[:8]}",
+                    price_index=price_index,
+                    sparse_input=sparse_input,
+                )
+                mlflow.log_artifact(bundle_path, "serving_bundle")
+            logger.info(f"Exported serving bundle {bundle.version} to: {bundle_path}")
+
+            # Ship the drift reference and price index with the model for the pickle-based API path
+            for filename in ("drift_reference.json", "price_index.json"):
+                source_path = os.path.join(os.path.dirname(preprocessor_path), filename)
+                trained_path = f"{args.models_dir}/trained/{filename}"
+                if os.path.exists(source_path) and os.path.abspath(source_path) != os.path.abspath(trained_path):
+                    shutil.copyfile(source_path, trained_path)
+                    logger.info(f"Copied {filename} to: {trained_path}")
+        else:
+            logger.warning(f"Preprocessor not found at {preprocessor_path}; skipping serving bundle export")
+
+        # Smaller, faster tiers of the model for latency-sensitive serving
+        compression_cfg = config.get('compression') or {}
+        if compression_cfg.get('enabled'):
+            if args.out_of_core or bundle is None:
+                logger.info("Skipping compression: it needs the in-memory hold-out set and a serving bundle")
+            elif args.incremental:
+                # X_train and the hold-out hold only the new rows, too few and too
+                # narrow to distill from or choose trees on
+                logger.info("Skipping compression for an incremental update; run a full retrain to rebuild the tiers")
+            else:
+                with profiler.phase("compression"):
+                    def export_tier(tier, tier_model):
+                        tier_path = f"{args.models_dir}/trained/{model_name}_{tier}.npz"
+                        joblib.dump(tier_model, f"{args.models_dir}/trained/{model_name}_{tier}.pkl")
+                        tier_bundle = export_serving_bundle(
+                            tier_model,
+                            preprocessor,
+                            tier_path,
+                            X_check=X_check,
+                            model_version=f"{model_version.version}-{tier}-{mlflow.active_run().info.run_id[:8]}",
+                            extra_metadata={"tier": tier, "parent_model_version": str(model_version.version)},
+                            price_index=price_index,
+                            sparse_input=sparse_input,
+                        )
+                        mlflow.log_artifact(tier_path, f"compressed/{tier}")
+                        logger.info(f"Exported {tier} tier bundle to: {tier_path}")
+                        return tier_bundle
+
+                    tier_models, compression_report = build_tiers(
+                        model, bundle, X_train, X_test, y_test, compression_cfg, export_tier
+                    )
+                    for tier, tier_model in tier_models.items():
+                        stats = compression_report['tiers'][tier]
+                        mlflow.log_metrics({
+                            f"{tier}_mae": stats['mae'],
+                            f"{tier}_r2": stats['r2'],
+                            f"{tier}_p50_ms": stats['single_row']['p50_ms'],
+                            f"{tier}_p95_ms": stats['single_row']['p95_ms'],
+                        })
+                        mlflow.sklearn.log_model(tier_model, f"compressed_{tier}")
+
+                        # Register each tier as its own model so it can be promoted independently
+                        tier_name = f"{model_name}_{tier}"
+                        try:
+                            client.create_registered_model(tier_name)
+                        except mlflow.exceptions.RestException:
+                            pass  # already exists
+                        tier_version = client.create_model_version(
+                            name=tier_name,
+                            source=f"runs:/{mlflow.active_run().info.run_id}/compressed_{tier}",
+                            run_id=mlflow.active_run().info.run_id
+                        )
+                        client.transition_model_version_stage(name=tier_name, version=tier_version.version, stage="Staging")
+                        tags = {
+                            "tier": tier,
+                            "parent_model": model_name,
+                            "parent_model_version": model_version.version,
+                            "mae": f"{stats['mae']:.2f}",
+                            "r2": f"{stats['r2']:.4f}",
+                            "fidelity_r2": f"{stats['fidelity_r2']:.4f}",
+                            "single_row_p50_ms": stats['single_row']['p50_ms'],
+                            "speedup_single_row": stats['speedup_single_row'],
+                        }
+                        if 'n_trees' in stats:
+                            tags["n_trees"] = stats['n_trees']
+                        for k, v in tags.items():
+                            client.set_model_version_tag(tier_name, tier_version.version, k, str(v))
+                    mlflow.log_dict(compression_report, "compression/compression_report.json")
+                logger.info("Logged compression report to MLflow artifact compression/compression_report.json")
+
+        if profiler.enabled:
+            mlflow.log_dict(profiler.report(), "profile/training_profile.json")
+            logger.info("Logged training profile to MLflow artifact profile/training_profile.json")
         logger.info(f"Final MAE: {mae:.2f}, R²: {r2:.4f}")
 
 if __name__ == "__main__":
@@ -1,9 +1,49 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import time
 import os
 
+# Get API endpoint from environment variable or use default
+API_ENDPOINT = os.getenv("API_URL", "http://localhost:8000").rstrip("/")
+# Wait this long after an input changes before calling the API in live mode;
+# a further change within the window restarts the script and cancels the call
+LIVE_DEBOUNCE_S = 0.3
+# Square footage points for the price curve, fetched in one /batch-predict call
+CURVE_SQFT = list(range(500, 5001, 100))
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One pooled keep-alive session shared by all reruns and browser sessions."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_data(ttl=600, max_entries=2048, show_spinner=False)
+def fetch_prediction(api_endpoint: str, payload: tuple) -> dict:
+    """POST /predict; cached so revisiting an input combination costs no round trip."""
+    response = get_session().post(f"{api_endpoint}/predict", json=dict(payload), timeout=5)
+    response.raise_for_status()  # Raise exception for bad status codes
+    return response.json()
+
+
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def fetch_price_curve(api_endpoint: str, payload: tuple) -> dict:
+    """
+    Predicted price for every CURVE_SQFT value, all in a single /batch-predict call.
+    `payload` leaves out sqft, so moving the sqft slider reuses the cached curve.
+    """
+    base = dict(payload)
+    batch = [{**base, "sqft": sqft} for sqft in CURVE_SQFT]
+    response = get_session().post(f"{api_endpoint}/batch-predict", json=batch, timeout=10)
+    response.raise_for_status()
+    return {"Square Footage": CURVE_SQFT, "Predicted Price": response.json()}
+
 # Set the page configuration (must be the first Streamlit command)
 st.set_page_config(
     page_title="House Price Predictor",
@@ -29,6 +69,8 @@ col1, col2 = st.columns(2, gap="large")
 with col1:
     st.markdown('<div class="card">', unsafe_allow_html=True)
     
+    # The API precomputes predictions for every combination of these inputs;
+    # keep CUBE_AXES in src/api/prediction_cube.py in sync when changing them
     # Square Footage slider
     st.markdown(f"<p><strong>Square Footage:</strong> <span id='sqft-value'></span></p>", unsafe_allow_html=True)
     sqft = st.slider("Square Footage", 500, 5000, 1500, 50, label_visibility="collapsed", key="sqft")
@@ -53,8 +95,12 @@ with col1:
     year_built = st.slider("Year Built", 1900, 2025, 2000, 1, label_visibility="collapsed", key="year")
     st.markdown(f"<script>document.getElementById('year-value').innerText = '{year_built}';</script>", unsafe_allow_html=True)
     
+    # Live mode updates the prediction and price curve as the inputs change
+    live_mode = st.toggle("Live predictions", value=False,
+                          help="Update the prediction as you move the sliders")
+
     # Predict button
-    predict_button = st.button("Predict Price", use_container_width=True)
+    predict_button = st.button("Predict Price", use_container_width=True, disabled=live_mode)
     
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -63,35 +109,40 @@ with col2:
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown("<h2>Prediction Results</h2>", unsafe_allow_html=True)
     
-    # If button is clicked, show prediction
-    if predict_button:
+    # Prepare data for API call; a sorted tuple so it can be a cache key
+    api_data = {
+        "sqft": sqft,
+        "bedrooms": bedrooms,
+        "bathrooms": bathrooms,
+        "location": location.lower(),
+        "year_built": year_built,
+        "condition": "Good"
+    }
+    payload = tuple(sorted(api_data.items()))
+
+    if live_mode and payload != st.session_state.get("last_payload"):
+        # Debounce: if another input change arrives while we sleep, Streamlit
+        # stops this run at the next st call, before any request is sent
+        time.sleep(LIVE_DEBOUNCE_S)
+        st.caption("Updating prediction...")
+
+    # If button is clicked or live mode is on, show prediction
+    if predict_button or live_mode:
         # Show loading spinner
         with st.spinner("Calculating prediction..."):
-            # Prepare data for API call
-            api_data = {
-                "sqft": sqft,
-                "bedrooms": bedrooms,
-                "bathrooms": bathrooms,
-                "location": location.lower(),
-                "year_built": year_built,
-                "condition": "Good"
-            }
-            
             try:
-                # Get API endpoint from environment variable or use default
-                api_endpoint = os.getenv("API_URL", "http://localhost:8000")
-                predict_url = f"{api_endpoint.rstrip('/')}/predict"
-                
-                st.write(f"Connecting to API at: {predict_url}")
-                
-                # Make API call to FastAPI backend
-                response = requests.post(predict_url, json=api_data)
-                response.raise_for_status()  # Raise exception for bad status codes
-                prediction = response.json()
+                if not live_mode:
+                    st.write(f"Connecting to API at: {API_ENDPOINT}/predict")
+
+                # Make API call to FastAPI backend through the pooled session
+                start = time.perf_counter()
+                prediction = fetch_prediction(API_ENDPOINT, payload)
                 
                 # Store prediction in session state
                 st.session_state.prediction = prediction
                 st.session_state.prediction_time = time.time()
+                st.session_state.prediction_latency = time.perf_counter() - start
+                st.session_state.last_payload = payload
             except requests.exceptions.RequestException as e:
                 st.error(f"Error connecting to API: {e}")
                 st.warning("Using mock data for demonstration purposes. Please check your API connection.")
@@ -107,6 +158,7 @@ with col2:
                     "prediction_time": "0.12 seconds"
                 }
                 st.session_state.prediction_time = time.time()
+                st.session_state.prediction_latency = None
     
     # Display prediction if available
     if "prediction" in st.session_state:
@@ -143,8 +195,20 @@ with col2:
         with col_d:
             st.markdown('<div class="info-card">', unsafe_allow_html=True)
             st.markdown('<p class="info-label">Prediction Time</p>', unsafe_allow_html=True)
-            st.markdown('<p class="info-value">0.12 seconds</p>', unsafe_allow_html=True)
+            latency = st.session_state.get("prediction_latency")
+            latency_text = "n/a" if latency is None else f"{latency:.3f} seconds"
+            st.markdown(f'<p class="info-value">{latency_text}</p>', unsafe_allow_html=True)
             st.markdown('</div>', unsafe_allow_html=True)
+
+        # Price versus square footage for the other inputs, in live mode
+        if live_mode:
+            try:
+                st.markdown("<p><strong>Price vs. Square Footage</strong></p>", unsafe_allow_html=True)
+                curve_payload = tuple(item for item in payload if item[0] != "sqft")
+                st.line_chart(fetch_price_curve(API_ENDPOINT, curve_payload),
+                              x="Square Footage", y="Predicted Price")
+            except requests.exceptions.RequestException as e:
+                st.warning(f"Could not load price curve: {e}")
         
         # Top factors
         st.markdown('<div class="top-factors">', unsafe_allow_html=True)